@@ -0,0 +1,497 @@
+#!/usr/bin/python
+# Copyright 2014 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks typ's own overhead.
+
+The unit tests in typ/tests check that typ behaves correctly; this
+measures how long typ itself takes to discover, classify, dispatch and
+report on synthetic trees of trivial tests, so that regressions in typ's
+per-test overhead show up in the numbers rather than only in slower CI.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+from collections import OrderedDict
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if repo_dir not in sys.path:
+    sys.path.insert(0, repo_dir)
+
+# pylint: disable=wrong-import-position,protected-access
+from typ import json_results
+from typ.arg_parser import DEFAULT_STATUS_FORMAT
+from typ.host import Host
+from typ.pool import make_pool
+from typ.printer import Printer
+from typ.runner import Runner, TestSet, _default_classifier, _test_adder
+from typ.stats import Stats
+from typ.version import VERSION
+
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+TESTS_PER_CLASS = 10
+CLASSES_PER_MODULE = 10
+TESTS_PER_MODULE = TESTS_PER_CLASS * CLASSES_PER_MODULE
+
+HEAVY_IMPORT_MODULES = 20
+HEAVY_IMPORT_FUNCTIONS = 2000
+LARGE_OUTPUT_TESTS = 100
+LARGE_OUTPUT_BYTES = 256 * 1024
+ASYNC_TESTS = 200
+ASYNC_TEST_SECS = 0.05
+
+path_to_runner = os.path.join(repo_dir, 'typ', 'runner.py')
+
+
+def add_arguments(parser):
+    parser.add_argument('--benchmark', action='append', default=[],
+                        help=('Only run the named benchmarks (can specify '
+                              'multiple times; defaults to all of %s).' %
+                              ', '.join(name for name, _, _ in BENCHMARKS)))
+    parser.add_argument('-j', '--jobs', type=int,
+                        default=min(Host().cpu_count(), 8),
+                        help=('Number of workers to use for the pool and '
+                              'end-to-end benchmarks (defaults to '
+                              '%(default)s).'))
+    parser.add_argument('--output', metavar='FILENAME',
+                        help='Writes the results as JSON to FILENAME.')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help=('Runs each benchmark N times and keeps the '
+                              'fastest (defaults to %(default)s).'))
+    parser.add_argument('--sizes', metavar='N', type=int, action='append',
+                        default=[],
+                        help=('Numbers of trivial tests to generate (can '
+                              'specify multiple times; defaults to %s).' %
+                              DEFAULT_SIZES))
+
+
+def argv_from_args(args):
+    argv = []
+    for name in args.benchmark:
+        argv.extend(['--benchmark', name])
+    argv.extend(['--jobs', str(args.jobs)])
+    if args.output:
+        argv.extend(['--output', args.output])
+    argv.extend(['--repeat', str(args.repeat)])
+    for size in args.sizes:
+        argv.extend(['--sizes', str(size)])
+    return argv
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='bench')
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    args.sizes = args.sizes or DEFAULT_SIZES
+
+    unknown = set(args.benchmark) - set(name for name, _, _ in BENCHMARKS)
+    if unknown:
+        parser.error('unknown benchmarks: %s' % ', '.join(sorted(unknown)))
+
+    host = Host()
+    tmpdir = host.mkdtemp(prefix='typ_bench_')
+    results = []
+    try:
+        host.add_to_path(tmpdir)
+        for name, fn, scaled in BENCHMARKS:
+            if args.benchmark and name not in args.benchmark:
+                continue
+            for size in (args.sizes if scaled else [None]):
+                best = None
+                for _ in range(args.repeat):
+                    secs, count = fn(host, tmpdir, size, args.jobs)
+                    if best is None or secs < best[0]:
+                        best = (secs, count)
+                result = _result(name, size, best[0], best[1])
+                print('%-28s %8s %10.3fs %10.2fus/item' %
+                      (name, size or '', result['seconds'],
+                       result['us_per_item']))
+                sys.stdout.flush()
+                results.append(result)
+    finally:
+        host.rmtree(tmpdir)
+
+    if args.output:
+        output = OrderedDict()
+        output['typ_version'] = VERSION
+        output['python'] = platform.python_version()
+        output['platform'] = sys.platform
+        output['cpu_count'] = host.cpu_count()
+        output['jobs'] = args.jobs
+        output['results'] = results
+        host.write_text_file(args.output, json.dumps(output, indent=2) + '\n')
+    return 0
+
+
+def _result(name, size, secs, count):
+    result = OrderedDict()
+    result['benchmark'] = name
+    result['size'] = size
+    result['items'] = count
+    result['seconds'] = round(secs, 6)
+    result['us_per_item'] = round(secs * 1000000.0 / count, 3) if count else 0
+    return result
+
+
+def _trivial_tree(host, tmpdir, size):
+    package = 'trivial_%d' % size
+    path = host.join(tmpdir, package)
+    if host.exists(path):
+        return package, path
+
+    host.maybe_mkdir(path)
+    host.write_text_file(host.join(path, '__init__.py'), '')
+    num_modules = (size + TESTS_PER_MODULE - 1) // TESTS_PER_MODULE
+    remaining = size
+    for module_num in range(num_modules):
+        lines = ['import unittest', '']
+        for class_num in range(CLASSES_PER_MODULE):
+            if not remaining:
+                break
+            lines.append('class Trivial%d(unittest.TestCase):' % class_num)
+            for test_num in range(min(TESTS_PER_CLASS, remaining)):
+                lines.append('    def test_%d(self):' % test_num)
+                lines.append('        pass')
+                remaining -= 1
+            lines.append('')
+        host.write_text_file(host.join(path, 'mod%05d_test.py' % module_num),
+                             '\n'.join(lines) + '\n')
+    return package, path
+
+
+def _runner(host, package):
+    runner = Runner(host)
+    runner.args.tests = [package]
+    runner.args.quiet = True
+    runner.args.overwrite = False
+    runner.top_level_dirs = []
+    ret = runner._set_up_runner()
+    assert ret == 0
+    return runner
+
+
+def _unload(package):
+    for name in list(sys.modules):
+        if name == package or name.startswith(package + '.'):
+            del sys.modules[name]
+
+
+def bench_discovery(host, tmpdir, size, _jobs):
+    package, _ = _trivial_tree(host, tmpdir, size)
+    _unload(package)
+    orig_cwd = host.getcwd()
+    try:
+        host.chdir(tmpdir)
+        runner = _runner(host, package)
+        start = time.time()
+        ret, test_set = runner.find_tests(runner.args)
+        secs = time.time() - start
+    finally:
+        host.chdir(orig_cwd)
+    assert ret == 0 and len(test_set.parallel_tests) == size
+    return secs, size
+
+
+def bench_classification(host, tmpdir, size, _jobs):
+    package, path = _trivial_tree(host, tmpdir, size)
+    runner = _runner(host, package)
+    suite = runner.loader.discover(path, '*_test.py', tmpdir)
+    test_set = TestSet()
+    add_tests = _test_adder(test_set, _default_classifier(runner.args))
+    start = time.time()
+    add_tests(suite)
+    secs = time.time() - start
+    assert len(test_set.parallel_tests) == size
+    return secs, size
+
+
+def _pre(_host, _worker_num, context):
+    return context
+
+
+def _post(_context):
+    return None
+
+
+def _echo(_context, msg):
+    return msg
+
+
+def _dispatch(host, size, jobs, pool_type='queue'):
+    pool = make_pool(host, jobs, _echo, None, _pre, _post,
+                     pool_type=pool_type)
+    try:
+        start = time.time()
+        sent = received = 0
+        while received < size:
+            while sent < size and sent - received < jobs:
+                pool.send(sent)
+                sent += 1
+            pool.get()
+            received += 1
+        secs = time.time() - start
+        pool.close()
+    finally:
+        pool.join()
+    return secs, size
+
+
+def bench_dispatch_process_pool(host, _tmpdir, size, jobs):
+    return _dispatch(host, size, max(jobs, 2))
+
+
+def bench_dispatch_pipe_pool(host, _tmpdir, size, jobs):
+    return _dispatch(host, size, max(jobs, 2), 'pipe')
+
+
+def bench_dispatch_thread_pool(host, _tmpdir, size, jobs):
+    return _dispatch(host, size, max(jobs, 2), 'thread')
+
+
+def bench_dispatch_async_pool(host, _tmpdir, size, _jobs):
+    return _dispatch(host, size, 1)
+
+
+def bench_pool_startup(host, _tmpdir, _size, jobs, pool_type='queue'):
+    jobs = max(jobs, 2)
+    start = time.time()
+    pool = make_pool(host, jobs, _echo, None, _pre, _post,
+                     pool_type=pool_type)
+    pool.close()
+    pool.join()
+    return time.time() - start, jobs
+
+
+def bench_pipe_pool_startup(host, tmpdir, size, jobs):
+    return bench_pool_startup(host, tmpdir, size, jobs, 'pipe')
+
+
+def bench_status_updates(_host, _tmpdir, size, jobs):
+    printer = Printer(lambda msg, end='\n': None, True, 80)
+    return _status_updates(printer, size, jobs)
+
+
+def bench_throttled_status_updates(_host, _tmpdir, size, jobs):
+    printer = Printer(lambda msg, end='\n': None, True, 80,
+                      min_interval=0.05, time_fn=time.time)
+    return _status_updates(printer, size, jobs)
+
+
+def _status_updates(printer, size, jobs):
+    stats = Stats(DEFAULT_STATUS_FORMAT, time.time, jobs)
+    stats.total = size
+    name = 'trivial.mod00000_test.Trivial0.test_0'
+    start = time.time()
+    for _ in range(size):
+        stats.started += 1
+        printer.update(stats.format() + name)
+        stats.finished += 1
+        stats.add_time()
+        printer.update(stats.format() + name + ' passed')
+    printer.flush()
+    return time.time() - start, size
+
+
+def bench_print(_host, tmpdir, size, _jobs):
+    return _print_lines(tmpdir, size, buffered=False)
+
+
+def bench_buffered_print(_host, tmpdir, size, _jobs):
+    return _print_lines(tmpdir, size, buffered=True)
+
+
+def _print_lines(tmpdir, size, buffered):
+    # Print through a fresh Host so its buffering state doesn't leak out.
+    host = Host()
+    path = host.join(tmpdir, 'print_%d.log' % size)
+    line = '[1/1] trivial.mod00000_test.Trivial0.test_0 passed'
+    with open(path, 'w') as stream:
+        host.stdout = stream
+        if buffered:
+            host.buffer_output()
+        start = time.time()
+        for _ in range(size):
+            host.print_(line)
+        host.unbuffer_output()
+        secs = time.time() - start
+    host.remove(path)
+    return secs, size
+
+
+def _result_set(size):
+    result_set = json_results.ResultSet()
+    for i in range(size):
+        result_set.add(json_results.Result(
+            'trivial.mod%05d_test.Trivial%d.test_%d' %
+            (i // TESTS_PER_MODULE, (i // TESTS_PER_CLASS) % CLASSES_PER_MODULE,
+             i % TESTS_PER_CLASS),
+            json_results.ResultType.Pass, float(i), 0.001, 1 + i % 8))
+    return result_set
+
+
+def bench_full_results(_host, _tmpdir, size, _jobs):
+    result_set = _result_set(size)
+    names = [r.name for r in result_set.results]
+    start = time.time()
+    json_results.make_full_results([], 0, names, result_set)
+    return time.time() - start, size
+
+
+def bench_trace(host, _tmpdir, size, _jobs):
+    result_set = _result_set(size)
+    runner = Runner(host)
+    runner.stats = Stats('', lambda: 0.0, 1)
+    start = time.time()
+    trace = runner._trace_from_results(result_set)
+    json.dumps(trace, indent=2)
+    return time.time() - start, size
+
+
+def _run_typ(host, tmpdir, package, jobs, extra_args=None):
+    start = time.time()
+    ret, _, err = host.call([sys.executable, path_to_runner, '-q', '-j',
+                             str(jobs), '--top-level-dir', tmpdir, package] +
+                            (extra_args or []))
+    secs = time.time() - start
+    assert ret == 0, err
+    return secs
+
+
+def bench_end_to_end(host, tmpdir, size, jobs):
+    package, _ = _trivial_tree(host, tmpdir, size)
+    return _run_typ(host, tmpdir, package, jobs), size
+
+
+def bench_heavy_imports(host, tmpdir, _size, jobs):
+    package = 'heavy_imports'
+    path = host.join(tmpdir, package)
+    if not host.exists(path):
+        host.maybe_mkdir(path)
+        host.write_text_file(host.join(path, '__init__.py'), '')
+        body = ''.join('def helper_%d(x):\n    return x + %d\n\n' % (i, i)
+                       for i in range(HEAVY_IMPORT_FUNCTIONS))
+        for module_num in range(HEAVY_IMPORT_MODULES):
+            host.write_text_file(
+                host.join(path, 'heavy%03d_test.py' % module_num),
+                'import unittest\n\n' + body +
+                'class Heavy(unittest.TestCase):\n'
+                '    def test_a(self):\n'
+                '        self.assertEqual(helper_1(1), 2)\n\n'
+                '    def test_b(self):\n'
+                '        pass\n')
+    return _run_typ(host, tmpdir, package, jobs), 2 * HEAVY_IMPORT_MODULES
+
+
+def bench_large_output(host, tmpdir, _size, jobs):
+    package = _large_output_tree(host, tmpdir)
+    return _run_typ(host, tmpdir, package, jobs), LARGE_OUTPUT_TESTS
+
+
+def bench_large_output_fd(host, tmpdir, _size, jobs):
+    package = _large_output_tree(host, tmpdir)
+    return (_run_typ(host, tmpdir, package, jobs, ['--capture', 'fd']),
+            LARGE_OUTPUT_TESTS)
+
+
+def bench_large_output_queue(host, tmpdir, _size, jobs):
+    # The same as large_output, but with the output going through the
+    # result queue instead of being spilled to shared memory.
+    package = _large_output_tree(host, tmpdir)
+    return (_run_typ(host, tmpdir, package, jobs,
+                     ['--spill-output-bytes', '0']),
+            LARGE_OUTPUT_TESTS)
+
+
+def _large_output_tree(host, tmpdir):
+    package = 'large_output'
+    path = host.join(tmpdir, package)
+    if not host.exists(path):
+        host.maybe_mkdir(path)
+        host.write_text_file(host.join(path, '__init__.py'), '')
+        lines = ['import sys', 'import unittest', '',
+                 'class LargeOutput(unittest.TestCase):']
+        for test_num in range(LARGE_OUTPUT_TESTS):
+            lines.append('    def test_%d(self):' % test_num)
+            lines.append('        sys.stdout.write("x" * %d)' %
+                         LARGE_OUTPUT_BYTES)
+        host.write_text_file(host.join(path, 'output_test.py'),
+                             '\n'.join(lines) + '\n')
+    return package
+
+
+def bench_async_tests(host, tmpdir, _size, jobs):
+    package = _async_tree(host, tmpdir)
+    return _run_typ(host, tmpdir, package, jobs), ASYNC_TESTS
+
+
+def bench_async_tests_concurrent(host, tmpdir, _size, jobs):
+    package = _async_tree(host, tmpdir)
+    return (_run_typ(host, tmpdir, package, jobs,
+                     ['--async-concurrency', '50']),
+            ASYNC_TESTS)
+
+
+def _async_tree(host, tmpdir):
+    package = 'async_tests'
+    path = host.join(tmpdir, package)
+    if not host.exists(path):
+        host.maybe_mkdir(path)
+        host.write_text_file(host.join(path, '__init__.py'), '')
+        lines = ['import asyncio', 'import unittest', '',
+                 'class AsyncTest(unittest.IsolatedAsyncioTestCase):']
+        for test_num in range(ASYNC_TESTS):
+            lines.append('    async def test_%d(self):' % test_num)
+            lines.append('        await asyncio.sleep(%s)' % ASYNC_TEST_SECS)
+        host.write_text_file(host.join(path, 'async_test.py'),
+                             '\n'.join(lines) + '\n')
+    return package
+
+
+# (name, function, whether the benchmark runs once per --sizes value)
+BENCHMARKS = [
+    ('discovery', bench_discovery, True),
+    ('classification', bench_classification, True),
+    ('pool_startup', bench_pool_startup, False),
+    ('pipe_pool_startup', bench_pipe_pool_startup, False),
+    ('dispatch_process_pool', bench_dispatch_process_pool, True),
+    ('dispatch_pipe_pool', bench_dispatch_pipe_pool, True),
+    ('dispatch_thread_pool', bench_dispatch_thread_pool, True),
+    ('dispatch_async_pool', bench_dispatch_async_pool, True),
+    ('status_updates', bench_status_updates, True),
+    ('throttled_status_updates', bench_throttled_status_updates, True),
+    ('print', bench_print, True),
+    ('buffered_print', bench_buffered_print, True),
+    ('full_results', bench_full_results, True),
+    ('trace', bench_trace, True),
+    ('end_to_end', bench_end_to_end, True),
+    ('heavy_imports', bench_heavy_imports, False),
+    ('large_output', bench_large_output, False),
+    ('large_output_fd', bench_large_output_fd, False),
+    ('large_output_queue', bench_large_output_queue, False),
+    ('async_tests', bench_async_tests, False),
+    ('async_tests_concurrent', bench_async_tests_concurrent, False),
+]
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+# Copyright 2014 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Runs IsolatedAsyncioTestCase tests concurrently on one event loop.
+
+IsolatedAsyncioTestCase.run() creates an event loop for each test and
+blocks until the test is done, so a worker can only run one of them at
+a time even if the test spends all of its time waiting. run_tests()
+instead runs the setUp / asyncSetUp / test / asyncTearDown / tearDown /
+cleanups sequence of each test as a task on a shared loop, and records
+what happened into a unittest.TestResult of the test's own.
+
+This module needs Python 3.8 or later; the runner only imports it when
+there are such tests to run.
+"""
+
+import asyncio
+import inspect
+import sys
+import unittest
+
+
+def run_tests(tests, concurrency, start_fn, finish_fn):
+    """Runs |tests|, at most |concurrency| at a time.
+
+    start_fn(test) is called in each test's task just before the test
+    starts, and finish_fn(test, test_result, state) just after it has
+    finished, where |state| is whatever start_fn returned. Returns the
+    values returned by finish_fn, in the order of |tests|."""
+
+    async def run_all():
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def run_one(test):
+            async with semaphore:
+                state = start_fn(test)
+                test_result = unittest.TestResult()
+                await _run_test(test, test_result)
+                return finish_fn(test, test_result, state)
+
+        return await asyncio.gather(*[run_one(test) for test in tests])
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(run_all())
+    finally:
+        try:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            loop.close()
+
+
+async def _run_test(test, result):
+    # This follows unittest.TestCase.run(), minus subtests (a failing
+    # subTest() fails the whole test) and the debug() hooks.
+    # pylint: disable=protected-access
+    method = getattr(test, test._testMethodName)
+    result.startTest(test)
+    try:
+        if (getattr(test.__class__, '__unittest_skip__', False) or
+                getattr(method, '__unittest_skip__', False)):
+            reason = (getattr(test.__class__, '__unittest_skip_why__', '') or
+                      getattr(method, '__unittest_skip_why__', ''))
+            result.addSkip(test, reason)
+            return
+
+        expecting_failure = (
+            getattr(method, '__unittest_expecting_failure__', False) or
+            getattr(test, '__unittest_expecting_failure__', False))
+        exc_info = None
+        skipped = None
+        try:
+            test.setUp()
+            await test.asyncSetUp()
+        except unittest.SkipTest as e:
+            skipped = str(e)
+        except Exception:
+            exc_info = sys.exc_info()
+        else:
+            try:
+                await _maybe_await(method())
+            except unittest.SkipTest as e:
+                skipped = str(e)
+            except Exception:
+                exc_info = sys.exc_info()
+            try:
+                await test.asyncTearDown()
+                test.tearDown()
+            except Exception:
+                exc_info = exc_info or sys.exc_info()
+
+        while test._cleanups:
+            function, args, kwargs = test._cleanups.pop()
+            try:
+                await _maybe_await(function(*args, **kwargs))
+            except Exception:
+                exc_info = exc_info or sys.exc_info()
+
+        if exc_info and expecting_failure:
+            result.addExpectedFailure(test, exc_info)
+        elif exc_info and issubclass(exc_info[0], test.failureException):
+            result.addFailure(test, exc_info)
+        elif exc_info:
+            result.addError(test, exc_info)
+        elif skipped is not None:
+            result.addSkip(test, skipped)
+        elif expecting_failure:
+            result.addUnexpectedSuccess(test)
+        else:
+            result.addSuccess(test)
+    finally:
+        result.stopTest(test)
+
+
+async def _maybe_await(value):
+    if inspect.isawaitable(value):
+        return await value
+    return value
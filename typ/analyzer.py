@@ -0,0 +1,223 @@
+# Copyright 2014 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Explains where the wall time of a run went, given a trace.
+
+The trace is the one written by --write-trace-to: the runner adds an
+event for each phase of the run ('discovery', 'parallel', 'isolated',
+'retry #N parallel', 'reporting', and so on) and an event per test
+attempt, keyed by the worker that ran it.
+"""
+
+import argparse
+import json
+
+from collections import OrderedDict
+
+from typ.host import Host
+
+
+TOP_LEVEL_EVENTS = ('run', 'discovery', 'testing', 'reporting')
+
+
+def main(argv=None, host=None):
+    host = host or Host()
+    parser = argparse.ArgumentParser(prog='typ analyze')
+    parser.add_argument('trace', metavar='FILENAME',
+                        help='Trace written by --write-trace-to.')
+    parser.add_argument('--json', action='store_true',
+                        help='Print the analysis as JSON.')
+    parser.add_argument('--top', metavar='N', type=int, default=5,
+                        help=('Number of tests to list on the critical path '
+                              'of each phase (defaults to %(default)s).'))
+    try:
+        args = parser.parse_args(argv)
+    except SystemExit as e:
+        # argparse has already printed the usage and the error; report
+        # the failure through the return code, as the runner does.
+        return e.code
+
+    if not host.exists(args.trace):
+        host.print_('Trace "%s" does not exist.' % args.trace,
+                    stream=host.stderr)
+        return 1
+    try:
+        trace = json.loads(host.read_text_file(args.trace))
+    except ValueError as e:
+        host.print_('Failed to parse trace "%s": %s' % (args.trace, e),
+                    stream=host.stderr)
+        return 1
+
+    analysis = analyze(trace)
+    if args.json:
+        host.print_(json.dumps(analysis, indent=2))
+    else:
+        host.print_(format_analysis(analysis, args.top), end='')
+    return 0
+
+
+def analyze(trace):
+    """Returns an OrderedDict describing the wall-time breakdown of a run.
+
+    All times are in seconds."""
+    top_level = {}
+    phases = []
+    tests = []
+    for event in trace['traceEvents']:
+        args = event.get('args', {})
+        if 'actual' in args:
+            tests.append(event)
+        elif 'jobs' in args:
+            phases.append(event)
+        elif event['name'] in TOP_LEVEL_EVENTS:
+            top_level[event['name']] = event
+
+    analysis = OrderedDict()
+    run = top_level.get('run')
+    if run:
+        wall = _secs(run['dur'])
+    else:
+        ends = [e['ts'] + e['dur'] for e in phases + tests]
+        wall = _secs(max(ends)) if ends else 0.0
+    analysis['wall_time'] = wall
+    analysis['discovery'] = _secs(top_level.get('discovery', {}).get('dur', 0))
+    analysis['reporting'] = _secs(top_level.get('reporting', {}).get('dur', 0))
+
+    analysis['phases'] = []
+    critical_path = []
+    for phase in sorted(phases, key=lambda e: e['ts']):
+        start = phase['ts']
+        end = start + phase['dur']
+        phase_tests = [t for t in tests if start <= t['ts'] < end]
+        analysis['phases'].append(_analyze_phase(phase, phase_tests))
+        critical_path.extend(_critical_chain(phase, phase_tests))
+
+    accounted = (analysis['discovery'] + analysis['reporting'] +
+                 sum(p['wall_time'] for p in analysis['phases']))
+    analysis['other'] = max(0.0, wall - accounted)
+
+    analysis['critical_path'] = critical_path
+
+    testing_time = sum(p['wall_time'] for p in analysis['phases'])
+    packed_time = sum(p['packed_time'] for p in analysis['phases'])
+    analysis['testing_time'] = testing_time
+    analysis['packed_testing_time'] = packed_time
+    if packed_time:
+        analysis['packing_speedup'] = testing_time / packed_time
+    else:
+        analysis['packing_speedup'] = 1.0
+    return analysis
+
+
+def _analyze_phase(phase, phase_tests):
+    jobs = phase['args']['jobs']
+    wall = _secs(phase['dur'])
+    end = phase['ts'] + phase['dur']
+    busy = _secs(sum(t['dur'] for t in phase_tests))
+    longest = _secs(max([t['dur'] for t in phase_tests] or [0]))
+
+    last_ends = {}
+    for t in phase_tests:
+        last_ends[t['tid']] = max(last_ends.get(t['tid'], 0),
+                                  t['ts'] + t['dur'])
+    if last_ends and len(last_ends) == jobs:
+        tail = _secs(end - min(last_ends.values()))
+    else:
+        # At least one worker never picked anything up, so the whole
+        # phase was tail as far as that worker was concerned.
+        tail = wall
+
+    # With perfect packing a phase can't finish faster than its longest
+    # test, nor faster than the total work spread evenly over the workers.
+    packed = max(busy / jobs if jobs else busy, longest)
+
+    result = OrderedDict()
+    result['name'] = phase['name']
+    result['jobs'] = jobs
+    result['wall_time'] = wall
+    result['num_tests'] = len(phase_tests)
+    result['busy_time'] = busy
+    result['idle_time'] = max(0.0, wall * jobs - busy)
+    result['utilization'] = busy / (wall * jobs) if wall and jobs else 0.0
+    result['straggler_tail'] = tail
+    result['longest_test'] = longest
+    result['packed_time'] = packed
+    return result
+
+
+def _critical_chain(phase, phase_tests):
+    """Returns the tests run by the worker that finished the phase last.
+
+    Each phase ends only once its last worker is done, so the chain of
+    tests run by that worker is what the phase's wall time depends on."""
+    if not phase_tests:
+        return []
+    last = max(phase_tests, key=lambda t: t['ts'] + t['dur'])
+    chain = sorted([t for t in phase_tests if t['tid'] == last['tid']],
+                   key=lambda t: t['ts'])
+    return [OrderedDict([('phase', phase['name']),
+                         ('worker', t['tid']),
+                         ('name', t['name']),
+                         ('time', _secs(t['dur']))]) for t in chain]
+
+
+def format_analysis(analysis, top=5):
+    wall = analysis['wall_time']
+
+    def pct(secs):
+        return '%5.1f%%' % (secs * 100.0 / wall) if wall else '    -'
+
+    lines = ['Wall time: %.3fs' % wall]
+    lines.append('  %-28s %9.3fs %s' % ('discovery', analysis['discovery'],
+                                        pct(analysis['discovery'])))
+    for phase in analysis['phases']:
+        label = '%s (%d job%s)' % (phase['name'], phase['jobs'],
+                                   '' if phase['jobs'] == 1 else 's')
+        lines.append('  %-28s %9.3fs %s' % (label, phase['wall_time'],
+                                            pct(phase['wall_time'])))
+        lines.append('    %d tests, busy %.3fs, worker idle %.3fs '
+                     '(%.1f%% utilization), straggler tail %.3fs' %
+                     (phase['num_tests'], phase['busy_time'],
+                      phase['idle_time'], phase['utilization'] * 100.0,
+                      phase['straggler_tail']))
+    lines.append('  %-28s %9.3fs %s' % ('reporting', analysis['reporting'],
+                                        pct(analysis['reporting'])))
+    lines.append('  %-28s %9.3fs %s' % ('other', analysis['other'],
+                                        pct(analysis['other'])))
+
+    lines.append('')
+    lines.append('Critical path:')
+    lines.append('  discovery %.3fs' % analysis['discovery'])
+    chains = OrderedDict()
+    for step in analysis['critical_path']:
+        chains.setdefault(step['phase'], []).append(step)
+    for phase_name, steps in chains.items():
+        lines.append('  %s: worker %d ran %d test%s in %.3fs' %
+                     (phase_name, steps[0]['worker'], len(steps),
+                      '' if len(steps) == 1 else 's',
+                      sum(s['time'] for s in steps)))
+        for step in sorted(steps, key=lambda s: -s['time'])[:top]:
+            lines.append('    %9.3fs %s' % (step['time'], step['name']))
+    lines.append('  reporting %.3fs' % analysis['reporting'])
+
+    lines.append('')
+    lines.append('Testing took %.3fs; with perfect packing it would take '
+                 '%.3fs (%.2fx speedup).' %
+                 (analysis['testing_time'], analysis['packed_testing_time'],
+                  analysis['packing_speedup']))
+    return '\n'.join(lines) + '\n'
+
+
+def _secs(usecs):
+    return usecs / 1000000.0
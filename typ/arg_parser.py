@@ -16,6 +16,7 @@ import argparse
 import optparse
 
 from typ.host import Host
+from typ.pool import POOL_TYPES
 
 
 class _Bailout(Exception):
@@ -25,6 +26,7 @@ class _Bailout(Exception):
 DEFAULT_COVERAGE_OMIT = ['*/typ/*', '*/site-packages/*']
 DEFAULT_STATUS_FORMAT = '[%f/%t] '
 DEFAULT_SUFFIXES = ['*_test.py', '*_unittest.py']
+RETRY_POLICIES = ('serial', 'parallel', 'immediate')
 
 
 class ArgumentParser(argparse.ArgumentParser):
@@ -54,6 +56,20 @@ class ArgumentParser(argparse.ArgumentParser):
                               help='Print the typ version and exit.')
 
         if discovery:
+            self.add_argument('--changed-since', metavar='REV',
+                              help=('Only runs the tests whose modules '
+                                    'import, directly or not, a file '
+                                    'that changed since the git revision '
+                                    'REV (including uncommitted changes).'))
+            self.add_argument('--deps-cache', metavar='FILENAME',
+                              help=('Where --changed-since caches the '
+                                    'imports it finds (defaults to '
+                                    'typ_deps.json in the .git dir).'))
+            self.add_argument('--impact-index', metavar='FILENAME',
+                              help=('Records which files each test runs '
+                                    'code from in FILENAME, and has '
+                                    '--changed-since use it to pick '
+                                    'the tests to run.'))
             self.add_argument('-f', '--file-list', metavar='FILENAME',
                               action='store',
                               help=('Takes the list of tests from the file '
@@ -64,7 +80,10 @@ class ArgumentParser(argparse.ArgumentParser):
             self.add_argument('--isolate', metavar='glob', default=[],
                               action='append',
                               help=('Globs of tests to run in isolation '
-                                    '(serially).'))
+                                    '(serially). "glob=name" instead '
+                                    'runs the matching tests in parallel '
+                                    'with everything except other tests '
+                                    'that need the resource "name".'))
             self.add_argument('--skip', metavar='glob', default=[],
                               action='append',
                               help=('Globs of test names to skip ('
@@ -102,6 +121,35 @@ class ArgumentParser(argparse.ArgumentParser):
             self.add_argument('--metadata', action='append', default=[],
                               help=('Optional key=value metadata that will '
                                     'be included in the results.'))
+            self.add_argument('--report-slowest', metavar='N', type=int,
+                              default=0,
+                              help='Lists the N slowest tests at the end.')
+            self.add_argument('--compare-timings', metavar='FILENAME',
+                              action='append', default=[],
+                              help=('Full results from earlier runs to '
+                                    'compare test times against (can '
+                                    'specify multiple times to widen the '
+                                    'baseline).'))
+            self.add_argument('--timing-regression-threshold',
+                              metavar='PERCENT', type=float, default=50.0,
+                              help=('How much slower than its baseline a '
+                                    'test must get to be reported as a '
+                                    'regression (defaults to %(default)s).'))
+            self.add_argument('--timing-regression-min-delta',
+                              metavar='SECONDS', type=float, default=0.1,
+                              help=('Ignore regressions of less than this '
+                                    'many seconds (defaults to '
+                                    '%(default)s).'))
+            self.add_argument('--fail-on-timing-regressions',
+                              action='store_true',
+                              help=('Fails the run if --compare-timings '
+                                    'finds any regressions.'))
+            self.add_argument('--timing-history', metavar='FILENAME',
+                              action='append', default=[],
+                              help=('Full results or a trace from an earlier '
+                                    'run, used to predict the time left for '
+                                    'the %%E status directive (can specify '
+                                    'multiple times).'))
             self.add_argument('--test-results-server',
                               help=('If specified, uploads the full results '
                                     'to this server.'))
@@ -123,9 +171,12 @@ class ArgumentParser(argparse.ArgumentParser):
         if running:
             self.add_argument('-d', '--debugger', action='store_true',
                               help='Runs the tests under the debugger.')
-            self.add_argument('-j', '--jobs', metavar='N', type=int,
+            self.add_argument('-j', '--jobs', metavar='N', type=_jobs,
                               default=self._host.cpu_count(),
-                              help=('Runs N jobs in parallel '
+                              help=('Runs N jobs in parallel; "auto" picks '
+                                    'N from the CPUs and memory available '
+                                    'to typ, and runs fewer tests at a '
+                                    'time while the machine is busy '
                                     '(defaults to %(default)s).'))
             self.add_argument('-l', '--list-only', action='store_true',
                               help='Lists all the test names found and exits.')
@@ -144,9 +195,110 @@ class ArgumentParser(argparse.ArgumentParser):
             self.add_argument('-v', '--verbose', action='count', default=0,
                               help=('Prints more stuff (can specify multiple '
                                     'times for more output).'))
+            self.add_argument('--async-concurrency', metavar='N', type=int,
+                              default=0,
+                              help=('Has each worker run up to N '
+                                    'IsolatedAsyncioTestCase tests at a '
+                                    'time on a shared event loop (0, the '
+                                    'default, runs them one at a time '
+                                    'like other tests, as are tests whose '
+                                    'class or module has setUpClass(), '
+                                    'setUpModule() or the like).'))
+            self.add_argument('--max-tests-per-worker', metavar='N',
+                              type=int, default=0,
+                              help=('Replaces each worker process with a '
+                                    'new one after it has run N tests '
+                                    '(0, the default, never does).'))
+            self.add_argument('--max-worker-rss', metavar='MB', type=int,
+                              default=0,
+                              help=('Replaces a worker process with a new '
+                                    'one once its resident set grows past '
+                                    'MB megabytes (0, the default, never '
+                                    'does).'))
+            self.add_argument('--pool', choices=POOL_TYPES, default='queue',
+                              help=('How tests and results are passed to '
+                                    'and from worker processes: through '
+                                    'queues shared by all of the workers, '
+                                    'or through a pipe per worker; or, '
+                                    'with "thread", runs the tests on '
+                                    'threads in the runner\'s process '
+                                    '(defaults to %(default)s).'))
             self.add_argument('--passthrough', action='store_true',
                               default=False,
                               help='Prints all output while running.')
+            self.add_argument('--capture', choices=['sys', 'fd'],
+                              default='sys',
+                              help=('How to capture the output of each '
+                                    'test: "sys" replaces sys.stdout and '
+                                    'sys.stderr, "fd" redirects file '
+                                    'descriptors 1 and 2 to temporary '
+                                    'files, which also catches output from '
+                                    'C extensions and subprocesses '
+                                    '(defaults to %(default)s).'))
+            self.add_argument('--max-output-bytes', metavar='N', type=int,
+                              default=1024 * 1024,
+                              help=('With --capture=fd, keeps only the '
+                                    'first and last N/2 bytes of the output '
+                                    'of a test in the results (0 keeps all '
+                                    'of it; defaults to %(default)s).'))
+            self.add_argument('--output-log-dir', metavar='DIR',
+                              help=('With --capture=fd, where to save the '
+                                    'full output of failing tests whose '
+                                    'output was cut short (defaults to a '
+                                    'new temporary directory).'))
+            self.add_argument('--spill-output-bytes', metavar='N',
+                              type=int, default=64 * 1024,
+                              help=('Passes output longer than N bytes '
+                                    'from worker processes to the runner '
+                                    'through a file in shared memory '
+                                    'rather than the result queue, and '
+                                    'only reads it back if it is printed '
+                                    'or saved (0 disables this; defaults '
+                                    'to %(default)s).'))
+            self.add_argument('--dashboard', action='store_true',
+                              help=('Shows what each worker is running, '
+                                    'for how long, and the overall '
+                                    'throughput on a multi-line display '
+                                    'that is redrawn in place (needs a '
+                                    'terminal).'))
+            self.add_argument('--profile', action='store_true',
+                              help=('Runs the tests under cProfile and '
+                                    'writes the combined stats from all the '
+                                    'workers to --profile-output.'))
+            self.add_argument('--profile-filter', metavar='glob',
+                              default=[], action='append',
+                              help=('Globs of test names to profile '
+                                    '(implies --profile; defaults to all '
+                                    'tests).'))
+            self.add_argument('--profile-output', metavar='FILENAME',
+                              default='typ.pstats',
+                              help=('Where to write the combined profile '
+                                    '(defaults to %(default)s).'))
+            self.add_argument('--profile-top', metavar='N', type=int,
+                              default=20,
+                              help=('Number of functions to list in the '
+                                    'profile summaries (defaults to '
+                                    '%(default)s).'))
+            self.add_argument('--sample-profile', metavar='FILENAME',
+                              help=('Periodically samples the stacks of the '
+                                    'running tests and writes them to '
+                                    'FILENAME in collapsed-stack format '
+                                    '(and to FILENAME.json in '
+                                    'd3-flame-graph format).'))
+            self.add_argument('--sample-interval', metavar='SECONDS',
+                              type=float, default=0.005,
+                              help=('CPU time between samples for '
+                                    '--sample-profile (defaults to '
+                                    '%(default)s).'))
+            self.add_argument('--track-resources', action='store_true',
+                              help=('Records the CPU time, peak RSS and '
+                                    'context switches of each test in the '
+                                    'results and the trace (not with '
+                                    '--pool=thread).'))
+            self.add_argument('--track-allocations', action='store_true',
+                              help=('Records the peak memory allocated by '
+                                    'each test using tracemalloc (implies '
+                                    '--track-resources).'))
             self.add_argument('--total-shards', default=1, type=int,
                               help=('Total number of shards being used for '
                                     'this test run. (The user of '
@@ -155,8 +307,28 @@ class ArgumentParser(argparse.ArgumentParser):
             self.add_argument('--shard-index', default=0, type=int,
                               help=('Shard index (0..total_shards-1) of this '
                                     'test run.'))
+            self.add_argument('--fail-fast', action='store_true',
+                              help=('Stops running tests after the first '
+                                    'failure (same as --max-failures 1).'))
+            self.add_argument('--max-failures', metavar='N', type=int,
+                              default=0,
+                              help=('Stops running tests after N tests '
+                                    'have failed (on their last attempt, '
+                                    'with --retry-limit), terminating the '
+                                    'ones still running; the tests left '
+                                    'are reported as not run.'))
             self.add_argument('--retry-limit', type=int, default=0,
                               help='Retries each failure up to N times.')
+            self.add_argument('--retry-policy', choices=RETRY_POLICIES,
+                              default='serial',
+                              help=('How to run retries: "serial" runs '
+                                    'them one at a time, "parallel" runs '
+                                    'them with --jobs, keeping tests that '
+                                    'were isolated isolated, and '
+                                    '"immediate" requeues each failure as '
+                                    'soon as it fails, while the other '
+                                    'tests are still running (defaults to '
+                                    '%(default)s).'))
             self.add_argument('--terminal-width', type=int,
                               default=self._host.terminal_width(),
                               help=argparse.SUPPRESS)
@@ -166,6 +338,18 @@ class ArgumentParser(argparse.ArgumentParser):
             self.add_argument('--no-overwrite', action='store_false',
                               dest='overwrite', default=None,
                               help=argparse.SUPPRESS)
+            self.add_argument('--redraw-interval', type=float, default=0.05,
+                              metavar='SECS',
+                              help=('Minimum number of seconds between '
+                                    'redraws of the status line when '
+                                    'overwriting it (defaults to '
+                                    '%(default)s; 0 disables throttling).'))
+            self.add_argument('--buffer-output', default='auto',
+                              choices=['auto', 'always', 'never'],
+                              help=('Whether to buffer what is printed to '
+                                    'stdout instead of flushing every line; '
+                                    '"auto" buffers when stdout is not a '
+                                    'terminal (defaults to %(default)s).'))
 
         if discovery or running:
             self.add_argument('-P', '--path', action='append', default=[],
@@ -220,6 +404,12 @@ class ArgumentParser(argparse.ArgumentParser):
         if not rargs.suffixes:
             rargs.suffixes = DEFAULT_SUFFIXES
 
+        if rargs.profile_filter:
+            rargs.profile = True
+
+        if rargs.track_allocations:
+            rargs.track_resources = True
+
         if not rargs.coverage_omit:
             rargs.coverage_omit = DEFAULT_COVERAGE_OMIT
 
@@ -266,10 +456,10 @@ class ArgumentParser(argparse.ArgumentParser):
                 'dest': action.dest,
                 'help': action.help,
                 'metavar': action.metavar,
-                'type': action.type,
+                'type': 'jobs' if action.type is _jobs else action.type,
                 'action': _action_str(action)
             }
-            options.append(optparse.make_option(*args, **kwargs))
+            options.append(_Option(*args, **kwargs))
         return options
 
     def argv_from_args(self, args):
@@ -340,3 +530,22 @@ def _action_str(action):
 
 def _argname_from_key(key):
     return '--' + key.replace('_', '-')
+
+
+def _jobs(value):
+    if value == 'auto':
+        return value
+    return int(value)
+
+
+def _check_jobs(option, opt, value):
+    try:
+        return _jobs(value)
+    except ValueError:
+        raise optparse.OptionValueError(
+            'option %s: invalid jobs value: %r' % (opt, value))
+
+
+class _Option(optparse.Option):
+    TYPES = optparse.Option.TYPES + ('jobs',)
+    TYPE_CHECKER = dict(optparse.Option.TYPE_CHECKER, jobs=_check_jobs)
@@ -0,0 +1,155 @@
+# Copyright 2014 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Works out how many tests the machine can run at once, for -j auto.
+
+Host.cpu_count() counts every CPU on the machine, even in a container
+that may only use a few of them. initial_jobs() also takes the CPU
+affinity of the process, cgroup CPU quotas and the memory available into
+account, and JobLimiter lowers the number of tests run at once while
+the machine is busy with other work or short of memory.
+"""
+
+import math
+
+# The memory to set aside for each job.
+JOB_MEMORY = 512 * 1024 * 1024
+
+# The time constant of the 1-minute load average, in seconds.
+LOAD_AVERAGE_PERIOD = 60.0
+
+
+def initial_jobs(host):
+    jobs = cpu_limit(host)
+    memory = available_memory(host)
+    if memory is not None:
+        jobs = min(jobs, memory // JOB_MEMORY)
+    return max(1, jobs)
+
+
+def cpu_limit(host):
+    """Returns how many CPUs this process can use."""
+    cpus = host.cpu_affinity_count()
+    quota = _cgroup_cpu_quota(host)
+    if quota:
+        cpus = min(cpus, max(1, int(-(-quota // 1))))
+    return cpus
+
+
+def available_memory(host):
+    """Returns how many bytes of memory are available, or None."""
+    available = []
+    for line in _read(host, '/proc/meminfo').splitlines():
+        if line.startswith('MemAvailable:'):
+            available.append(int(line.split()[1]) * 1024)
+    for limit_file, usage_file in (
+            # cgroup v2, then v1.
+            ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory.current'),
+            ('/sys/fs/cgroup/memory/memory.limit_in_bytes',
+             '/sys/fs/cgroup/memory/memory.usage_in_bytes')):
+        limit = _read(host, limit_file)
+        usage = _read(host, usage_file)
+        if limit.isdigit() and usage.isdigit():
+            # v1 reports "no limit" as a huge number, which is harmless.
+            available.append(max(0, int(limit) - int(usage)))
+            break
+    return min(available) if available else None
+
+
+def _cgroup_cpu_quota(host):
+    fields = _read(host, '/sys/fs/cgroup/cpu.max').split()
+    if len(fields) == 2:
+        if fields[0] == 'max':
+            return None
+        return float(fields[0]) / float(fields[1])
+    quota = _read(host, '/sys/fs/cgroup/cpu/cpu.cfs_quota_us')
+    period = _read(host, '/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+    if quota.isdigit() and period.isdigit() and int(period):
+        # An unlimited quota is -1, which isn't all digits.
+        return float(quota) / float(period)
+    return None
+
+
+def _read(host, path):
+    try:
+        if host.exists(path):
+            return host.read_text_file(path).strip()
+    except (IOError, OSError):  # pragma: untested
+        pass
+    return ''
+
+
+class JobLimiter(object):
+    """Decides how many of |max_jobs| workers should be running tests.
+
+    At most every |interval| seconds, jobs() checks the load average and
+    the memory available. Load from other processes takes CPUs away from
+    us, and tests are only added while there is JOB_MEMORY to spare for
+    each of them. When memory runs low, one fewer test runs at a time.
+
+    The load average lags behind: it is an exponentially decaying average
+    of the number of runnable processes. So the share of it that is ours
+    is worked out the same way from the number of tests we have been
+    running, rather than taken to be the number running right now, which
+    would count the tests that just finished as load from elsewhere and
+    keep the limit down long after other load has gone away.
+    """
+
+    def __init__(self, host, max_jobs, interval=1.0):
+        self.host = host
+        self.max_jobs = max_jobs
+        self.interval = interval
+        self.cpus = cpu_limit(host)
+        self._jobs = max_jobs
+        self._last_check = None
+        self._own_load = 0.0
+        self._running = 0
+        self._last_sample = None
+
+    def jobs(self, running):
+        now = self.host.time()
+        self._track_own_load(now, running)
+        if (self._last_check is None or
+                now - self._last_check >= self.interval):
+            self._last_check = now
+            self._jobs = self._compute(running)
+        return self._jobs
+
+    def refresh_delay(self):
+        """Returns when jobs() might allow more tests, if it is limiting."""
+        if self._last_check is None or self._jobs >= self.max_jobs:
+            return None
+        return max(0, self._last_check + self.interval - self.host.time())
+
+    def _track_own_load(self, now, running):
+        if self._last_sample is not None:
+            decay = math.exp(-max(0, now - self._last_sample) /
+                             LOAD_AVERAGE_PERIOD)
+            self._own_load = (self._own_load * decay +
+                              self._running * (1 - decay))
+        self._last_sample = now
+        self._running = running
+
+    def _compute(self, running):
+        jobs = self.max_jobs
+        load = self.host.getloadavg()
+        if load is not None:
+            others = max(0.0, load - self._own_load)
+            jobs = min(jobs, int(self.cpus - others + 0.5))
+        memory = available_memory(self.host)
+        if memory is not None and memory < JOB_MEMORY // 2:
+            jobs = min(jobs, running - 1)
+        elif memory is not None:
+            jobs = min(jobs, running + memory // JOB_MEMORY)
+        return max(1, jobs)
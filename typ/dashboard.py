@@ -0,0 +1,103 @@
+# Copyright 2014 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A multi-line status display showing what every worker is running."""
+
+# Moves the cursor up a line, and erases the line the cursor is on.
+CURSOR_UP = '\x1b[1A'
+ERASE_LINE = '\x1b[2K'
+
+
+class Dashboard(object):
+    """Redraws a block of status lines in place at the bottom of a TTY.
+
+    The block is erased by clear() before anything else is printed, and
+    drawn again by the next update(). Redraws are limited to one per
+    |min_interval| seconds, and while tests are running update() should
+    be called again after refresh_delay() seconds so that the elapsed
+    times keep moving even when nothing finishes."""
+
+    def __init__(self, print_, cols, time_fn, min_interval=0.05,
+                 refresh_interval=1.0, top=3):
+        self.print_ = print_
+        self.cols = cols
+        self.time_fn = time_fn
+        self.min_interval = min_interval
+        self.refresh_interval = refresh_interval
+        self.top = top
+        self.num_lines = 0
+        self._last_draw = None
+
+    def update(self, stats, running, force=False):
+        """Draws the dashboard.
+
+        |running| maps worker numbers to (test name, start time) pairs for
+        the workers that are busy."""
+        now = self.time_fn()
+        if (not force and self._last_draw is not None and
+                now - self._last_draw < self.min_interval):
+            return
+        lines = format_lines(stats, running, now, self.top)
+        if self.cols:
+            lines = [_elide(l, self.cols - 1) for l in lines]
+        self.print_(self._erase() + '\n'.join(lines), end='')
+        self.num_lines = len(lines)
+        self._last_draw = now
+
+    def refresh_delay(self):
+        if self._last_draw is None:
+            return None
+        return max(0, self._last_draw + self.refresh_interval -
+                   self.time_fn())
+
+    def clear(self):
+        if self.num_lines:
+            self.print_(self._erase(), end='')
+            self.num_lines = 0
+
+    def _erase(self):
+        if not self.num_lines:
+            return ''
+        return ('\r' + ERASE_LINE +
+                (CURSOR_UP + ERASE_LINE) * (self.num_lines - 1))
+
+
+def format_lines(stats, running, now, top=3):
+    elapsed = now - stats.started_time
+    rate = stats.finished / elapsed if elapsed > 0 else 0.0
+    lines = ['%d/%d tests finished, %d running, %.1f tests/sec, %.1fs '
+             'elapsed' % (stats.finished, stats.total,
+                          stats.started - stats.finished, rate, elapsed)]
+    for worker_num in range(1, stats.jobs + 1):
+        if worker_num in running:
+            name, started = running[worker_num]
+            lines.append('  worker %d: %7.1fs %s' %
+                         (worker_num, max(0, now - started), name))
+        else:
+            lines.append('  worker %d:  (idle)' % worker_num)
+    slowest = sorted(running.values(), key=lambda r: (r[1], r[0]))[:top]
+    if slowest and len(running) > 1:
+        lines.append('Slowest in-flight tests:')
+        for name, started in slowest:
+            lines.append('  %7.1fs %s' % (max(0, now - started), name))
+    return lines
+
+
+def _elide(line, width):
+    if len(line) <= width:
+        return line
+    half = (width - 3) // 2
+    if half <= 0:
+        return line[:width]
+    return line[:half] + '...' + line[-half:]
@@ -0,0 +1,289 @@
+# Copyright 2014 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Works out which tests can be affected by changes, for --changed-since.
+
+ImportGraph scans the import statements of every Python file under the
+top-level directories, without importing anything, and caches what it
+finds in a JSON file, so that later runs only have to parse the files
+whose modification times changed.
+
+A test is affected if its module imports, directly or indirectly, a
+module that changed. The answer errs on the side of running tests:
+modules that import things dynamically (importlib.import_module() with
+a computed name, __import__(), runpy and so on) or that can't be parsed
+are treated as importing everything, and a change to anything other
+than a Python file under the top-level directories affects every test.
+
+git reports paths with symlinks resolved, so paths are compared once
+symlinks have been resolved on both sides.
+"""
+
+import ast
+import json
+
+
+CACHE_VERSION = 1
+
+# Calls that import a module named by their first argument.
+IMPORT_CALLS = ('import_module', '__import__', 'run_module')
+
+# Calls that load code from a path or a spec, which we can't follow.
+DYNAMIC_CALLS = ('load_source', 'load_module', 'spec_from_file_location',
+                 'exec_module', 'run_path')
+
+
+class GitError(Exception):
+    pass
+
+
+def changed_files(host, rev, path):
+    """Returns the absolute paths of the files changed since |rev|.
+
+    That includes changes not committed yet and files git doesn't track
+    but doesn't ignore either. |path| can be anywhere in the checkout."""
+    root = _git(host, path, 'rev-parse', '--show-toplevel').strip()
+    names = _git(host, root, 'diff', '--name-only', rev, '--').splitlines()
+    names += _git(host, root, 'ls-files', '--others',
+                  '--exclude-standard').splitlines()
+    return sorted(set(host.join(root, name) for name in names if name))
+
+
+def default_cache_path(host, path):
+    """Returns where to cache the graph: in the checkout's .git dir."""
+    git_dir = _git(host, path, 'rev-parse', '--git-dir').strip()
+    return host.join(path, git_dir, 'typ_deps.json')
+
+
+def _git(host, path, *args):
+    ret, out, err = host.call(['git', '-C', path] + list(args))
+    if ret:
+        raise GitError('git %s failed: %s' % (' '.join(args), err.strip()))
+    return out
+
+
+class ImportGraph(object):
+    """The modules under |top_level_dirs| and what they import."""
+
+    def __init__(self, host, top_level_dirs, cache_path=None):
+        self.host = host
+        self.top_level_dirs = [host.realpath(d) for d in top_level_dirs]
+        self.cache_path = cache_path
+        self.modules = {}  # module name -> path
+        self.files = {}  # path -> {'mtime', 'imports', 'dynamic'}
+        self.reparsed = 0
+
+    def update(self):
+        """Scans the files, only parsing the ones that changed."""
+        cached = self._read_cache()
+        self.modules = {}
+        self.files = {}
+        self.reparsed = 0
+        for top in self.top_level_dirs:
+            for relpath in sorted(self.host.files_under(top)):
+                if not relpath.endswith('.py') or _hidden(relpath):
+                    continue
+                path = self.host.join(top, relpath)
+                name = _module_name(relpath)
+                if not name or name in self.modules:
+                    # The top-level dir's own __init__.py, or a module
+                    # hidden by one in an earlier top-level dir.
+                    continue
+                self.modules[name] = path
+                mtime = self.host.mtime(path)
+                info = cached.get(path)
+                if not info or info['mtime'] != mtime:
+                    imports, dynamic = _scan(self.host.read_text_file(path),
+                                             name, relpath)
+                    info = {'mtime': mtime, 'imports': imports,
+                            'dynamic': dynamic}
+                    self.reparsed += 1
+                self.files[path] = info
+        if self.cache_path and (self.reparsed or
+                                set(cached) != set(self.files)):
+            self._write_cache()
+
+    def module_for_test(self, test_name):
+        """Returns the module of the test, or None if it isn't known."""
+        parts = test_name.split('.')
+        for i in range(len(parts), 0, -1):
+            name = '.'.join(parts[:i])
+            if name in self.modules:
+                return name
+        return None
+
+    def imported_paths(self, name):
+        """Returns the paths of module |name| and of what it imports.
+
+        That is, its packages and the modules it imports directly or
+        indirectly by name; what modules import dynamically isn't known."""
+        seen = set()
+        todo = _with_parents(name)
+        while todo:
+            name = todo.pop()
+            if name in seen or name not in self.modules:
+                continue
+            seen.add(name)
+            todo.extend(self.files[self.modules[name]]['imports'])
+        return set(self.modules[name] for name in seen)
+
+    def affected_modules(self, changed_paths):
+        """Returns the modules that |changed_paths| can affect, or None.
+
+        None means every module (and so every test) may be affected."""
+        seeds = set()
+        for path in changed_paths:
+            name = self._module_for_path(self.host.realpath(path))
+            if name is None:
+                # Tests may read data files, or files outside the
+                # top-level dirs (through sys.path, say), so we can't
+                # tell what they affect.
+                return None
+            # The module may have been deleted, but its importers are
+            # still affected.
+            seeds.add(name)
+        if not seeds:
+            return set()
+
+        importers = {}
+        for name, path in self.modules.items():
+            info = self.files[path]
+            if info['dynamic']:
+                # It might import any of the changed modules.
+                seeds.add(name)
+            # Importing a module runs its packages' __init__.py too.
+            for imported in info['imports'] + _with_parents(name)[:-1]:
+                importers.setdefault(imported, set()).add(name)
+
+        affected = set()
+        todo = list(seeds)
+        while todo:
+            name = todo.pop()
+            if name in affected:
+                continue
+            affected.add(name)
+            todo.extend(importers.get(name, ()))
+        return affected
+
+    def _module_for_path(self, path):
+        if not path.endswith('.py'):
+            return None
+        for top in self.top_level_dirs:
+            prefix = top.rstrip('/\\') + '/'
+            normalized = path.replace('\\', '/')
+            if normalized.startswith(prefix.replace('\\', '/')):
+                return _module_name(normalized[len(prefix):])
+        return None
+
+    def _read_cache(self):
+        if not self.cache_path or not self.host.exists(self.cache_path):
+            return {}
+        try:
+            cache = json.loads(self.host.read_text_file(self.cache_path))
+        except ValueError:
+            return {}
+        if cache.get('version') != CACHE_VERSION:
+            return {}
+        return cache.get('files', {})
+
+    def _write_cache(self):
+        self.host.write_text_file(
+            self.cache_path,
+            json.dumps({'version': CACHE_VERSION, 'files': self.files},
+                       sort_keys=True))
+
+
+def _hidden(relpath):
+    return any(part.startswith('.')
+               for part in relpath.replace('\\', '/').split('/'))
+
+
+def _module_name(relpath):
+    parts = relpath.replace('\\', '/')[:-len('.py')].split('/')
+    if parts[-1] == '__init__':
+        parts.pop()
+    return '.'.join(parts)
+
+
+def _scan(contents, module_name, relpath):
+    """Returns (the names that |contents| may import, whether it is dynamic).
+
+    Importing a.b.c also runs a/__init__.py and a/b/__init__.py, so the
+    packages are listed as well. `from a import b` lists both a and a.b,
+    since b may be a submodule."""
+    try:
+        tree = ast.parse(contents, relpath)
+    except (SyntaxError, ValueError):
+        return [], True
+
+    package = module_name.split('.')
+    if relpath.replace('\\', '/').split('/')[-1] != '__init__.py':
+        package = package[:-1]
+
+    names = set()
+    dynamic = False
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                names.update(_with_parents(alias.name))
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                if node.level - 1 > len(package):
+                    continue
+                base = package[:len(package) - (node.level - 1)]
+                if node.module:
+                    base = base + node.module.split('.')
+                base = '.'.join(base)
+            else:
+                base = node.module
+            if not base:
+                continue
+            names.update(_with_parents(base))
+            for alias in node.names:
+                if alias.name != '*':
+                    names.add(base + '.' + alias.name)
+        elif isinstance(node, ast.Call):
+            func = _call_name(node.func)
+            if func in IMPORT_CALLS:
+                imported = node.args and _str_value(node.args[0])
+                if imported and not imported.startswith('.'):
+                    names.update(_with_parents(imported))
+                else:
+                    dynamic = True
+            elif func in DYNAMIC_CALLS:
+                dynamic = True
+    return sorted(names), dynamic
+
+
+def _with_parents(name):
+    parts = name.split('.')
+    return ['.'.join(parts[:i]) for i in range(1, len(parts) + 1)]
+
+
+def _call_name(func):
+    if isinstance(func, ast.Name):
+        return func.id
+    if isinstance(func, ast.Attribute):
+        return func.attr
+    return None
+
+
+def _str_value(node):
+    # ast.Constant in Python 3.8 and later, ast.Str before that.
+    value = getattr(node, 'value', None)
+    if value is None:
+        value = getattr(node, 's', None)
+    if type(value).__name__ in ('str', 'unicode'):
+        return value
+    return None
@@ -17,7 +17,7 @@ import io
 import logging
 import sys
 
-from typ.host import _TeedStream
+from typ.host import _ContextLocalStream, _TeedStream, cap_text
 
 
 is_python3 = bool(sys.version_info.major == 3)
@@ -54,6 +54,8 @@ class FakeHost(object):
         self.cmds = []
         self.cwd = '/tmp'
         self._orig_logging_handlers = []
+        self._fd_output = ('', '')
+        self.loadavg = None
 
     def __getstate__(self):
         d = copy.copy(self.__dict__)
@@ -102,6 +104,9 @@ class FakeHost(object):
     def cpu_count(self):
         return 1
 
+    def cpu_affinity_count(self):
+        return self.cpu_count()
+
     def dirname(self, path):
         return '/'.join(path.split('/')[:-1])
 
@@ -130,6 +135,15 @@ class FakeHost(object):
     def getpid(self):
         return 1
 
+    def getloadavg(self):
+        return self.loadavg
+
+    def getrusage(self):
+        return None
+
+    def rss(self):
+        return 0
+
     def isdir(self, *comps):
         path = self.abspath(*comps)
         return path in self.dirs
@@ -190,6 +204,18 @@ class FakeHost(object):
         stream.write(msg + end)
         stream.flush()
 
+    def buffer_output(self, max_bytes=64 * 1024, max_delay=1.0):
+        pass
+
+    def flush_output(self):
+        pass
+
+    def unbuffer_output(self):
+        pass
+
+    def output_flush_delay(self):
+        return None
+
     def read_binary_file(self, *comps):
         return self._read(comps)
 
@@ -277,6 +303,45 @@ class FakeHost(object):
         self._untap_output()
         return out, err
 
+    def capture_thread_output(self, divert=True):
+        if not isinstance(self.stdout, _ContextLocalStream):
+            self.stdout = _ContextLocalStream(self.stdout)
+            self.stderr = _ContextLocalStream(self.stderr)
+            sys.stdout = self.stdout
+            sys.stderr = self.stderr
+        self.stdout.users += 1
+        self.stdout.capture(divert)
+        self.stderr.capture(divert)
+
+    def restore_thread_output(self):
+        out, err = self.stdout, self.stderr
+        assert isinstance(out, _ContextLocalStream)
+        out.users -= 1
+        if not out.users:
+            self.stdout = sys.stdout = out.stream
+            self.stderr = sys.stderr = err.stream
+        return out.restore(), err.restore()
+
+    def capture_fd_output(self):
+        self.capture_output()
+
+    def restore_fd_output(self, max_bytes=0):
+        self._fd_output = self.restore_output()
+        capped = []
+        truncated = False
+        for text in self._fd_output:
+            if max_bytes and len(text) > max_bytes:
+                half = max_bytes // 2
+                text = cap_text(text[:half], text[len(text) - half:],
+                                len(text) - 2 * half)
+                truncated = True
+            capped.append(text)
+        return capped[0], capped[1], truncated
+
+    def save_fd_output(self, out_path, err_path):
+        self.write_text_file(out_path, self._fd_output[0])
+        self.write_text_file(err_path, self._fd_output[1])
+
 
 class FakeResponse(io.StringIO):
 
@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import sys
+import threading
 
 from typ.tests import host_test
 from typ.fakes.host_fake import FakeHost, FakeResponse
@@ -35,6 +36,23 @@ class TestFakeHost(host_test.TestHost):
         if sys.platform != 'win32':
             super(TestFakeHost, self).test_add_to_path()
 
+    def test_buffered_print(self):
+        # FakeHost never buffers, so that tests see output immediately.
+        h = self.host()
+        h.buffer_output(max_bytes=10, max_delay=60)
+        h.print_('a')
+        self.assertEqual(h.stdout.getvalue(), 'a\n')
+        self.assertIsNone(h.output_flush_delay())
+        h.unbuffer_output()
+
+    def test_buffered_print_delay(self):
+        h = self.host()
+        h.buffer_output(max_bytes=1000, max_delay=2)
+        h.print_('a')
+        self.assertEqual(h.stdout.getvalue(), 'a\n')
+        self.assertIsNone(h.output_flush_delay())
+        h.unbuffer_output()
+
     def test_call(self):
         h = self.host()
         ret, out, err = h.call(['echo', 'hello, world'])
@@ -67,6 +85,45 @@ class TestFakeHost(host_test.TestHost):
         self.assertEqual(h.stdout.getvalue(), 'on stdout\n')
         self.assertEqual(h.stderr.getvalue(), 'on stderr\n')
 
+    def test_rss(self):
+        h = self.host()
+        self.assertEqual(h.rss(), 0)
+
+    def test_capture_thread_output(self):
+        # FakeHost wraps its own streams rather than the real sys.stdout.
+        h = self.host()
+        thread_output = []
+
+        def run_thread():
+            h.capture_thread_output()
+            h.print_('from thread')
+            thread_output.append(h.restore_thread_output())
+
+        h.capture_thread_output()
+        h.print_('from main')
+        t = threading.Thread(target=run_thread)
+        t.start()
+        t.join()
+        out, err = h.restore_thread_output()
+        self.assertEqual(out, 'from main\n')
+        self.assertEqual(err, '')
+        self.assertEqual(thread_output, [('from thread\n', '')])
+        self.assertEqual(h.stdout.getvalue(), '')
+
+    def test_capture_fd_output(self):
+        # FakeHost can't redirect real file descriptors, so it captures
+        # what is printed instead.
+        h = self.host()
+        h.capture_fd_output()
+        h.print_('on stdout')
+        h.print_('0123456789' * 3, stream=h.stderr)
+        out, err, truncated = h.restore_fd_output(max_bytes=10)
+        self.assertEqual(out, 'on stdout\n')
+        self.assertEqual(err, '01234\n... [21 bytes omitted] ...\n6789\n')
+        self.assertTrue(truncated)
+        h.save_fd_output('out', 'err')
+        self.assertEqual(h.read_text_file('err'), '0123456789' * 3 + '\n')
+
     def test_for_mp(self):
         h = self.host()
         self.assertNotEqual(h.for_mp(), None)
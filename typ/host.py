@@ -20,8 +20,19 @@ import shutil
 import subprocess
 import sys
 import tempfile
+import threading
 import time
 
+try:
+    import contextvars
+except ImportError:  # pragma: python2
+    contextvars = None
+
+try:
+    import resource
+except ImportError:  # pragma: win32
+    resource = None
+
 
 if sys.version_info.major == 2:  # pragma: python2
     from urllib2 import urlopen, Request
@@ -50,6 +61,14 @@ class Host(object):
         self.stdin = sys.stdin
         self.env = os.environ
         self.platform = sys.platform
+        self._buffer = None
+        self._buffered_stream = None
+        self._buffered_bytes = 0
+        self._buffer_started = None
+        self._buffer_max_bytes = 0
+        self._buffer_max_delay = 0
+        self._fd_files = None
+        self._saved_fds = None
 
     def abspath(self, *comps):
         return os.path.abspath(self.join(*comps))
@@ -78,6 +97,7 @@ class Host(object):
         return proc.returncode, stdout.decode('utf-8'), stderr.decode('utf-8')
 
     def call_inline(self, argv, env=None):
+        self.flush_output()
         if isinstance(self.stdout, _TeedStream):  # pragma: no cover
             ret, out, err = self.call(argv, env)
             self.print_(out, end='')
@@ -92,6 +112,12 @@ class Host(object):
     def cpu_count(self):
         return multiprocessing.cpu_count()
 
+    def cpu_affinity_count(self):
+        """Returns how many CPUs this process is allowed to run on."""
+        if hasattr(os, 'sched_getaffinity'):  # pragma: no win32
+            return len(os.sched_getaffinity(0))
+        return self.cpu_count()  # pragma: untested
+
     def dirname(self, *comps):
         return os.path.dirname(self.join(*comps))
 
@@ -115,6 +141,36 @@ class Host(object):
     def getpid(self):
         return os.getpid()
 
+    def getloadavg(self):
+        """Returns the one-minute load average, or None if unknown."""
+        try:
+            return os.getloadavg()[0]
+        except (AttributeError, OSError):  # pragma: win32
+            return None
+
+    def getrusage(self):
+        """Returns the resource usage of this process, or None if unknown."""
+        if resource is None:  # pragma: win32
+            return None
+        return resource.getrusage(resource.RUSAGE_SELF)
+
+    def rss(self):
+        """Returns the resident set size of this process in bytes.
+
+        Where the current size isn't available, this is the peak size so
+        far, or 0 if that isn't available either."""
+        try:
+            with open('/proc/self/statm') as f:
+                pages = int(f.read().split()[1])
+            return pages * os.sysconf('SC_PAGE_SIZE')
+        except (IOError, OSError, ValueError, IndexError):
+            pass
+        usage = self.getrusage()
+        if usage is None:  # pragma: win32
+            return 0
+        # ru_maxrss is in kilobytes everywhere except on Mac.
+        return usage.ru_maxrss * (1 if self.platform == 'darwin' else 1024)
+
     def for_mp(self):
         return None
 
@@ -143,9 +199,59 @@ class Host(object):
 
     def print_(self, msg='', end='\n', stream=None):
         stream = stream or self.stdout
+        if self._buffer is not None:
+            if stream is self.stdout:
+                self._buffer_write(stream, str(msg) + end)
+                return
+            # Anything going to stderr (or elsewhere) must not overtake
+            # what has already been printed to stdout.
+            self.flush_output()
         stream.write(str(msg) + end)
         stream.flush()
 
+    def buffer_output(self, max_bytes=64 * 1024, max_delay=1.0):
+        """Makes print_() buffer what it writes to stdout.
+
+        The buffer is written out once it holds |max_bytes| bytes or its
+        oldest message is |max_delay| seconds old (as of the next call to
+        print_()), before anything is printed to another stream or output
+        is captured, and whenever flush_output() is called."""
+        self._buffer = []
+        self._buffered_bytes = 0
+        self._buffer_max_bytes = max_bytes
+        self._buffer_max_delay = max_delay
+
+    def flush_output(self):
+        if self._buffer:
+            self._buffered_stream.write(''.join(self._buffer))
+            self._buffered_stream.flush()
+            self._buffer = []
+            self._buffered_bytes = 0
+
+    def unbuffer_output(self):
+        self.flush_output()
+        self._buffer = None
+
+    def output_flush_delay(self):
+        """Returns the secs until buffered output is due, or None."""
+        if not self._buffer:
+            return None
+        return max(0, self._buffer_started + self._buffer_max_delay -
+                   self.time())
+
+    def _buffer_write(self, stream, text):
+        if self._buffer and stream is not self._buffered_stream:
+            self.flush_output()
+        if not self._buffer:
+            self._buffered_stream = stream
+            self._buffer_started = self.time()
+        self._buffer.append(text)
+        self._buffered_bytes += len(text)
+        if (self._buffered_bytes >= self._buffer_max_bytes or
+                self.time() - self._buffer_started >=
+                self._buffer_max_delay):
+            self.flush_output()
+
     def read_text_file(self, *comps):
         return self._read(comps, 'r')
 
@@ -235,6 +341,7 @@ class Host(object):
         self.stderr = sys.stderr = self.stderr.stream
 
     def capture_output(self, divert=True):
+        self.flush_output()
         self._tap_output()
         self._orig_logging_handlers = self.logger.handlers
         if self._orig_logging_handlers:
@@ -249,6 +356,146 @@ class Host(object):
         self._untap_output()
         return out, err
 
+    def capture_thread_output(self, divert=True):
+        """Like capture_output(), but only captures the calling thread.
+
+        sys.stdout and sys.stderr are replaced (by the first thread to call
+        this) with streams that send what each thread writes to its own
+        capture, so several threads can capture at once; whatever other
+        threads write goes to the original streams. Concurrent asyncio
+        tasks are kept apart the same way."""
+        self.flush_output()
+        with _thread_capture_lock:
+            if not isinstance(sys.stdout, _ContextLocalStream):
+                sys.stdout = _ContextLocalStream(sys.stdout)
+                sys.stderr = _ContextLocalStream(sys.stderr)
+            sys.stdout.users += 1
+            out, err = sys.stdout, sys.stderr
+        out.capture(divert)
+        err.capture(divert)
+
+    def restore_thread_output(self):
+        with _thread_capture_lock:
+            out, err = sys.stdout, sys.stderr
+            assert isinstance(out, _ContextLocalStream)
+            out.users -= 1
+            if not out.users:
+                sys.stdout = out.stream
+                sys.stderr = err.stream
+        return out.restore(), err.restore()
+
+    def capture_fd_output(self):
+        """Redirects file descriptors 1 and 2 to this process's temp files.
+
+        Unlike capture_output(), this also catches what C extensions and
+        subprocesses write, and nothing is held in memory."""
+        self.flush_output()
+        if self._fd_files is None:
+            self._fd_files = (tempfile.TemporaryFile(),
+                              tempfile.TemporaryFile())
+        self._flush_std_streams()
+        self._saved_fds = (os.dup(1), os.dup(2))
+        for fd, f in zip((1, 2), self._fd_files):
+            f.seek(0)
+            f.truncate()
+            os.dup2(f.fileno(), fd)
+
+    def restore_fd_output(self, max_bytes=0):
+        """Undoes capture_fd_output() and returns (out, err, truncated).
+
+        If |max_bytes| is non-zero, output longer than that is cut down to
+        its first and last |max_bytes| / 2 bytes, and |truncated| is True;
+        save_fd_output() can still write out all of it."""
+        self._flush_std_streams()
+        for fd, saved_fd in zip((1, 2), self._saved_fds):
+            os.dup2(saved_fd, fd)
+            os.close(saved_fd)
+        self._saved_fds = None
+        out, out_truncated = _read_capped(self._fd_files[0], max_bytes)
+        err, err_truncated = _read_capped(self._fd_files[1], max_bytes)
+        return out, err, out_truncated or err_truncated
+
+    def save_fd_output(self, out_path, err_path):
+        """Writes all of the output last captured by capture_fd_output()."""
+        for f, path in zip(self._fd_files, (out_path, err_path)):
+            f.seek(0)
+            with open(path, 'wb') as dest:
+                shutil.copyfileobj(f, dest)
+
+    def _flush_std_streams(self):
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except Exception:  # pragma: no cover
+                pass
+
+
+def _read_capped(f, max_bytes):
+    size = f.seek(0, os.SEEK_END) or f.tell()
+    f.seek(0)
+    if not max_bytes or size <= max_bytes:
+        return f.read().decode('utf-8', 'replace'), False
+    head = f.read(max_bytes // 2)
+    f.seek(size - max_bytes // 2)
+    tail = f.read()
+    return (cap_text(head.decode('utf-8', 'replace'),
+                     tail.decode('utf-8', 'replace'),
+                     size - len(head) - len(tail)), True)
+
+
+def cap_text(head, tail, omitted):
+    return '%s\n... [%d bytes omitted] ...\n%s' % (head, omitted, tail)
+
+
+_thread_capture_lock = threading.Lock()
+
+
+class _ContextLocalStream(object):
+    """Forwards writes to the caller's _TeedStream, if it has one.
+
+    Each thread has a contextvars context of its own, and each asyncio task
+    runs in a copy of the context it was created in, so threads and tasks
+    can each capture their own output. Without contextvars (before 3.7),
+    only threads are told apart."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.users = 0
+        if contextvars:  # pragma: python3
+            self._var = contextvars.ContextVar('teed', default=None)
+        else:  # pragma: python2
+            self._local = threading.local()
+
+    def capture(self, divert=True):
+        teed = _TeedStream(self.stream)
+        teed.capture(divert)
+        self._set(teed)
+
+    def restore(self):
+        teed = self._get()
+        self._set(None)
+        return teed.restore()
+
+    def write(self, msg, *args, **kwargs):
+        (self._get() or self.stream).write(msg, *args, **kwargs)
+
+    def flush(self):
+        (self._get() or self.stream).flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    def _get(self):
+        if contextvars:  # pragma: python3
+            return self._var.get()
+        return getattr(self._local, 'teed', None)  # pragma: python2
+
+    def _set(self, teed):
+        if contextvars:  # pragma: python3
+            self._var.set(teed)
+        else:  # pragma: python2
+            self._local.teed = teed
+
 
 class _TeedStream(io.StringIO):
 
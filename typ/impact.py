@@ -0,0 +1,122 @@
+# Copyright 2014 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Records which source files each test runs code from (--impact-index).
+
+The index is a JSON file of the form
+
+    {"version": 1,
+     "files": ["/src/app/db.py", "/src/app/tests/db_test.py", ...],
+     "tests": {"app.tests.db_test.DbTest.test_connect": [0, 1], ...}}
+
+where each test maps to indices into "files", so that a path shared by
+thousands of tests is only stored once. --changed-since uses it to run
+only the tests that ran code from a changed file.
+
+Only function calls made while the test runs are recorded, so a test
+that reads a constant set when some module was imported doesn't depend
+on that module's file as far as the index is concerned. --changed-since
+adds the files the test's module imports (see typ.deps.ImportGraph) to
+the ones in the index, and uses the import graph alone for the tests
+that aren't in the index yet and for changed files that the index has
+never seen.
+"""
+
+import json
+import os
+import sys
+import threading
+
+
+INDEX_VERSION = 1
+
+
+class FileTracer(object):
+    """Collects the files of the Python functions called while started.
+
+    Only 'call' events are seen, since the trace function returns None
+    instead of a local trace function, so the cost is one Python call
+    per function call rather than per line."""
+
+    def __init__(self):
+        self.files = set()
+        self._previous = (None, None)
+
+    def start(self):
+        self.files = set()
+        # threading.gettrace() is new in Python 3.10.
+        self._previous = (sys.gettrace(),
+                          getattr(threading, '_trace_hook', None))
+        threading.settrace(self._trace)
+        sys.settrace(self._trace)
+
+    def stop(self):
+        sys.settrace(self._previous[0])
+        threading.settrace(self._previous[1])
+        # Calling stop() itself was traced.
+        self.files.discard(_THIS_FILE)
+        return self.files
+
+    def _trace(self, frame, event, arg):  # pylint: disable=unused-argument
+        self.files.add(frame.f_code.co_filename)
+
+
+_THIS_FILE = FileTracer.stop.__code__.co_filename
+
+# Code object filenames seen so far, and their real paths.
+_realpaths = {}
+
+
+def files_under(files, dirs):
+    """Returns the absolute paths in |files| that are under one of |dirs|."""
+    prefixes = tuple(os.path.join(os.path.realpath(d), '') for d in dirs)
+    paths = set()
+    for f in files:
+        # '<string>', '<frozen importlib._bootstrap>' and so on.
+        if f.startswith('<'):
+            continue
+        path = _realpaths.get(f)
+        if path is None:
+            path = _realpaths[f] = os.path.realpath(f)
+        if path.startswith(prefixes):
+            paths.add(path)
+    return paths
+
+
+def read_index(host, path):
+    """Returns {test name: set of paths} from the index at |path|."""
+    if not host.exists(path):
+        return {}
+    try:
+        index = json.loads(host.read_text_file(path))
+    except ValueError:
+        return {}
+    if index.get('version') != INDEX_VERSION:
+        return {}
+    files = index['files']
+    return dict((name, set(files[i] for i in indices))
+                for name, indices in index['tests'].items())
+
+
+def write_index(host, path, tests):
+    """Writes {test name: paths} to |path|, in the format above."""
+    files = sorted(set(f for paths in tests.values() for f in paths))
+    numbers = dict((f, i) for i, f in enumerate(files))
+    index = {
+        'version': INDEX_VERSION,
+        'files': files,
+        'tests': dict((name, sorted(numbers[f] for f in paths))
+                      for name, paths in tests.items()),
+    }
+    host.write_text_file(path, json.dumps(index, sort_keys=True))
@@ -0,0 +1,153 @@
+# Copyright 2014 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A client for the GNU make jobserver.
+
+When typ is run from a recipe in a `make -j` build, make passes
+--jobserver-auth in MAKEFLAGS, naming either a fifo (make 4.4 and later)
+or a pair of inherited pipe file descriptors. Every job the build runs
+needs a token, which is a byte read from the fifo or pipe and written
+back when the job is done. typ itself holds an implicit token, so it
+may always run one test; each further test needs a token of its own.
+"""
+
+import errno
+import os
+import stat
+
+try:
+    import select
+except ImportError:  # pragma: untested
+    select = None
+
+
+# How often to try again for a token while none are available.
+POLL_INTERVAL = 0.1
+
+
+def from_env(host):
+    """Returns a JobServer for the jobserver named in MAKEFLAGS, or None.
+
+    None is returned if there is no jobserver, or make didn't pass its
+    file descriptors down to us (the recipe wasn't marked with '+')."""
+    auth = _auth_from_makeflags(host.getenv('MAKEFLAGS', ''))
+    if not auth or host.platform == 'win32':
+        # Windows jobservers use named semaphores, which we don't support.
+        return None
+    if auth.startswith('fifo:'):
+        try:
+            fd = os.open(auth[len('fifo:'):], os.O_RDWR | os.O_NONBLOCK)
+        except OSError:
+            return None
+        return JobServer(fd, fd, fds_to_close=[fd])
+    try:
+        read_fd, write_fd = [int(fd) for fd in auth.split(',')]
+    except ValueError:
+        return None
+    if read_fd < 0 or write_fd < 0:
+        return None
+    try:
+        if not stat.S_ISFIFO(os.fstat(read_fd).st_mode):
+            return None
+        os.fstat(write_fd)
+    except OSError:
+        return None
+    try:
+        # Opening the pipe again gives us a file description of our own,
+        # so it can be non-blocking without affecting make and its other
+        # children.
+        fd = os.open('/proc/self/fd/%d' % read_fd,
+                     os.O_RDONLY | os.O_NONBLOCK)
+    except OSError:  # pragma: untested
+        return JobServer(read_fd, write_fd)
+    return JobServer(fd, write_fd, fds_to_close=[fd])
+
+
+def _auth_from_makeflags(makeflags):
+    auth = None
+    for flag in makeflags.split():
+        # Older versions of make call it --jobserver-fds; if make passes
+        # it more than once, the last one wins.
+        for prefix in ('--jobserver-auth=', '--jobserver-fds='):
+            if flag.startswith(prefix):
+                auth = flag[len(prefix):]
+    return auth
+
+
+class JobServer(object):
+    """Acquires and releases tokens from a jobserver.
+
+    Tokens are read from |read_fd| and written back to |write_fd|.
+    acquire() never blocks; it returns False when no token is available
+    and poll_delay() says how soon to try again. Every token acquired is
+    written back by release_to() or close(), which the runner calls
+    when typ finishes, fails or is interrupted."""
+
+    def __init__(self, read_fd, write_fd, fds_to_close=None):
+        self.read_fd = read_fd
+        self.write_fd = write_fd
+        self.fds_to_close = fds_to_close or []
+        self.tokens = []
+        self.waiting = False
+
+    @property
+    def held(self):
+        return len(self.tokens)
+
+    def acquire(self):
+        token = self._read_token()
+        self.waiting = token is None
+        if token is None:
+            return False
+        self.tokens.append(token)
+        return True
+
+    def release(self):
+        token = self.tokens.pop()
+        try:
+            os.write(self.write_fd, token)
+        except OSError:  # pragma: no cover
+            # Make has gone away, so there is nobody to give it back to.
+            pass
+
+    def release_to(self, count):
+        """Releases tokens until only |count| are held."""
+        while len(self.tokens) > max(0, count):
+            self.release()
+
+    def release_all(self):
+        self.release_to(0)
+
+    def poll_delay(self):
+        return POLL_INTERVAL if self.waiting else None
+
+    def close(self):
+        self.release_all()
+        for fd in self.fds_to_close:
+            os.close(fd)
+        self.fds_to_close = []
+
+    def _read_token(self):
+        if select is not None:
+            readable, _, _ = select.select([self.read_fd], [], [], 0)
+            if not readable:
+                return None
+        try:
+            token = os.read(self.read_fd, 1)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return None
+            raise
+        # An empty read means make closed its end; there are no more.
+        return token or None
@@ -34,7 +34,8 @@ class Result(object):
 
     def __init__(self, name, actual, started, took, worker,
                  expected=None, unexpected=False,
-                 flaky=False, code=0, out='', err='', pid=0):
+                 flaky=False, code=0, out='', err='', pid=0,
+                 resources=None):
         self.name = name
         self.actual = actual
         self.started = started
@@ -48,6 +49,33 @@ class Result(object):
         self.err = err
         self.pid = pid
 
+        # An optional dict of the resources the test used (CPU time,
+        # peak RSS, context switches, allocations); see --track-resources.
+        self.resources = resources
+
+    # |out| and |err| may be given as typ.spill.SpilledText objects by
+    # workers with a lot of output; they are read back on first use.
+
+    @property
+    def out(self):
+        if hasattr(self._out, 'read'):
+            self._out = self._out.read()
+        return self._out
+
+    @out.setter
+    def out(self, value):
+        self._out = value
+
+    @property
+    def err(self):
+        if hasattr(self._err, 'read'):
+            self._err = self._err.read()
+        return self._err
+
+    @err.setter
+    def err(self, value):
+        self._err = value
+
 
 class ResultSet(object):
 
@@ -61,16 +89,20 @@ class ResultSet(object):
 TEST_SEPARATOR = '.'
 
 
-def make_full_results(metadata, seconds_since_epoch, all_test_names, results):
+def make_full_results(metadata, seconds_since_epoch, all_test_names, results,
+                      interrupted=False):
     """Convert the typ results to the Chromium JSON test result format.
 
     See http://www.chromium.org/developers/the-json-test-results-format
+
+    If the run was |interrupted|, the tests without results are reported
+    as NOTRUN rather than SKIP.
     """
 
     # We use OrderedDicts here so that the output is stable.
     full_results = OrderedDict()
     full_results['version'] = 3
-    full_results['interrupted'] = False
+    full_results['interrupted'] = interrupted
     full_results['path_delimiter'] = TEST_SEPARATOR
     full_results['seconds_since_epoch'] = seconds_since_epoch
 
@@ -80,18 +112,32 @@ def make_full_results(metadata, seconds_since_epoch, all_test_names, results):
 
     passing_tests = _passing_test_names(results)
     failed_tests = failed_test_names(results)
-    skipped_tests = set(all_test_names) - passing_tests - failed_tests
+    not_run_tests = set()
+    if interrupted:
+        not_run_tests = (set(all_test_names) -
+                         set(r.name for r in results.results))
+    skipped_tests = (set(all_test_names) - passing_tests - failed_tests -
+                     not_run_tests)
 
     full_results['num_failures_by_type'] = OrderedDict()
     full_results['num_failures_by_type']['FAIL'] = len(failed_tests)
     full_results['num_failures_by_type']['PASS'] = len(passing_tests)
     full_results['num_failures_by_type']['SKIP'] = len(skipped_tests)
+    if interrupted:
+        full_results['num_failures_by_type']['NOTRUN'] = len(not_run_tests)
 
     full_results['tests'] = OrderedDict()
 
+    results_by_name = {}
+    for r in results.results:
+        results_by_name.setdefault(r.name, []).append(r)
+
     for test_name in all_test_names:
-        value = _results_for_test(test_name, results)
-        if test_name in skipped_tests:
+        value = _results_for_test(results_by_name.get(test_name, []))
+        if test_name in not_run_tests:
+            value['actual'] = 'NOTRUN'
+            value['expected'] = 'PASS'
+        elif test_name in skipped_tests:
             value['expected'] = 'SKIP'
         else:
             value['expected'] = 'PASS'
@@ -131,6 +177,27 @@ def num_skips(full_results):
     return full_results['num_failures_by_type']['SKIP']
 
 
+def num_not_run(full_results):
+    return full_results['num_failures_by_type'].get('NOTRUN', 0)
+
+
+def times_by_test(full_results):
+    """Returns an OrderedDict of {test name: [times]} from full results."""
+    times = OrderedDict()
+    sep = full_results.get('path_delimiter', TEST_SEPARATOR)
+
+    def walk(prefix, trie):
+        for key, value in trie.items():
+            name = prefix + sep + key if prefix else key
+            if 'actual' in value:
+                times[name] = list(value.get('times', []))
+            else:
+                walk(name, value)
+
+    walk('', full_results.get('tests', {}))
+    return times
+
+
 def failed_test_names(results):
     names = set()
     for r in results.results:
@@ -151,29 +218,32 @@ def _passing_test_names(results):
     return set(r.name for r in results.results if r.actual == ResultType.Pass)
 
 
-def _results_for_test(test_name, results):
+def _results_for_test(test_results):
     value = OrderedDict()
     actuals = []
     times = []
-    for r in results.results:
-        if r.name == test_name:
-            if r.actual == ResultType.Failure:
-                actuals.append('FAIL')
-            elif r.actual == ResultType.Pass:
-                actuals.append('PASS')
-            elif r.actual == ResultType.Skip:
-                actuals.append('SKIP')
-
-            # The time a test takes is a floating point number of seconds;
-            # if we were to encode this unmodified, then when we converted it
-            # to JSON it might make the file significantly larger. Instead
-            # we truncate the file to ten-thousandths of a second, which is
-            # probably more than good enough for most tests.
-            times.append(round(r.took, 4))
+    resources = []
+    for r in test_results:
+        if r.actual == ResultType.Failure:
+            actuals.append('FAIL')
+        elif r.actual == ResultType.Pass:
+            actuals.append('PASS')
+        elif r.actual == ResultType.Skip:
+            actuals.append('SKIP')
+
+        # The time a test takes is a floating point number of seconds;
+        # if we were to encode this unmodified, then when we converted it
+        # to JSON it might make the file significantly larger. Instead
+        # we truncate the file to ten-thousandths of a second, which is
+        # probably more than good enough for most tests.
+        times.append(round(r.took, 4))
+        resources.append(r.resources)
     if not actuals:  # pragma: untested
         actuals.append('SKIP')
     value['actual'] = ' '.join(actuals)
     value['times'] = times
+    if any(resources):
+        value['resources'] = resources
     return value
 
 def _add_path_to_trie(trie, path, value):
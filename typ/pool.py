@@ -14,29 +14,72 @@
 
 import copy
 import multiprocessing
+import multiprocessing.connection
 import pickle
+import sys
+import threading
+import time
 import traceback
 
 from typ.host import Host
 
+if sys.version_info.major == 2:  # pragma: python2
+    from Queue import Empty, Queue
+else:  # pragma: python3
+    from queue import Empty, Queue
 
-def make_pool(host, jobs, callback, context, pre_fn, post_fn):
+
+POOL_TYPES = ('queue', 'pipe', 'thread')
+
+
+def make_pool(host, jobs, callback, context, pre_fn, post_fn,
+              report_starts=False, pool_type='queue', max_messages=0,
+              max_rss=0):
+    """Returns a pool of |jobs| workers that call |callback| on messages.
+
+    |pool_type| picks how messages get to and from worker processes:
+    'queue' shares one request queue and one response queue between all
+    of the workers, and 'pipe' gives each worker a pipe of its own.
+    'thread' runs the workers on threads in this process instead; each of
+    them gets a shallow copy of |context|.
+
+    If |report_starts| is true, each worker tells the pool when it picks
+    up a message, and pool.running maps the number of each busy worker to
+    a (message, start time) pair. The pipe pool always knows this, since
+    it hands each message to a particular worker.
+
+    A worker process that has handled |max_messages| messages, or whose
+    resident set is larger than |max_rss| bytes, retires: it calls
+    |post_fn| and exits, and the pool starts a new one (calling |pre_fn|)
+    in its place. join() returns the results of |post_fn| for the retired
+    workers as well as for the ones still running at the end."""
+    if jobs > 1 and pool_type == 'thread':
+        # Nothing has to be pickled to get to a thread.
+        return _ThreadPool(host, jobs, callback, context, pre_fn, post_fn,
+                           report_starts)
     _validate_args(context, pre_fn, post_fn)
+    if jobs > 1 and pool_type == 'pipe':
+        return _PipePool(host, jobs, callback, context, pre_fn, post_fn,
+                         max_messages, max_rss)
     if jobs > 1:
-        return _ProcessPool(host, jobs, callback, context, pre_fn, post_fn)
+        return _ProcessPool(host, jobs, callback, context, pre_fn, post_fn,
+                            report_starts, max_messages, max_rss)
     else:
         return _AsyncPool(host, jobs, callback, context, pre_fn, post_fn)
 
 
 class _MessageType(object):
     Request = 'Request'
+    Started = 'Started'
     Response = 'Response'
     Close = 'Close'
     Done = 'Done'
+    Retired = 'Retired'
     Error = 'Error'
     Interrupt = 'Interrupt'
 
-    values = [Request, Response, Close, Done, Error, Interrupt]
+    values = [Request, Started, Response, Close, Done, Retired, Error,
+              Interrupt]
 
 
 def _validate_args(context, pre_fn, post_fn):
@@ -57,35 +100,65 @@ def _validate_args(context, pre_fn, post_fn):
 
 class _ProcessPool(object):
 
-    def __init__(self, host, jobs, callback, context, pre_fn, post_fn):
+    def __init__(self, host, jobs, callback, context, pre_fn, post_fn,
+                 report_starts=False, max_messages=0, max_rss=0):
         self.host = host
         self.jobs = jobs
         self.requests = multiprocessing.Queue()
         self.responses = multiprocessing.Queue()
+        self.running = {}
         self.workers = []
         self.discarded_responses = []
+        self.retired_responses = []
         self.closed = False
         self.erred = False
+        self._worker_args = (callback, context, pre_fn, post_fn,
+                             report_starts, max_messages, max_rss)
         for worker_num in range(1, jobs + 1):
-            w = multiprocessing.Process(target=_loop,
-                                        args=(self.requests, self.responses,
-                                              host.for_mp(), worker_num,
-                                              callback, context,
-                                              pre_fn, post_fn))
-            w.start()
-            self.workers.append(w)
+            self.workers.append(self._start_worker(worker_num))
+
+    def _start_worker(self, worker_num):
+        (callback, context, pre_fn, post_fn, report_starts, max_messages,
+         max_rss) = self._worker_args
+        w = multiprocessing.Process(target=_loop,
+                                    args=(self.requests, self.responses,
+                                          self.host.for_mp(), worker_num,
+                                          callback, context,
+                                          pre_fn, post_fn,
+                                          report_starts, True,
+                                          max_messages, max_rss))
+        w.start()
+        return w
 
     def send(self, msg):
         self.requests.put((_MessageType.Request, msg))
 
-    def get(self):
-        msg_type, resp = self.responses.get()
-        if msg_type == _MessageType.Error:
-            self._handle_error(resp)
-        elif msg_type == _MessageType.Interrupt:
-            raise KeyboardInterrupt
-        assert msg_type == _MessageType.Response
-        return resp
+    def get(self, timeout=None):
+        """Returns the next response, or None if |timeout| secs elapse."""
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0, deadline - time.time())
+            try:
+                msg_type, resp = self.responses.get(timeout=remaining)
+            except Empty:
+                return None
+            if msg_type == _MessageType.Started:
+                worker_num, msg, started = resp
+                self.running[worker_num] = (msg, started)
+                continue
+            if msg_type == _MessageType.Retired:
+                self._replace_worker(resp)
+                continue
+            if msg_type == _MessageType.Error:
+                self._handle_error(resp)
+            elif msg_type == _MessageType.Interrupt:
+                raise KeyboardInterrupt
+            assert msg_type == _MessageType.Response
+            worker_num, resp = resp
+            self.running.pop(worker_num, None)
+            return resp
 
     def close(self):
         for _ in self.workers:
@@ -125,10 +198,13 @@ class _ProcessPool(object):
                 if msg_type == _MessageType.Interrupt:
                     interrupted = True
                     break
-                if msg_type == _MessageType.Done:
+                # A worker that retires now won't read its Close message,
+                # but it doesn't need to.
+                if msg_type in (_MessageType.Done, _MessageType.Retired):
                     final_responses.append(resp[1])
                     break
-                self.discarded_responses.append(resp)
+                if msg_type == _MessageType.Response:
+                    self.discarded_responses.append(resp[1])
 
         for w in self.workers:
             w.join()
@@ -137,12 +213,257 @@ class _ProcessPool(object):
         # why this is commented out.
         # self.responses.close()
 
+        if error:
+            self._handle_error(error)
+        if interrupted:
+            raise KeyboardInterrupt
+        return self.retired_responses + final_responses
+
+    def _replace_worker(self, resp):
+        worker_num, final_response = resp
+        self.retired_responses.append(final_response)
+        self.workers[worker_num - 1].join()
+        self.workers[worker_num - 1] = self._start_worker(worker_num)
+
+    def _handle_error(self, msg):
+        worker_num, tb = msg
+        self.erred = True
+        raise Exception("Error from worker %d (traceback follows):\n%s" %
+                        (worker_num, tb))
+
+
+class _ThreadPool(_ProcessPool):
+    """A _ProcessPool whose workers are threads, talking over Queues."""
+
+    # pylint: disable=super-init-not-called
+    def __init__(self, host, jobs, callback, context, pre_fn, post_fn,
+                 report_starts=False):
+        self.host = host
+        self.jobs = jobs
+        self.requests = Queue()
+        self.responses = Queue()
+        self.running = {}
+        self.workers = []
+        self.discarded_responses = []
+        self.retired_responses = []
+        self.closed = False
+        self.erred = False
+        # Threads don't retire, since they can't give memory back.
+        self._worker_args = (callback, context, pre_fn, post_fn,
+                             report_starts, 0, 0)
+        for worker_num in range(1, jobs + 1):
+            self.workers.append(self._start_worker(worker_num))
+
+    def _start_worker(self, worker_num):
+        callback, context, pre_fn, post_fn, report_starts, _, _ = (
+            self._worker_args)
+        w = threading.Thread(target=_loop,
+                             args=(self.requests, self.responses,
+                                   self.host.for_mp(), worker_num,
+                                   callback, copy.copy(context),
+                                   pre_fn, post_fn, report_starts),
+                             name='typ-worker-%d' % worker_num)
+        # Threads can't be terminated, so don't let a worker that is
+        # stuck in a test keep the process alive after an abort.
+        w.daemon = True
+        w.start()
+        return w
+
+    def join(self):
+        if not self.closed:
+            # We must be aborting; ask the workers to stop after their
+            # current messages, but don't wait for them.
+            self.close()
+            return []
+
+        final_responses = []
+        error = None
+        interrupted = None
+        for _ in self.workers:
+            while True:
+                msg_type, resp = self.responses.get()
+                if msg_type == _MessageType.Error:
+                    error = resp
+                    break
+                if msg_type == _MessageType.Interrupt:
+                    interrupted = True
+                    break
+                if msg_type == _MessageType.Done:
+                    final_responses.append(resp[1])
+                    break
+                if msg_type == _MessageType.Response:
+                    self.discarded_responses.append(resp[1])
+
+        for w in self.workers:
+            w.join()
+
         if error:
             self._handle_error(error)
         if interrupted:
             raise KeyboardInterrupt
         return final_responses
 
+
+class _PipePool(object):
+    """Runs |jobs| worker processes, each with a duplex pipe of its own.
+
+    Messages are only sent to idle workers, so the pool knows which worker
+    is handling each one; the rest wait in self.pending. Responses are
+    read from whichever pipes are ready, using connection.wait()."""
+
+    def __init__(self, host, jobs, callback, context, pre_fn, post_fn,
+                 max_messages=0, max_rss=0):
+        self.host = host
+        self.jobs = jobs
+        self.pending = []
+        self.running = {}
+        self.idle = []
+        self.conns = {}
+        self.workers = {}
+        self.discarded_responses = []
+        self.retired_responses = []
+        self.closed = False
+        self.erred = False
+        self._worker_nums = {}
+        self._worker_args = (callback, context, pre_fn, post_fn,
+                             max_messages, max_rss)
+        for worker_num in range(1, jobs + 1):
+            self._start_worker(worker_num)
+
+    def _start_worker(self, worker_num):
+        callback, context, pre_fn, post_fn, max_messages, max_rss = (
+            self._worker_args)
+        conn, child_conn = multiprocessing.Pipe()
+        w = multiprocessing.Process(target=_loop,
+                                    args=(_PipeEnd(child_conn),
+                                          _PipeEnd(child_conn),
+                                          self.host.for_mp(), worker_num,
+                                          callback, context,
+                                          pre_fn, post_fn, False, True,
+                                          max_messages, max_rss))
+        w.start()
+        child_conn.close()
+        self.conns[worker_num] = conn
+        self.workers[worker_num] = w
+        self._worker_nums[conn] = worker_num
+        self.idle.append(worker_num)
+
+    def send(self, msg):
+        self.pending.append(msg)
+        self._dispatch()
+
+    def get(self, timeout=None):
+        """Returns the next response, or None if |timeout| secs elapse."""
+        deadline = None if timeout is None else time.time() + timeout
+        while self.running:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0, deadline - time.time())
+            # Idle workers are waited on too, in case they retire.
+            ready = multiprocessing.connection.wait(
+                list(self.conns.values()), remaining)
+            if not ready:
+                return None
+            worker_num = self._worker_nums[ready[0]]
+            msg_type, resp = self._recv(worker_num)
+            if msg_type == _MessageType.Error:
+                self._handle_error(resp)
+            elif msg_type == _MessageType.Interrupt:
+                raise KeyboardInterrupt
+            elif msg_type == _MessageType.Retired:
+                self._replace_worker(worker_num, resp[1])
+                continue
+            assert msg_type == _MessageType.Response
+            del self.running[worker_num]
+            self.idle.append(worker_num)
+            self._dispatch()
+            return resp[1]
+        return None
+
+    def close(self):
+        self.closed = True
+
+    def join(self):
+        if not self.closed:
+            # We must be aborting; terminate the workers rather than
+            # shutting down cleanly.
+            for worker_num, w in self.workers.items():
+                w.terminate()
+                w.join()
+                self.conns[worker_num].close()
+            return []
+
+        final_responses = []
+        error = None
+        interrupted = None
+        for worker_num in sorted(self.workers):
+            # A worker that is still busy will read the Close message
+            # after it has sent its response; one that has retired will
+            # never read it.
+            self._send(worker_num, (_MessageType.Close, None))
+            while True:
+                msg_type, resp = self._recv(worker_num)
+                if msg_type == _MessageType.Error:
+                    error = resp
+                    break
+                if msg_type == _MessageType.Interrupt:
+                    interrupted = True
+                    break
+                if msg_type in (_MessageType.Done, _MessageType.Retired):
+                    final_responses.append(resp[1])
+                    break
+                if msg_type == _MessageType.Response:
+                    self.discarded_responses.append(resp[1])
+        self.discarded_responses.extend(self.pending)
+        self.pending = []
+
+        for worker_num, w in self.workers.items():
+            w.join()
+            self.conns[worker_num].close()
+
+        if error:
+            self._handle_error(error)
+        if interrupted:
+            raise KeyboardInterrupt
+        return self.retired_responses + final_responses
+
+    def _dispatch(self):
+        while self.pending and self.idle and not self.closed:
+            worker_num = self.idle.pop(0)
+            msg = self.pending.pop(0)
+            self.running[worker_num] = (msg, time.time())
+            self._send(worker_num, (_MessageType.Request, msg))
+
+    def _replace_worker(self, worker_num, final_response):
+        self.retired_responses.append(final_response)
+        conn = self.conns.pop(worker_num)
+        del self._worker_nums[conn]
+        conn.close()
+        self.workers.pop(worker_num).join()
+        if worker_num in self.idle:
+            self.idle.remove(worker_num)
+        if worker_num in self.running:
+            # The worker retired before it saw this message.
+            msg, _ = self.running.pop(worker_num)
+            self.pending.insert(0, msg)
+        self._start_worker(worker_num)
+        self._dispatch()
+
+    def _send(self, worker_num, msg):
+        try:
+            self.conns[worker_num].send(msg)
+        except (IOError, OSError):
+            # The worker has retired (or died); get() or join() will find
+            # out which when it reads the pipe.
+            pass
+
+    def _recv(self, worker_num):
+        try:
+            return self.conns[worker_num].recv()
+        except EOFError:
+            self.erred = True
+            raise Exception('Worker %d exited unexpectedly' % worker_num)
+
     def _handle_error(self, msg):
         worker_num, tb = msg
         self.erred = True
@@ -150,13 +471,28 @@ class _ProcessPool(object):
                         (worker_num, tb))
 
 
+class _PipeEnd(object):
+    """Gives one end of a pipe the get()/put() interface of a Queue."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def get(self, block=True):  # pylint: disable=unused-argument
+        return self.conn.recv()
+
+    def put(self, msg):
+        self.conn.send(msg)
+
+
 # 'Too many arguments' pylint: disable=R0913
 
 def _loop(requests, responses, host, worker_num,
-          callback, context, pre_fn, post_fn, should_loop=True):
+          callback, context, pre_fn, post_fn, report_starts=False,
+          should_loop=True, max_messages=0, max_rss=0):
     host = host or Host()
     try:
         context_after_pre = pre_fn(host, worker_num, context)
+        num_messages = 0
         keep_looping = True
         while keep_looping:
             message_type, args = requests.get(block=True)
@@ -165,14 +501,24 @@ def _loop(requests, responses, host, worker_num,
                                (worker_num, post_fn(context_after_pre))))
                 break
             assert message_type == _MessageType.Request
+            if report_starts:
+                responses.put((_MessageType.Started,
+                               (worker_num, args, time.time())))
             resp = callback(context_after_pre, args)
-            responses.put((_MessageType.Response, resp))
+            responses.put((_MessageType.Response, (worker_num, resp)))
+            num_messages += 1
+            if ((max_messages and num_messages >= max_messages) or
+                    (max_rss and host.rss() > max_rss)):
+                # Leave, so that the pool starts a fresh process for us.
+                responses.put((_MessageType.Retired,
+                               (worker_num, post_fn(context_after_pre))))
+                break
             keep_looping = should_loop
     except KeyboardInterrupt as e:
         responses.put((_MessageType.Interrupt, (worker_num, str(e))))
     except Exception as e:
         responses.put((_MessageType.Error,
-                       (worker_num, traceback.format_exc(e))))
+                       (worker_num, traceback.format_exc())))
 
 
 class _AsyncPool(object):
@@ -183,6 +529,7 @@ class _AsyncPool(object):
         self.callback = callback
         self.context = copy.deepcopy(context)
         self.msgs = []
+        self.running = {}
         self.closed = False
         self.post_fn = post_fn
         self.context_after_pre = pre_fn(self.host, 1, self.context)
@@ -190,9 +537,21 @@ class _AsyncPool(object):
 
     def send(self, msg):
         self.msgs.append(msg)
-
-    def get(self):
-        return self.callback(self.context_after_pre, self.msgs.pop(0))
+        self._mark_running()
+
+    def get(self, timeout=None):  # pylint: disable=unused-argument
+        msg = self.msgs.pop(0)
+        try:
+            return self.callback(self.context_after_pre, msg)
+        finally:
+            self.running = {}
+            self._mark_running()
+
+    def _mark_running(self):
+        # Messages run one at a time, as get() is called; the next one to
+        # run counts as running so that it shows up on the dashboard.
+        if self.msgs and not self.running:
+            self.running[1] = (self.msgs[0], time.time())
 
     def close(self):
         self.closed = True
@@ -14,14 +14,28 @@
 
 
 class Printer(object):
+    """Prints status lines, overwriting the previous one if asked to.
 
-    def __init__(self, print_, should_overwrite, cols):
+    When overwriting, redraws of elided (transient) lines are limited to
+    one per |min_interval| seconds: an update that arrives too soon is
+    held back and replaced by any later one, and the held-back line is
+    drawn by refresh(), flush() or the next update that is allowed
+    through. Lines that aren't elided are always printed immediately and
+    in order."""
+
+    def __init__(self, print_, should_overwrite, cols, min_interval=0,
+                 time_fn=None):
         self.print_ = print_
         self.should_overwrite = should_overwrite
         self.cols = cols
         self.last_line = ''
+        self.min_interval = min_interval
+        self.time_fn = time_fn
+        self.pending = None
+        self._last_draw = None
 
     def flush(self):
+        self.refresh()
         if self.last_line:
             self.print_('')
             self.last_line = ''
@@ -31,6 +45,31 @@ class Printer(object):
         if elide and self.cols and msg_len > self.cols - 5:
             new_len = int((self.cols - 5) / 2)
             msg = msg[:new_len] + '...' + msg[-new_len:]
+        if elide and self._throttled():
+            self.pending = msg
+            return
+        self.pending = None
+        self._draw(msg)
+
+    def pending_delay(self):
+        """Returns how long to wait before calling refresh(), or None."""
+        if self.pending is None:
+            return None
+        return max(0, self._last_draw + self.min_interval - self.time_fn())
+
+    def refresh(self):
+        if self.pending is not None:
+            msg = self.pending
+            self.pending = None
+            self._draw(msg)
+
+    def _throttled(self):
+        if not (self.should_overwrite and self.min_interval and
+                self.time_fn and self._last_draw is not None):
+            return False
+        return self.time_fn() - self._last_draw < self.min_interval
+
+    def _draw(self, msg):
         if self.should_overwrite and self.last_line:
             self.print_('\r' + ' ' * len(self.last_line) + '\r', end='')
         elif self.last_line:
@@ -38,3 +77,5 @@ class Printer(object):
         self.print_(msg, end='')
         last_nl = msg.rfind('\n')
         self.last_line = msg[last_nl + 1:]
+        if self.time_fn:
+            self._last_draw = self.time_fn()
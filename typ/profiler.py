@@ -0,0 +1,164 @@
+# Copyright 2014 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import marshal
+import pstats
+import signal
+import sys
+import threading
+
+from collections import OrderedDict
+
+if sys.version_info.major == 2:  # pragma: python2
+    from StringIO import StringIO
+else:  # pragma: python3
+    from io import StringIO
+
+
+class _RawStats(object):
+    """Adapts a raw cProfile stats dict to what pstats.Stats() accepts.
+
+    Workers return the dict from cProfile.Profile.create_stats() rather
+    than a pstats.Stats object since only the former is picklable."""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def merge_stats(stats_dicts):
+    """Returns a pstats.Stats combining the given raw stats dicts."""
+    stats_dicts = [d for d in stats_dicts if d]
+    if not stats_dicts:
+        return None
+    merged = pstats.Stats(_RawStats(dict(stats_dicts[0])))
+    for d in stats_dicts[1:]:
+        merged.add(_RawStats(dict(d)))
+    return merged
+
+
+def dump_stats(host, path, stats):
+    """Writes |stats| in the format pstats.Stats(path) reads back."""
+    host.write_binary_file(path, marshal.dumps(stats.stats))
+
+
+def format_stats(stats, top, sort_key='cumulative'):
+    stream = StringIO()
+    stats.stream = stream
+    stats.sort_stats(sort_key).print_stats(top)
+    return stream.getvalue()
+
+
+def can_sample():
+    return hasattr(signal, 'setitimer') and hasattr(signal, 'SIGPROF')
+
+
+class Sampler(object):
+    """A low-overhead statistical profiler.
+
+    Every |interval| seconds of CPU time, SIGPROF fires and the stack of
+    each thread that is currently running a test is recorded in the
+    collapsed-stack format used by flamegraph.pl (frames separated by
+    ';', rooted at the name of the test). Frames at and above |stop_at|
+    (a code object, normally the one for the function that runs each
+    test) are dropped so that the stacks start at the test itself.
+    """
+
+    def __init__(self, interval, stop_at=None):
+        self.interval = interval
+        self.stop_at = stop_at
+        self.samples = {}
+        self.running = {}
+        self._prev_handler = None
+
+    def start(self):
+        self._prev_handler = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._prev_handler or signal.SIG_DFL)
+
+    def test_started(self, test_name):
+        self.running[threading.current_thread().ident] = test_name
+
+    def test_finished(self):
+        self.running.pop(threading.current_thread().ident, None)
+
+    def _sample(self, signum, frame):  # pylint: disable=unused-argument
+        frames = sys._current_frames()  # pylint: disable=protected-access
+        for ident, test_name in list(self.running.items()):
+            f = frames.get(ident)
+            labels = []
+            while f is not None and f.f_code is not self.stop_at:
+                if f.f_code is not self._sample.__code__:
+                    labels.append(_frame_label(f))
+                f = f.f_back
+            labels.append(test_name)
+            key = ';'.join(reversed(labels))
+            self.samples[key] = self.samples.get(key, 0) + 1
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return '%s (%s:%d)' % (code.co_name, code.co_filename,
+                           code.co_firstlineno)
+
+
+def merge_samples(samples_dicts):
+    merged = {}
+    for samples in samples_dicts:
+        for stack, count in (samples or {}).items():
+            merged[stack] = merged.get(stack, 0) + count
+    return merged
+
+
+def format_collapsed(samples):
+    return ''.join('%s %d\n' % (stack, samples[stack])
+                   for stack in sorted(samples))
+
+
+def flamegraph_json(samples):
+    """Returns the samples as a d3-flame-graph compatible JSON string."""
+    root = OrderedDict([('name', 'all'), ('value', 0), ('children', [])])
+    for stack in sorted(samples):
+        count = samples[stack]
+        node = root
+        node['value'] += count
+        for label in stack.split(';'):
+            for child in node['children']:
+                if child['name'] == label:
+                    break
+            else:
+                child = OrderedDict([('name', label), ('value', 0),
+                                     ('children', [])])
+                node['children'].append(child)
+            child['value'] += count
+            node = child
+    return json.dumps(root)
+
+
+def hottest_frames(samples, top):
+    """Returns the |top| (frame, count) pairs by inclusive sample count.
+
+    The test name at the root of each stack is ignored, so a helper's
+    count is the total across every test that called it."""
+    counts = {}
+    for stack, count in samples.items():
+        for label in set(stack.split(';')[1:]):
+            counts[label] = counts.get(label, 0) + count
+    return sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:top]
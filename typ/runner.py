@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import cProfile
 import fnmatch
 import importlib
 import inspect
@@ -22,6 +23,11 @@ import sys
 import unittest
 import traceback
 
+try:
+    import tracemalloc
+except ImportError:  # pragma: python2
+    tracemalloc = None
+
 from collections import OrderedDict
 
 # This ensures that absolute imports of typ modules will work when
@@ -37,8 +43,17 @@ if dir_above_typ not in sys.path:  # pragma: no cover
     sys.path.append(dir_above_typ)
 
 
+from typ import analyzer
+from typ import capacity
+from typ import deps
+from typ import impact
+from typ import jobserver
 from typ import json_results
+from typ import profiler
+from typ import spill
+from typ import timing
 from typ.arg_parser import ArgumentParser
+from typ.dashboard import Dashboard
 from typ.host import Host
 from typ.pool import make_pool
 from typ.stats import Stats
@@ -54,6 +69,10 @@ ResultType = json_results.ResultType
 
 def main(argv=None, host=None, win_multiprocessing=None, **defaults):
     host = host or Host()
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == 'analyze':
+        return analyzer.main(argv[1:], host)
     runner = Runner(host=host)
     if win_multiprocessing is not None:
         runner.win_multiprocessing = win_multiprocessing
@@ -61,12 +80,19 @@ def main(argv=None, host=None, win_multiprocessing=None, **defaults):
 
 
 class TestInput(object):
+    """A test to run.
+
+    |locks| names the resources the test needs to itself, such as a fixed
+    port; it runs in parallel with any other test that doesn't need one
+    of the same resources."""
 
-    def __init__(self, name, msg='', timeout=None, expected=None):
+    def __init__(self, name, msg='', timeout=None, expected=None,
+                 locks=None):
         self.name = name
         self.msg = msg
         self.timeout = timeout
         self.expected = expected
+        self.locks = frozenset(locks or [])
 
 
 class TestSet(object):
@@ -83,6 +109,11 @@ class TestSet(object):
         self.isolated_tests = promote(isolated_tests)
         self.tests_to_skip = promote(tests_to_skip)
 
+        # The names of the IsolatedAsyncioTestCase tests found by
+        # find_tests() that can share an event loop with others; see
+        # --async-concurrency.
+        self.async_test_names = set()
+
 
 class WinMultiprocessing(object):
     ignore = 'ignore'
@@ -100,6 +131,11 @@ class Runner(object):
 
     def __init__(self, host=None):
         self.args = None
+        self.baseline_times = None
+        self.expected_times = None
+        self.output_log_dir = None
+        self._made_output_log_dir = False
+        self.spill_dir = None
         self.classifier = None
         self.cov = None
         self.context = None
@@ -107,6 +143,9 @@ class Runner(object):
         self.host = host or Host()
         self.loader = unittest.loader.TestLoader()
         self.printer = None
+        self.dashboard = None
+        self.job_limiter = None
+        self.jobserver = None
         self.setup_fn = None
         self.stats = None
         self.teardown_fn = None
@@ -114,6 +153,12 @@ class Runner(object):
         self.top_level_dirs = []
         self.win_multiprocessing = WinMultiprocessing.spawn
         self.final_responses = []
+        self.worker_artifacts = []
+        self.phases = []
+
+        # Set when --fail-fast or --max-failures stops the run early.
+        self.interrupted = False
+        self._failed_names = set()
 
         # initialize self.args to the defaults.
         parser = ArgumentParser(self.host)
@@ -144,6 +189,8 @@ class Runner(object):
             return
 
     def print_(self, msg='', end='\n', stream=None):
+        if self.dashboard:
+            self.dashboard.clear()
         self.host.print_(msg, end, stream=stream)
 
     def run(self, test_set=None):
@@ -163,6 +210,28 @@ class Runner(object):
         if ret:
             return ret, None, None
 
+        if self.args.jobs > 1:
+            # Share the machine with the rest of a `make -j` build.
+            self.jobserver = jobserver.from_env(h)
+        if self._should_buffer_output():
+            h.buffer_output()
+        try:
+            return self._find_and_run_tests(test_set)
+        finally:
+            # Output is also flushed on failures and before anything is
+            # written to stderr; this makes sure nothing is left behind.
+            h.unbuffer_output()
+            if self._made_output_log_dir and not h.files_under(
+                    self.output_log_dir):
+                h.rmtree(self.output_log_dir)
+            if self.spill_dir:
+                h.rmtree(self.spill_dir)
+            if self.jobserver:
+                self.jobserver.close()
+
+    def _find_and_run_tests(self, test_set):
+        ret = 0
+        h = self.host
         find_start = h.time()
         if self.cov:  # pragma: no cover
             self.cov.erase()
@@ -185,7 +254,9 @@ class Runner(object):
 
         trace = self._trace_from_results(result_set)
         if full_results:
-            self._summarize(full_results)
+            summary_ret = self._summarize(full_results)
+            if not ret:
+                ret = summary_ret
             self._write(self.args.write_full_results_to, full_results)
             upload_ret = self._upload(full_results)
             if not ret:
@@ -195,13 +266,29 @@ class Runner(object):
             self._add_trace_event(trace, 'discovery', find_start, find_end)
             self._add_trace_event(trace, 'testing', find_end, test_end)
             self._add_trace_event(trace, 'reporting', test_end, reporting_end)
+            for name, start, end, jobs in self.phases:
+                self._add_trace_event(trace, name, start, end,
+                                      args={'jobs': jobs})
             self._write(self.args.write_trace_to, trace)
+            self.report_profile()
+            self.report_samples()
+            self.report_impact()
             self.report_coverage()
         else:
             upload_ret = 0
 
         return ret, full_results, trace
 
+    def _captures_fds(self):
+        return (self.args.capture == 'fd' and not self.args.passthrough and
+                not self.args.debugger)
+
+    def _should_buffer_output(self):
+        if self.args.buffer_output == 'auto':
+            return not (self.host.stdout.isatty() or self.args.passthrough or
+                        self.args.debugger)
+        return self.args.buffer_output == 'always'
+
     def _check_win_multiprocessing(self):
         wmp = self.win_multiprocessing
 
@@ -282,13 +369,72 @@ class Runner(object):
                                              should_delete_results)
         return ret, full_results, trace
 
+    def _read_times(self, paths, what):
+        h = self.host
+        all_times = []
+        for path in paths:
+            if not h.exists(path):
+                self.print_('%s "%s" does not exist' %
+                            (what.capitalize(), path), stream=h.stderr)
+                return None
+            try:
+                all_times.append(timing.times_from_json(
+                    json.loads(h.read_text_file(path))))
+            except ValueError as e:
+                self.print_('Failed to parse %s "%s": %s' %
+                            (what, path, e), stream=h.stderr)
+                return None
+        return timing.merge_times(all_times)
+
     def _set_up_runner(self):
         h = self.host
         args = self.args
 
+        if args.jobs == 'auto':
+            args.jobs = capacity.initial_jobs(h)
+            self.job_limiter = capacity.JobLimiter(h, args.jobs)
+
         self.stats = Stats(args.status_format, h.time, args.jobs)
         self.printer = Printer(
-            self.print_, args.overwrite, args.terminal_width)
+            self.print_, args.overwrite, args.terminal_width,
+            min_interval=args.redraw_interval, time_fn=h.time)
+        if args.impact_index and (args.coverage or args.debugger):
+            self.print_('--impact-index can not be used with --coverage or '
+                        '--debugger', stream=h.stderr)
+            return 1
+        if self._captures_fds() and args.pool == 'thread':
+            self.print_('--capture=fd can not be used with --pool=thread',
+                        stream=h.stderr)
+            return 1
+        if args.track_resources and args.pool == 'thread':
+            # getrusage() and tracemalloc both cover the whole process,
+            # not the thread running the test.
+            self.print_('--track-resources and --track-allocations can not '
+                        'be used with --pool=thread', stream=h.stderr)
+            return 1
+        if args.async_concurrency > 1 and (
+                self._captures_fds() or args.track_resources or
+                args.profile or args.sample_profile):
+            # These all work on the whole process (or thread), so they
+            # can't tell apart tests sharing an event loop.
+            self.print_('--async-concurrency can not be used with '
+                        '--capture=fd, --track-resources, '
+                        '--track-allocations, --profile or --sample-profile',
+                        stream=h.stderr)
+            return 1
+        if self._captures_fds():
+            self.output_log_dir = args.output_log_dir
+            if not self.output_log_dir:
+                self.output_log_dir = h.mkdtemp(prefix='typ_output_')
+                self._made_output_log_dir = True
+            h.maybe_mkdir(self.output_log_dir)
+
+        if (args.dashboard and args.overwrite and h.stdout.isatty() and
+                not args.quiet):
+            # The dashboard redraws itself with cursor movements, which
+            # would only clutter a log.
+            self.dashboard = Dashboard(h.print_, args.terminal_width, h.time,
+                                       min_interval=args.redraw_interval)
 
         if self.args.top_level_dirs and self.args.top_level_dir:
             self.print_(
@@ -327,6 +473,24 @@ class Runner(object):
         for path in args.path:
             h.add_to_path(path)
 
+        if args.compare_timings:
+            self.baseline_times = self._read_times(args.compare_timings,
+                                                   'baseline')
+            if self.baseline_times is None:
+                return 1
+
+        if args.timing_history:
+            history_times = self._read_times(args.timing_history,
+                                             'timing history')
+            if history_times is None:
+                return 1
+            self.expected_times = timing.expected_times(history_times)
+
+        if args.sample_profile and not profiler.can_sample():
+            self.print_('--sample-profile is not supported on %s' %
+                        h.platform, stream=h.stderr)
+            return 1
+
         if args.coverage:  # pragma: no cover
             try:
                 import coverage
@@ -372,6 +536,11 @@ class Runner(object):
                     self.print_(str(e))
                     return 1, None
 
+            if args.changed_since:
+                ret = self._select_changed_tests(test_set, args)
+                if ret:
+                    return ret, None
+
             # TODO: Add support for discovering setupProcess/teardownProcess?
 
             shard_index = args.shard_index
@@ -391,6 +560,69 @@ class Runner(object):
             unittest.skip = orig_skip
             unittest.skipIf = orig_skip_if
 
+    def _select_changed_tests(self, test_set, args):
+        h = self.host
+        try:
+            changed = deps.changed_files(h, args.changed_since,
+                                         self.top_level_dirs[0])
+            cache_path = args.deps_cache or deps.default_cache_path(
+                h, self.top_level_dirs[0])
+        except deps.GitError as e:
+            self.print_('--changed-since: %s' % e, stream=h.stderr)
+            return 1
+        index = {}
+        changed = set(h.realpath(path) for path in changed)
+        if args.impact_index:
+            index = impact.read_index(h, args.impact_index)
+            # Writing the index isn't a change to the code.
+            changed.discard(h.realpath(args.impact_index))
+        graph = deps.ImportGraph(h, self.top_level_dirs, cache_path)
+        graph.update()
+        affected = graph.affected_modules(changed)
+        if affected is None:
+            if not args.quiet:
+                self.print_('Changes since %s may affect any test.' %
+                            args.changed_since)
+            return 0
+
+        # The index only knows about the files tests called into. Files
+        # it has never seen (new ones, say) may still be imported by
+        # tests dynamically, so the import graph decides about those.
+        indexed_files = set()
+        for paths in index.values():
+            indexed_files.update(paths)
+        affected_by_unindexed = graph.affected_modules(changed -
+                                                       indexed_files)
+        imported = {}
+
+        def is_affected(test_input):
+            module = graph.module_for_test(test_input.name)
+            if test_input.name not in index:
+                # Keep the tests we can't place, to be safe.
+                return module is None or module in affected
+            paths = index[test_input.name]
+            if module is not None:
+                # The test may read anything its module imports while
+                # being loaded, without calling any of it.
+                if module not in imported:
+                    imported[module] = graph.imported_paths(module)
+                paths = paths | imported[module]
+            return (bool(paths & changed) or
+                    module in affected_by_unindexed)
+
+        num_tests = 0
+        num_selected = 0
+        for tests in (test_set.parallel_tests, test_set.isolated_tests,
+                      test_set.tests_to_skip):
+            selected = [t for t in tests if is_affected(t)]
+            num_tests += len(tests)
+            num_selected += len(selected)
+            tests[:] = selected
+        if not args.quiet:
+            self.print_('%d of %d tests are affected by changes since %s.' %
+                        (num_selected, num_tests, args.changed_since))
+        return 0
+
     def _name_list_from_args(self, args):
         if args.tests:
             names = args.tests
@@ -462,12 +694,25 @@ class Runner(object):
             self.print_('\n'.join(all_tests))
             return 0, None
 
-        self._run_one_set(self.stats, result_set, test_set)
+        # _run_one_set() consumes the lists, so keep the inputs around in
+        # case their failures need to be retried.
+        parallel_inputs = dict((t.name, t) for t in test_set.parallel_tests)
+        isolated_inputs = dict((t.name, t) for t in test_set.isolated_tests)
+        async_test_names = test_set.async_test_names
 
-        failed_tests = sorted(json_results.failed_test_names(result_set))
         retry_limit = self.args.retry_limit
+        if self.args.retry_policy == 'immediate':
+            # The failures are retried as they happen.
+            retry_limit = 0
+
+        # Failures only count towards --max-failures once they won't be
+        # retried any more.
+        self._run_one_set(self.stats, result_set, test_set,
+                          final_attempt=not retry_limit)
 
-        while retry_limit and failed_tests:
+        failed_tests = sorted(json_results.failed_test_names(result_set))
+
+        while retry_limit and failed_tests and not self.interrupted:
             if retry_limit == self.args.retry_limit:
                 self.flush()
                 self.args.overwrite = False
@@ -480,11 +725,29 @@ class Runner(object):
                          self.args.retry_limit))
             self.print_('')
 
-            stats = Stats(self.args.status_format, h.time, 1)
+            if self.args.retry_policy == 'parallel':
+                stats = Stats(self.args.status_format, h.time,
+                              self.args.jobs)
+                tests_to_retry = TestSet(
+                    parallel_tests=[parallel_inputs[n]
+                                    for n in sorted(failed_tests)
+                                    if n in parallel_inputs],
+                    isolated_tests=[isolated_inputs.get(n, n)
+                                    for n in sorted(failed_tests)
+                                    if n not in parallel_inputs])
+                tests_to_retry.async_test_names = async_test_names
+            else:
+                stats = Stats(self.args.status_format, h.time, 1)
+                tests_to_retry = TestSet(isolated_tests=list(failed_tests))
             stats.total = len(failed_tests)
-            tests_to_retry = TestSet(isolated_tests=list(failed_tests))
             retry_set = ResultSet()
-            self._run_one_set(stats, retry_set, tests_to_retry)
+            self._run_one_set(stats, retry_set, tests_to_retry,
+                              phase_prefix='retry #%d ' %
+                              (self.args.retry_limit - retry_limit + 1),
+                              final_attempt=retry_limit == 1)
+            for result in retry_set.results:
+                # Everything retried failed before.
+                result.flaky = result.actual == ResultType.Pass
             result_set.results.extend(retry_set.results)
             failed_tests = json_results.failed_test_names(retry_set)
             retry_limit -= 1
@@ -492,22 +755,51 @@ class Runner(object):
         if retry_limit != self.args.retry_limit:
             self.print_('')
 
-        full_results = json_results.make_full_results(self.args.metadata,
-                                                      int(h.time()),
-                                                      all_tests, result_set)
+        if self.interrupted:
+            self.flush()
+            self.print_('Stopped after %d failure%s.' %
+                        (len(self._failed_names),
+                         '' if len(self._failed_names) == 1 else 's'))
+
+        full_results = json_results.make_full_results(
+            self.args.metadata, int(h.time()), all_tests, result_set,
+            interrupted=self.interrupted)
 
         return (json_results.exit_code_from_full_results(full_results),
                 full_results)
 
-    def _run_one_set(self, stats, result_set, test_set):
+    def _run_one_set(self, stats, result_set, test_set, phase_prefix='',
+                     final_attempt=True):
         stats.total = (len(test_set.parallel_tests) +
                        len(test_set.isolated_tests) +
                        len(test_set.tests_to_skip))
+        if self.expected_times:
+            stats.set_estimates(self.expected_times,
+                                [t.name for t in test_set.parallel_tests],
+                                [t.name for t in test_set.isolated_tests])
         self._skip_tests(stats, result_set, test_set.tests_to_skip)
         self._run_list(stats, result_set,
-                       test_set.parallel_tests, self.args.jobs)
+                       _locked_first(self._batch_async_tests(test_set)),
+                       self.args.jobs, phase_prefix + 'parallel',
+                       final_attempt)
         self._run_list(stats, result_set,
-                       test_set.isolated_tests, 1)
+                       test_set.isolated_tests, 1,
+                       phase_prefix + 'isolated', final_attempt)
+
+    def _batch_async_tests(self, test_set):
+        concurrency = self.args.async_concurrency
+        if concurrency < 2 or not test_set.async_test_names:
+            return test_set.parallel_tests
+        # Tests holding locks have to be scheduled one by one.
+        async_tests = [t for t in test_set.parallel_tests
+                       if t.name in test_set.async_test_names and
+                       not t.locks]
+        other_tests = [t for t in test_set.parallel_tests
+                       if t.name not in test_set.async_test_names or
+                       t.locks]
+        # The batches go first, since they take longer than other tests.
+        return [_AsyncBatch(async_tests[i:i + concurrency])
+                for i in range(0, len(async_tests), concurrency)] + other_tests
 
     def _skip_tests(self, stats, result_set, tests_to_skip):
         for test_input in tests_to_skip:
@@ -523,34 +815,142 @@ class Runner(object):
             stats.finished += 1
             self._print_test_finished(stats, result)
 
-    def _run_list(self, stats, result_set, test_inputs, jobs):
+    def _run_list(self, stats, result_set, test_inputs, jobs, phase,
+                  final_attempt=True):
         h = self.host
         running_jobs = set()
+        held_locks = set()
+        running_inputs = {}
+        retries = {}
+        retry_limit = (self.args.retry_limit
+                       if self.args.retry_policy == 'immediate' else 0)
 
         jobs = min(len(test_inputs), jobs)
-        if not jobs:
+        if not jobs or self.interrupted:
             return
 
+        start = h.time()
+        stats.jobs = jobs
         child = _Child(self)
+        if (jobs > 1 and self.args.pool != 'thread' and
+                self.args.spill_output_bytes):
+            # Output only has to be spilled when it crosses processes.
+            if not self.spill_dir:
+                self.spill_dir = spill.make_spill_dir(h)
+            child.spill_dir = self.spill_dir
+        if (child.sample_profile and jobs > 1 and
+                self.args.pool == 'thread'):
+            # Only the main thread can install the SIGPROF handler, so
+            # the worker threads share a sampler started here.
+            child.sampler = profiler.Sampler(child.sample_interval,
+                                             stop_at=_run_one_test.__code__)
+            child.shared_sampler = True
+            child.sampler.start()
         pool = make_pool(h, jobs, _run_one_test, child,
-                         _setup_process, _teardown_process)
+                         _setup_process, _teardown_process,
+                         report_starts=bool(self.dashboard),
+                         pool_type=self.args.pool,
+                         max_messages=self.args.max_tests_per_worker,
+                         max_rss=self.args.max_worker_rss * 1024 * 1024)
         try:
-            while test_inputs or running_jobs:
-                while test_inputs and (len(running_jobs) < self.args.jobs):
-                    test_input = test_inputs.pop(0)
-                    stats.started += 1
+            while (test_inputs or running_jobs) and not self.interrupted:
+                while test_inputs and (len(running_jobs) <
+                                       self._max_running(running_jobs,
+                                                         jobs)):
+                    test_input = _pop_runnable(test_inputs, held_locks)
+                    if test_input is None:
+                        # Everything left waits for a lock to be released.
+                        break
                     pool.send(test_input)
                     running_jobs.add(test_input.name)
-                    self._print_test_started(stats, test_input)
-
-                result = pool.get()
-                running_jobs.remove(result.name)
-                result_set.add(result)
-                stats.finished += 1
-                self._print_test_finished(stats, result)
-            pool.close()
+                    held_locks.update(test_input.locks)
+                    running_inputs[test_input.name] = test_input
+                    stats.busy = len(running_jobs)
+                    for t in getattr(test_input, 'test_inputs',
+                                     [test_input]):
+                        stats.started += 1
+                        self._print_test_started(stats, t)
+                if self.jobserver:
+                    # Give back the tokens we don't need any more.
+                    self.jobserver.release_to(len(running_jobs) - 1)
+                self._update_dashboard(stats, pool)
+
+                result = pool.get(timeout=_earliest(
+                    self.printer.pending_delay(), h.output_flush_delay(),
+                    self.dashboard and self.dashboard.refresh_delay(),
+                    self.job_limiter and self.job_limiter.refresh_delay(),
+                    self.jobserver.poll_delay()
+                    if self.jobserver and test_inputs else None))
+                if result is None:
+                    if self.printer.pending_delay() == 0:
+                        self.printer.refresh()
+                    if h.output_flush_delay() == 0:
+                        h.flush_output()
+                    self._update_dashboard(stats, pool)
+                    continue
+                results = result if isinstance(result, list) else [result]
+                running_jobs.remove(results[0].name)
+                stats.busy = len(running_jobs)
+                test_input = running_inputs.pop(results[0].name)
+                held_locks.difference_update(test_input.locks)
+                inputs = dict((t.name, t) for t in
+                              getattr(test_input, 'test_inputs',
+                                      [test_input]))
+                for result in results:
+                    if (retries.get(result.name) and
+                            result.actual == ResultType.Pass):
+                        result.flaky = True
+                    result_set.add(result)
+                    stats.finished += 1
+                    self._print_test_finished(stats, result)
+                    if (result.actual == ResultType.Failure and
+                            retries.get(result.name, 0) < retry_limit):
+                        # Retry it on whichever worker is free once the
+                        # tests already queued have started, which is
+                        # usually not the one it just failed on.
+                        retries[result.name] = retries.get(result.name,
+                                                           0) + 1
+                        test_inputs.append(inputs[result.name])
+                        stats.total += 1
+                    elif (result.actual == ResultType.Failure and
+                          result.unexpected and final_attempt):
+                        self._add_failure(result.name)
+                self._update_dashboard(stats, pool)
+            if not self.interrupted:
+                pool.close()
+            # Otherwise, leaving the pool open makes join() terminate the
+            # workers along with whatever they are still running.
         finally:
-            self.final_responses.extend(pool.join())
+            if self.dashboard:
+                self.dashboard.clear()
+            if self.jobserver:
+                self.jobserver.release_all()
+            for worker_num, res, e, artifacts in pool.join():
+                self.final_responses.append((worker_num, res, e))
+                self.worker_artifacts.append(artifacts)
+            if child.shared_sampler:
+                child.sampler.stop()
+                self.worker_artifacts.append(
+                    {'samples': child.sampler.samples})
+            self.phases.append((phase, start, h.time(), jobs))
+
+    def _add_failure(self, test_name):
+        self._failed_names.add(test_name)
+        max_failures = 1 if self.args.fail_fast else self.args.max_failures
+        if max_failures and len(self._failed_names) >= max_failures:
+            self.interrupted = True
+
+    def _max_running(self, running_jobs, jobs):
+        if self.job_limiter and jobs > 1:
+            jobs = min(jobs, self.job_limiter.jobs(len(running_jobs)))
+        if (self.jobserver and len(running_jobs) < jobs and
+                self.jobserver.held < len(running_jobs)):
+            # Our own implicit token runs the first test; every other
+            # test needs a token from the jobserver.
+            self.jobserver.acquire()
+        if self.jobserver:
+            jobs = min(jobs, self.jobserver.held + 1)
+        return jobs
 
     def _print_test_started(self, stats, test_input):
         if self.args.quiet:
@@ -571,7 +971,7 @@ class Runner(object):
             self.update(test_start_msg, elide=(not self.args.verbose))
 
     def _print_test_finished(self, stats, result):
-        stats.add_time()
+        stats.add_time(result.took, result.name)
 
         assert result.actual in [ResultType.Failure, ResultType.Skip,
                                  ResultType.Pass]
@@ -584,7 +984,11 @@ class Runner(object):
 
         if result.unexpected:
             result_str += ' unexpectedly'
-        if self.args.timing:
+        if self.args.timing and result.resources:
+            cpu_time = (result.resources['user_time'] +
+                        result.resources['system_time'])
+            timing_str = ' %.4fs (%.4fs cpu)' % (result.took, cpu_time)
+        elif self.args.timing:
             timing_str = ' %.4fs' % result.took
         else:
             timing_str = ''
@@ -599,6 +1003,8 @@ class Runner(object):
                 self.print_('  %s' % l)
             for l in err.splitlines():
                 self.print_('  %s' % l)
+            # Don't leave a failure sitting in the buffer.
+            self.host.flush_output()
         elif not self.args.quiet:
             if self.args.verbose > 1 and (out or err):
                 suffix += ':\n'
@@ -612,7 +1018,21 @@ class Runner(object):
             if self.args.verbose:
                 self.flush()
 
+    def _update_dashboard(self, stats, pool):
+        if self.dashboard:
+            # The dashboard has to start on a line of its own.
+            self.printer.flush()
+            running = dict((worker_num, (test_input.name, started))
+                           for worker_num, (test_input, started)
+                           in pool.running.items())
+            self.dashboard.update(stats, running)
+
     def update(self, msg, elide):
+        if self.dashboard:
+            if elide:
+                # The dashboard already shows what is running.
+                return
+            self.dashboard.clear()
         self.printer.update(msg, elide)
 
     def flush(self):
@@ -622,24 +1042,60 @@ class Runner(object):
         num_passes = json_results.num_passes(full_results)
         num_failures = json_results.num_failures(full_results)
         num_skips = json_results.num_skips(full_results)
+        num_not_run = json_results.num_not_run(full_results)
+
+        regressions = []
+        if self.baseline_times is not None:
+            regressions = timing.find_regressions(
+                self.baseline_times, json_results.times_by_test(full_results),
+                self.args.timing_regression_threshold,
+                self.args.timing_regression_min_delta)
+        ret = 0
+        if regressions and self.args.fail_on_timing_regressions:
+            ret = 1
 
-        if self.args.quiet and num_failures == 0:
-            return
+        if self.args.quiet and num_failures == 0 and ret == 0:
+            return ret
 
         if self.args.timing:
             timing_clause = ' in %.1fs' % (self.host.time() -
                                            self.stats.started_time)
         else:
             timing_clause = ''
-        self.update('%d test%s passed%s, %d skipped, %d failure%s.' %
+        not_run_clause = ''
+        if num_not_run:
+            not_run_clause = ', %d not run' % num_not_run
+        self.update('%d test%s passed%s, %d skipped, %d failure%s%s.' %
                     (num_passes,
                      '' if num_passes == 1 else 's',
                      timing_clause,
                      num_skips,
                      num_failures,
-                     '' if num_failures == 1 else 's'), elide=False)
+                     '' if num_failures == 1 else 's',
+                     not_run_clause), elide=False)
         self.print_()
 
+        if self.args.report_slowest:
+            slowest = timing.slowest(json_results.times_by_test(full_results),
+                                     self.args.report_slowest)
+            self.print_('Slowest %d test%s:' % (len(slowest),
+                                                '' if len(slowest) == 1
+                                                else 's'))
+            for name, took in slowest:
+                self.print_('  %9.4fs %s' % (took, name))
+
+        if self.baseline_times is not None:
+            if regressions:
+                self.print_('%d test%s got slower than the baseline:' %
+                            (len(regressions),
+                             '' if len(regressions) == 1 else 's'))
+            else:
+                self.print_('No tests got slower than the baseline.')
+            for r in regressions:
+                self.print_('  %9.4fs (was %.4fs, %+.1f%%) %s' %
+                            (r.took, r.baseline, r.percent, r.name))
+        return ret
+
     def _read_and_delete(self, path, delete):
         h = self.host
         obj = None
@@ -672,6 +1128,51 @@ class Runner(object):
             h.print_('Uploading the JSON results raised "%s"' % str(e))
             return 1
 
+    def report_profile(self):
+        if not self.args.profile:
+            return
+        stats = profiler.merge_stats(
+            artifacts.get('profile') for artifacts in self.worker_artifacts)
+        if not stats:
+            self.print_('No tests were profiled.')
+            return
+        profiler.dump_stats(self.host, self.args.profile_output, stats)
+        self.print_('Wrote the profile to %s; top %d functions:' %
+                    (self.args.profile_output, self.args.profile_top))
+        self.print_(profiler.format_stats(stats, self.args.profile_top),
+                    end='')
+
+    def report_samples(self):
+        if not self.args.sample_profile:
+            return
+        samples = profiler.merge_samples(
+            artifacts.get('samples') for artifacts in self.worker_artifacts)
+        path = self.args.sample_profile
+        self.host.write_text_file(path, profiler.format_collapsed(samples))
+        self.host.write_text_file(path + '.json',
+                                  profiler.flamegraph_json(samples))
+        total = sum(samples.values())
+        self.print_('Wrote %d stack sample%s to %s and %s.json.' %
+                    (total, '' if total == 1 else 's', path, path))
+        if total:
+            self.print_('Hottest functions across all tests:')
+        for label, count in profiler.hottest_frames(samples,
+                                                    self.args.profile_top):
+            self.print_('  %5.1f%% %s' % (count * 100.0 / total, label))
+
+    def report_impact(self):
+        if not self.args.impact_index:
+            return
+        tests = impact.read_index(self.host, self.args.impact_index)
+        num_tests = 0
+        for artifacts in self.worker_artifacts:
+            num_tests += len(artifacts.get('impact', {}))
+            tests.update(artifacts.get('impact', {}))
+        impact.write_index(self.host, self.args.impact_index, tests)
+        self.print_('Recorded the files run by %d test%s in %s.' %
+                    (num_tests, '' if num_tests == 1 else 's',
+                     self.args.impact_index))
+
     def report_coverage(self):
         if self.args.coverage:  # pragma: no cover
             self.host.print_()
@@ -683,7 +1184,7 @@ class Runner(object):
             if self.args.coverage_annotate:
                 cov.annotate(omit=self.args.coverage_omit)
 
-    def _add_trace_event(self, trace, name, start, end):
+    def _add_trace_event(self, trace, name, start, end, args=None):
         event = {
             'name': name,
             'ts': int((start - self.stats.started_time) * 1000000),
@@ -692,6 +1193,8 @@ class Runner(object):
             'pid': self.host.getpid(),
             'tid': 0,
         }
+        if args:
+            event['args'] = args
         trace['traceEvents'].append(event)
 
     def _trace_from_results(self, result_set):
@@ -701,8 +1204,12 @@ class Runner(object):
         for m in self.args.metadata:
             k, v = m.split('=')
             trace['otherData'][k] = v
+        if self.interrupted:
+            trace['otherData']['interrupted'] = True
 
+        attempts = {}
         for result in result_set.results:
+            attempts[result.name] = attempts.get(result.name, 0) + 1
             started = int((result.started - self.stats.started_time) * 1000000)
             took = int(result.took * 1000000)
             event = OrderedDict()
@@ -721,29 +1228,59 @@ class Runner(object):
             args['code'] = result.code
             args['unexpected'] = result.unexpected
             args['flaky'] = result.flaky
+            if attempts[result.name] > 1:
+                args['attempt'] = attempts[result.name]
+            if result.resources:
+                args['resources'] = result.resources
             event['args'] = args
 
             trace['traceEvents'].append(event)
         return trace
 
 
+def _earliest(*delays):
+    delays = [d for d in delays if d is not None]
+    return min(delays) if delays else None
+
+
 def _matches(name, globs):
     return any(fnmatch.fnmatch(name, glob) for glob in globs)
 
 
 def _default_classifier(args):
+    isolate = [glob for glob in args.isolate if '=' not in glob]
+    lock_globs = [glob.split('=', 1) for glob in args.isolate
+                  if '=' in glob]
+
     def default_classifier(test_set, test):
         name = test.id()
         if not args.all and _matches(name, args.skip):
             test_set.tests_to_skip.append(TestInput(name,
                                                     'skipped by request'))
-        elif _matches(name, args.isolate):
+        elif _matches(name, isolate):
             test_set.isolated_tests.append(TestInput(name))
         else:
-            test_set.parallel_tests.append(TestInput(name))
+            locks = [lock for glob, lock in lock_globs
+                     if fnmatch.fnmatch(name, glob)]
+            test_set.parallel_tests.append(TestInput(name, locks=locks))
     return default_classifier
 
 
+def _locked_first(test_inputs):
+    # Tests sharing a lock run one after another, so they are started
+    # first to keep them from running on alone at the end.
+    return ([t for t in test_inputs if t.locks] +
+            [t for t in test_inputs if not t.locks])
+
+
+def _pop_runnable(test_inputs, held_locks):
+    """Removes and returns the first test whose locks aren't held."""
+    for i, test_input in enumerate(test_inputs):
+        if not test_input.locks & held_locks:
+            return test_inputs.pop(i)
+    return None
+
+
 def _test_adder(test_set, classifier):
     def add_tests(obj):
         if isinstance(obj, unittest.suite.TestSuite):
@@ -765,9 +1302,40 @@ def _test_adder(test_set, classifier):
         else:
             assert isinstance(obj, unittest.TestCase)
             classifier(test_set, obj)
+            if _is_async_test(obj) and not _has_shared_fixtures(obj):
+                test_set.async_test_names.add(obj.id())
     return add_tests
 
 
+def _is_async_test(test):
+    cls = getattr(unittest, 'IsolatedAsyncioTestCase', None)
+    return cls is not None and isinstance(test, cls)
+
+
+def _has_shared_fixtures(test):
+    # A batch runs each test on its own rather than in a suite, so there
+    # is nothing to run setUpClass() and setUpModule() and the like.
+    cls = type(test)
+    for name in ('setUpClass', 'tearDownClass'):
+        if (getattr(getattr(cls, name), '__func__', None) is not
+                getattr(unittest.TestCase, name).__func__):
+            return True
+    module = sys.modules.get(cls.__module__)
+    return any(hasattr(module, name)
+               for name in ('setUpModule', 'tearDownModule'))
+
+
+class _AsyncBatch(object):
+    """Coroutine tests for one worker to run concurrently.
+
+    The worker returns a list with a Result for each of them."""
+
+    def __init__(self, test_inputs):
+        self.test_inputs = test_inputs
+        self.name = test_inputs[0].name
+        self.locks = frozenset()
+
+
 class _Child(object):
 
     def __init__(self, parent):
@@ -775,11 +1343,33 @@ class _Child(object):
         self.worker_num = None
         self.all = parent.args.all
         self.debugger = parent.args.debugger
-        self.coverage = parent.args.coverage and parent.args.jobs > 1
+        self.coverage = (parent.args.coverage and parent.args.jobs > 1 and
+                         parent.args.pool != 'thread')
         self.coverage_source = parent.coverage_source
         self.dry_run = parent.args.dry_run
         self.loader = parent.loader
         self.passthrough = parent.args.passthrough
+        self.capture_fds = (parent.args.capture == 'fd' and
+                            not self.passthrough and not self.debugger)
+        self.capture_threads = parent.args.pool == 'thread'
+        self.max_output_bytes = parent.args.max_output_bytes
+        self.output_log_dir = parent.output_log_dir
+        self.spill_dir = None
+        self.spill_output_bytes = parent.args.spill_output_bytes
+        self.spiller = None
+        self.profile = parent.args.profile
+        self.profile_filter = parent.args.profile_filter
+        self.profiler = None
+        self.sample_profile = bool(parent.args.sample_profile)
+        self.sample_interval = parent.args.sample_interval
+        self.sampler = None
+        self.shared_sampler = False
+        self.impact = bool(parent.args.impact_index)
+        self.impact_tracer = None
+        self.impact_files = {}
+        self.track_resources = parent.args.track_resources
+        self.track_allocations = (parent.args.track_allocations and
+                                  tracemalloc is not None)
         self.context = parent.context
         self.setup_fn = parent.setup_fn
         self.teardown_fn = parent.teardown_fn
@@ -802,6 +1392,21 @@ def _setup_process(host, worker_num, child):
         child.cov._warn_no_data = False
         child.cov.start()
 
+    if child.profile:
+        child.profiler = cProfile.Profile()
+
+    if child.spill_dir:
+        child.spiller = spill.Spiller(child.spill_dir, worker_num,
+                                      child.spill_output_bytes)
+
+    if child.impact and not child.dry_run:
+        child.impact_tracer = impact.FileTracer()
+
+    if child.sample_profile and not child.shared_sampler:
+        child.sampler = profiler.Sampler(child.sample_interval,
+                                         stop_at=_run_one_test.__code__)
+        child.sampler.start()
+
     if child.setup_fn:
         child.context_after_setup = child.setup_fn(child, child.context)
     else:
@@ -822,10 +1427,30 @@ def _teardown_process(child):
         child.cov.stop()
         child.cov.save()
 
-    return (child.worker_num, res, e)
+    if child.spiller:
+        child.spiller.close()
+
+    artifacts = {}
+    if child.profiler:
+        # The profiler is enabled and disabled around each test, so its
+        # stats already aggregate everything this worker ran.
+        child.profiler.create_stats()
+        artifacts['profile'] = child.profiler.stats
+    if child.sampler and not child.shared_sampler:
+        child.sampler.stop()
+        artifacts['samples'] = child.sampler.samples
+    if child.impact_tracer:
+        artifacts['impact'] = child.impact_files
+
+    # The runner splits |artifacts| off into Runner.worker_artifacts, so
+    # Runner.final_responses keeps its (worker_num, result, error) shape.
+    return (child.worker_num, res, e, artifacts)
 
 
 def _run_one_test(child, test_input):
+    if isinstance(test_input, _AsyncBatch):
+        return _run_async_batch(child, test_input)
+
     h = child.host
     pid = h.getpid()
     test_name = test_input.name
@@ -839,8 +1464,78 @@ def _run_one_test(child, test_input):
     #    uncaptured stdout or stderr that later is used when the test is run.
     # This comes up when using the FakeTestLoader and testing typ itself,
     # but could come up when testing non-typ code as well.
-    h.capture_output(divert=not child.passthrough)
+    _capture_output(child)
 
+    suite, ex_str = _load_test(child, test_name)
+    tests = list(suite)
+    if len(tests) != 1:
+        _restore_output(child)
+        return _load_failure(child, test_name, ex_str, start, pid)
+
+    test_case = tests[0]
+    if isinstance(test_case, TypTestCase):
+        test_case.child = child
+        test_case.context = child.context_after_setup
+
+    test_result = unittest.TestResult()
+    out = ''
+    err = ''
+    profiler_to_use = None
+    if child.profiler and (not child.profile_filter or
+                           _matches(test_name, child.profile_filter)):
+        profiler_to_use = child.profiler
+    if child.sampler:
+        child.sampler.test_started(test_name)
+    usage_before = h.getrusage() if child.track_resources else None
+    alloc_state = None
+    if child.track_allocations:
+        alloc_state = _start_tracing_allocations()
+    if child.impact_tracer:
+        child.impact_tracer.start()
+    try:
+        if child.dry_run:
+            pass
+        elif child.debugger:  # pragma: no cover
+            _run_under_debugger(h, test_case, suite, test_result)
+        elif profiler_to_use:
+            profiler_to_use.enable()
+            try:
+                suite.run(test_result)
+            finally:
+                profiler_to_use.disable()
+        else:
+            suite.run(test_result)
+    finally:
+        if child.impact_tracer:
+            child.impact_files[test_name] = impact.files_under(
+                child.impact_tracer.stop(), child.top_level_dirs)
+        if child.sampler:
+            child.sampler.test_finished()
+        resources = None
+        if usage_before:
+            resources = _resource_usage(h, usage_before, h.getrusage())
+        if alloc_state:
+            alloc_peak = _stop_tracing_allocations(alloc_state)
+            if resources is not None:
+                resources['alloc_peak'] = alloc_peak
+        out, err, truncated = _restore_output(child)
+
+    if truncated and (test_result.failures or test_result.errors):
+        path = h.join(child.output_log_dir, test_name)
+        h.save_fd_output(path + '.out', path + '.err')
+        err += ('\nThe full output was saved to %s.out and %s.err.\n' %
+                (path, path))
+
+    took = h.time() - start
+    result = _result_from_test_result(test_result, test_name, start, took,
+                                      out, err, child.worker_num, pid,
+                                      resources)
+    _spill_output(child, result)
+    return result
+
+
+def _load_test(child, test_name):
+    """Returns (a suite with the test, any errors hit loading it)."""
     ex_str = ''
     try:
         orig_skip = unittest.skip
@@ -865,39 +1560,127 @@ def _run_one_test(child, test_input):
     finally:
         unittest.skip = orig_skip
         unittest.skipIf = orig_skip_if
+    return suite, ex_str
 
-    tests = list(suite)
-    if len(tests) != 1:
-        err = 'Failed to load "%s" in run_one_test' % test_name
-        if ex_str:  # pragma: untested
-            err += '\n  ' + '\n  '.join(ex_str.splitlines())
 
-        h.restore_output()
-        return Result(test_name, ResultType.Failure, start, 0,
-                      child.worker_num, unexpected=True, code=1,
-                      err=err, pid=pid)
+def _load_failure(child, test_name, ex_str, start, pid):
+    err = 'Failed to load "%s" in run_one_test' % test_name
+    if ex_str:  # pragma: untested
+        err += '\n  ' + '\n  '.join(ex_str.splitlines())
+    return Result(test_name, ResultType.Failure, start, 0,
+                  child.worker_num, unexpected=True, code=1,
+                  err=err, pid=pid)
 
-    test_case = tests[0]
-    if isinstance(test_case, TypTestCase):
-        test_case.child = child
-        test_case.context = child.context_after_setup
 
-    test_result = unittest.TestResult()
-    out = ''
-    err = ''
-    try:
-        if child.dry_run:
-            pass
-        elif child.debugger:  # pragma: no cover
-            _run_under_debugger(h, test_case, suite, test_result)
-        else:
-            suite.run(test_result)
-    finally:
-        out, err = h.restore_output()
+def _run_async_batch(child, batch):
+    # Imported here because it is Python 3 only.
+    from typ import aio  # pylint: disable=import-outside-toplevel
 
-    took = h.time() - start
-    return _result_from_test_result(test_result, test_name, start, took, out,
-                                    err, child.worker_num, pid)
+    h = child.host
+    pid = h.getpid()
+    results = {}
+    names = {}
+    async_tests = []
+    for test_input in batch.test_inputs:
+        start = h.time()
+        h.capture_thread_output()
+        suite, ex_str = _load_test(child, test_input.name)
+        tests = list(suite)
+        h.restore_thread_output()
+        if len(tests) != 1:
+            results[test_input.name] = _load_failure(
+                child, test_input.name, ex_str, start, pid)
+            _spill_output(child, results[test_input.name])
+        elif not _is_async_test(tests[0]):
+            results[test_input.name] = _run_one_test(child, test_input)
+        else:
+            names[id(tests[0])] = test_input.name
+            async_tests.append(tests[0])
+
+    def start_fn(test_case):
+        if isinstance(test_case, TypTestCase):
+            test_case.child = child
+            test_case.context = child.context_after_setup
+        h.capture_thread_output(divert=not child.passthrough)
+        return h.time()
+
+    def finish_fn(test_case, test_result, start):
+        out, err = h.restore_thread_output()
+        result = _result_from_test_result(
+            test_result, names[id(test_case)], start, h.time() - start,
+            out, err, child.worker_num, pid)
+        _spill_output(child, result)
+        return result
+
+    if async_tests:
+        for result in aio.run_tests(async_tests, len(async_tests),
+                                    start_fn, finish_fn):
+            results[result.name] = result
+    return [results[test_input.name] for test_input in batch.test_inputs]
+
+
+def _spill_output(child, result):
+    if child.spiller:
+        result.out = child.spiller.spill(result.out)
+        result.err = child.spiller.spill(result.err)
+
+
+def _capture_output(child):
+    if child.capture_fds:
+        child.host.capture_fd_output()
+    elif child.capture_threads:
+        child.host.capture_thread_output(divert=not child.passthrough)
+    else:
+        child.host.capture_output(divert=not child.passthrough)
+
+
+def _restore_output(child):
+    """Returns (out, err, whether either was cut short)."""
+    if child.capture_fds:
+        return child.host.restore_fd_output(child.max_output_bytes)
+    if child.capture_threads:
+        out, err = child.host.restore_thread_output()
+        return out, err, False
+    out, err = child.host.restore_output()
+    return out, err, False
+
+
+def _start_tracing_allocations():
+    # If tracing was already on (e.g., via PYTHONTRACEMALLOC, or because
+    # the test runs in the same process as the caller of typ), leave it
+    # on and measure relative to where it was.
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    elif hasattr(tracemalloc, 'reset_peak'):  # pragma: no cover
+        tracemalloc.reset_peak()
+    return started, tracemalloc.get_traced_memory()[0]
+
+
+def _stop_tracing_allocations(alloc_state):
+    started, base = alloc_state
+    current, peak = tracemalloc.get_traced_memory()
+    if started:
+        tracemalloc.stop()
+    elif not hasattr(tracemalloc, 'reset_peak'):  # pragma: no cover
+        # Before 3.9 the peak can't be reset, so it may predate the
+        # test; the growth in traced memory is the best we can do.
+        peak = current
+    return max(0, peak - base)
+
+
+def _resource_usage(host, before, after):
+    # ru_maxrss is in kilobytes everywhere except on Mac, where it is bytes.
+    rss_scale = 1024 if host.platform == 'darwin' else 1
+    usage = OrderedDict()
+    usage['user_time'] = round(after.ru_utime - before.ru_utime, 4)
+    usage['system_time'] = round(after.ru_stime - before.ru_stime, 4)
+    usage['max_rss_kb'] = after.ru_maxrss // rss_scale
+    usage['max_rss_growth_kb'] = (after.ru_maxrss -
+                                  before.ru_maxrss) // rss_scale
+    usage['voluntary_switches'] = after.ru_nvcsw - before.ru_nvcsw
+    usage['involuntary_switches'] = after.ru_nivcsw - before.ru_nivcsw
+    return usage
 
 
 def _run_under_debugger(host, test_case, suite,
@@ -912,7 +1695,7 @@ def _run_under_debugger(host, test_case, suite,
 
 
 def _result_from_test_result(test_result, test_name, start, took, out, err,
-                             worker_num, pid):
+                             worker_num, pid, resources=None):
     flaky = False
     if test_result.failures:
         expected = [ResultType.Pass]
@@ -950,7 +1733,8 @@ def _result_from_test_result(test_result, test_name, start, took, out, err,
         unexpected = False
 
     return Result(test_name, actual, start, took, worker_num,
-                  expected, unexpected, flaky, code, out, err, pid)
+                  expected, unexpected, flaky, code, out, err, pid,
+                  resources)
 
 
 def _load_via_load_tests(child, test_name):
@@ -0,0 +1,92 @@
+# Copyright 2014 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Passes large test output from workers to the runner outside the queue.
+
+A result carrying megabytes of output would otherwise be pickled, pushed
+through the pool's single response queue and unpickled by the runner,
+even if nobody ever looks at the output. Instead, each worker appends
+large output to a file of its own, and the result only carries a small
+SpilledText pointing into it. The runner maps the file and decodes the
+text the first time it is needed (see json_results.Result).
+
+The files go in /dev/shm when it exists, so that they stay in memory.
+"""
+
+import mmap
+import os
+
+
+SHM_DIR = '/dev/shm'
+
+
+def make_spill_dir(host):
+    """Returns a new directory for the workers' spill files."""
+    if host.isdir(SHM_DIR):  # pragma: no win32
+        return host.mkdtemp(prefix='typ_spill_', dir=SHM_DIR)
+    return host.mkdtemp(prefix='typ_spill_')  # pragma: win32
+
+
+class SpilledText(object):
+    """Text that a worker wrote to its spill file."""
+
+    def __init__(self, path, offset, length):
+        self.path = path
+        self.offset = offset
+        self.length = length
+
+    def read(self):
+        if not self.length:
+            return u''
+        with open(self.path, 'rb') as f:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                data = m[self.offset:self.offset + self.length]
+            finally:
+                m.close()
+        return data.decode('utf-8', 'replace')
+
+
+class Spiller(object):
+    """Appends text to a per-worker file in |dirname|.
+
+    Text shorter than |threshold| bytes is returned as is. The file is
+    named after the worker number and the process, and is only ever
+    appended to: a worker that replaces a retired one gets the same
+    number, and later phases of the run share |dirname|, while results
+    may still point into what earlier workers wrote."""
+
+    def __init__(self, dirname, worker_num, threshold):
+        self.path = os.path.join(dirname,
+                                 'worker-%d-%d' % (worker_num, os.getpid()))
+        self.threshold = threshold
+        self._fd = None
+
+    def spill(self, text):
+        data = text.encode('utf-8')
+        if len(data) < self.threshold:
+            return text
+        if self._fd is None:
+            self._fd = os.open(self.path,
+                               os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        offset = os.lseek(self._fd, 0, os.SEEK_END)
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self._fd, view):]
+        return SpilledText(self.path, offset, len(data))
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -12,72 +12,222 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import heapq
+
 
 class Stats(object):
+    """Formats Ninja-style status lines.
+
+    The format is parsed once (whenever it is set) into a list of
+    segment renderers, so format() only has to call each of them. In
+    addition to Ninja's directives (%c %e %f %o %p %r %s %t %u and %%),
+    %E is the estimated time remaining, %P is the 95th percentile of the
+    durations passed to add_time(), and %w is the percentage of the
+    |jobs| workers currently running that are busy. A worker running a
+    batch of tests is only busy once, so the runner sets |busy| when it
+    knows better than started - finished.
+
+    Without set_estimates(), %E assumes the remaining tests finish at the
+    overall rate so far. With it, %E is the predicted duration of the
+    tests that haven't finished, spread over |jobs| workers for parallel
+    tests and run back to back for isolated ones, and scaled by how fast
+    the tests that have finished ran compared to their predictions.
+    """
 
     def __init__(self, status_format, time_fn, size):
-        self.fmt = status_format
         self.finished = 0
         self.started = 0
+        self.busy = None
         self.total = 0
+        self.jobs = size
         self.started_time = time_fn()
         self._times = []
         self._size = size
         self._time = time_fn
         self._times.append(self.started_time)
+        self._durations = _Percentile(95)
+        self._estimates = None
+        self._isolated = None
+        self._remaining_parallel = 0.0
+        self._remaining_isolated = 0.0
+        self._predicted_done = 0.0
+        self._actual_done = 0.0
+        self._segments = []
+        self.fmt = status_format
+
+    @property
+    def fmt(self):
+        return self._fmt
+
+    @fmt.setter
+    def fmt(self, status_format):
+        self._fmt = status_format
+        self._segments = self._compile(status_format)
 
-    def add_time(self):
+    def add_time(self, took=None, name=None):
         if len(self._times) > self._size:
             self._times.pop(0)
         self._times.append(self._time())
+        if took is not None:
+            self._durations.add(took)
+        if self._estimates and name in self._estimates:
+            predicted = self._estimates.pop(name)
+            if name in self._isolated:
+                self._remaining_isolated -= predicted
+            else:
+                self._remaining_parallel -= predicted
+            if took is not None:
+                self._predicted_done += predicted
+                self._actual_done += took
+
+    def set_estimates(self, expected_times, parallel_tests, isolated_tests):
+        """Predicts the durations of the tests about to run.
+
+        |expected_times| maps test names to expected seconds, e.g. from
+        earlier runs. Tests it doesn't know about are assumed to take the
+        average time of the ones it does; if it knows none of them, %E
+        falls back to the overall rate."""
+        names = list(parallel_tests) + list(isolated_tests)
+        known = [expected_times[n] for n in names if n in expected_times]
+        if not known:
+            self._estimates = None
+            return
+        default = sum(known) / len(known)
+        self._estimates = dict((n, expected_times.get(n, default))
+                               for n in names)
+        self._isolated = set(isolated_tests)
+        self._remaining_parallel = sum(self._estimates[n]
+                                       for n in parallel_tests)
+        self._remaining_isolated = sum(self._estimates[n]
+                                       for n in isolated_tests)
+        self._predicted_done = 0.0
+        self._actual_done = 0.0
 
     def format(self):
-        # Too many statements pylint: disable=R0915
-        out = ''
+        return ''.join([render() for render in self._segments])
+
+    def _compile(self, fmt):
+        directives = {
+            'E': self._eta,
+            'P': self._p95,
+            'c': self._current_rate,
+            'e': self._elapsed,
+            'f': lambda: str(self.finished),
+            'o': self._overall_rate,
+            'p': self._percent_started,
+            'r': lambda: str(self.started - self.finished),
+            's': lambda: str(self.started),
+            't': lambda: str(self.total),
+            'u': lambda: str(self.total - self.finished),
+            'w': self._utilization,
+        }
+        segments = []
+        literal = ''
         p = 0
-        end = len(self.fmt)
+        end = len(fmt)
         while p < end:
-            c = self.fmt[p]
+            c = fmt[p]
             if c == '%' and p < end - 1:
-                cn = self.fmt[p + 1]
-                if cn == 'c':
-                    elapsed = self._times[-1] - self._times[0]
-                    if elapsed > 0:
-                        out += '%5.1f' % ((len(self._times) - 1) / elapsed)
-                    else:
-                        out += '-'
-                elif cn == 'e':
-                    now = self._time()
-                    assert now >= self.started_time
-                    out += '%-5.3f' % (now - self.started_time)
-                elif cn == 'f':
-                    out += str(self.finished)
-                elif cn == 'o':
-                    now = self._time()
-                    if now > self.started_time:
-                        out += '%5.1f' % (self.finished * 1.0 /
-                                          (now - self.started_time))
-                    else:
-                        out += '-'
-                elif cn == 'p':
-                    if self.total:
-                        out += '%5.1f' % (self.started * 100.0 / self.total)
-                    else:
-                        out += '-'
-                elif cn == 'r':
-                    out += str(self.started - self.finished)
-                elif cn == 's':
-                    out += str(self.started)
-                elif cn == 't':
-                    out += str(self.total)
-                elif cn == 'u':
-                    out += str(self.total - self.finished)
+                cn = fmt[p + 1]
+                if cn in directives:
+                    if literal:
+                        segments.append(_literal(literal))
+                        literal = ''
+                    segments.append(directives[cn])
                 elif cn == '%':
-                    out += '%'
+                    literal += '%'
                 else:
-                    out += c + cn
+                    literal += c + cn
                 p += 2
             else:
-                out += c
+                literal += c
                 p += 1
-        return out
+        if literal:
+            segments.append(_literal(literal))
+        return segments
+
+    def _current_rate(self):
+        elapsed = self._times[-1] - self._times[0]
+        if elapsed > 0:
+            return '%5.1f' % ((len(self._times) - 1) / elapsed)
+        return '-'
+
+    def _elapsed(self):
+        now = self._time()
+        assert now >= self.started_time
+        return '%-5.3f' % (now - self.started_time)
+
+    def _overall_rate(self):
+        now = self._time()
+        if now > self.started_time:
+            return '%5.1f' % (self.finished * 1.0 /
+                              (now - self.started_time))
+        return '-'
+
+    def _percent_started(self):
+        if self.total:
+            return '%5.1f' % (self.started * 100.0 / self.total)
+        return '-'
+
+    def _eta(self):
+        if self._estimates is not None:
+            speed = 1.0
+            if self._predicted_done:
+                speed = self._actual_done / self._predicted_done
+            remaining = (max(0.0, self._remaining_parallel) /
+                         max(1, self.jobs) +
+                         max(0.0, self._remaining_isolated))
+            return '%5.1f' % (remaining * speed)
+        now = self._time()
+        if not self.finished or now <= self.started_time:
+            return '-'
+        rate = self.finished * 1.0 / (now - self.started_time)
+        return '%5.1f' % ((self.total - self.finished) / rate)
+
+    def _p95(self):
+        value = self._durations.value()
+        if value is None:
+            return '-'
+        return '%5.3f' % value
+
+    def _utilization(self):
+        if not self.jobs:
+            return '-'
+        busy = self.busy
+        if busy is None:
+            busy = self.started - self.finished
+        return '%5.1f' % (busy * 100.0 / self.jobs)
+
+
+def _literal(text):
+    return lambda: text
+
+
+class _Percentile(object):
+    """Tracks the nearest-rank percentile of a stream of values.
+
+    The values at or below the percentile are kept in a max-heap and the
+    rest in a min-heap, so adding a value is O(log n) and reading the
+    percentile is O(1)."""
+
+    def __init__(self, percent):
+        self.percent = percent
+        self._low = []  # negated, so that it behaves as a max-heap.
+        self._high = []
+
+    def add(self, value):
+        if self._high and value > self._high[0]:
+            heapq.heappush(self._high, value)
+        else:
+            heapq.heappush(self._low, -value)
+        count = len(self._low) + len(self._high)
+        rank = max(1, -(-count * self.percent // 100))
+        while len(self._low) > rank:
+            heapq.heappush(self._high, -heapq.heappop(self._low))
+        while len(self._low) < rank:
+            heapq.heappush(self._low, -heapq.heappop(self._high))
+
+    def value(self):
+        if not self._low:
+            return None
+        return -self._low[0]
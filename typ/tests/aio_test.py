@@ -0,0 +1,117 @@
+# Copyright 2014 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import textwrap
+import time
+import unittest
+
+from typ.host import Host
+
+# The tests are compiled from source so that this file can still be
+# imported by versions of Python without async/await.
+ASYNC_TESTS_PY = textwrap.dedent("""\
+    import asyncio
+    import sys
+    import unittest
+
+    class AsyncTest(unittest.IsolatedAsyncioTestCase):
+        async def asyncSetUp(self):
+            self.calls = ['asyncSetUp']
+
+        async def asyncTearDown(self):
+            self.calls.append('asyncTearDown')
+
+        async def test_pass(self):
+            sys.stdout.write('pass starting\\n')
+            await asyncio.sleep(0.2)
+            sys.stdout.write('pass done\\n')
+            self.addAsyncCleanup(self.cleanup)
+
+        async def cleanup(self):
+            CALLS.append(self.calls + ['cleanup'])
+
+        async def test_fail(self):
+            sys.stdout.write('fail starting\\n')
+            await asyncio.sleep(0.2)
+            self.fail('failed on purpose')
+
+        async def test_error(self):
+            await asyncio.sleep(0.2)
+            raise ValueError('raised on purpose')
+
+        @unittest.skip('skipped on purpose')
+        async def test_skip(self):
+            pass
+
+        @unittest.expectedFailure
+        async def test_expected_failure(self):
+            self.fail()
+
+    CALLS = []
+    """)
+
+
+@unittest.skipIf(sys.version_info < (3, 8), 'needs IsolatedAsyncioTestCase')
+class TestRunTests(unittest.TestCase):
+
+    def setUp(self):
+        from typ import aio  # pylint: disable=import-outside-toplevel
+        self.aio = aio
+        self.namespace = {'__name__': 'async_tests'}
+        exec(compile(ASYNC_TESTS_PY, 'async_tests.py', 'exec'),
+             self.namespace)
+
+    def run_tests(self, names, concurrency):
+        host = Host()
+        tests = [self.namespace['AsyncTest'](name) for name in names]
+
+        def start_fn(_test):
+            host.capture_thread_output()
+
+        def finish_fn(test, test_result, _state):
+            out, _ = host.restore_thread_output()
+            return test._testMethodName, test_result, out
+
+        return self.aio.run_tests(tests, concurrency, start_fn, finish_fn)
+
+    def test_outcomes(self):
+        results = self.run_tests(['test_pass', 'test_fail', 'test_error',
+                                  'test_skip', 'test_expected_failure'], 5)
+        by_name = dict((name, (r, out)) for name, r, out in results)
+        self.assertEqual(by_name['test_pass'][0].testsRun, 1)
+        self.assertTrue(by_name['test_pass'][0].wasSuccessful())
+        self.assertEqual(by_name['test_pass'][1],
+                         'pass starting\npass done\n')
+        self.assertEqual(self.namespace['CALLS'],
+                         [['asyncSetUp', 'asyncTearDown', 'cleanup']])
+        self.assertIn('failed on purpose',
+                      by_name['test_fail'][0].failures[0][1])
+        self.assertEqual(by_name['test_fail'][1], 'fail starting\n')
+        self.assertIn('raised on purpose',
+                      by_name['test_error'][0].errors[0][1])
+        self.assertEqual(by_name['test_skip'][0].skipped[0][1],
+                         'skipped on purpose')
+        self.assertEqual(
+            len(by_name['test_expected_failure'][0].expectedFailures), 1)
+
+    def test_runs_concurrently(self):
+        start = time.time()
+        self.run_tests(['test_pass'] * 10, 10)
+        self.assertLess(time.time() - start, 1.0)
+
+    def test_concurrency_limit(self):
+        start = time.time()
+        self.run_tests(['test_pass'] * 4, 2)
+        self.assertGreaterEqual(time.time() - start, 0.4)
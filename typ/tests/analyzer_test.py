@@ -0,0 +1,117 @@
+# Copyright 2014 Dirk Pranke. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+
+from typ import analyzer
+from typ.fakes.host_fake import FakeHost
+
+
+def _event(name, ts, dur, tid=0, args=None):
+    event = {'name': name, 'ts': ts * 1000000, 'dur': dur * 1000000,
+             'ph': 'X', 'pid': 1, 'tid': tid}
+    if args is not None:
+        event['args'] = args
+    return event
+
+
+def _test(name, ts, dur, tid):
+    return _event(name, ts, dur, tid, {'actual': 'Pass', 'expected': ['Pass']})
+
+
+TRACE = {
+    'traceEvents': [
+        _test('t.a', 1, 4, 1),
+        _test('t.b', 1, 1, 2),
+        _test('t.c', 2, 1, 2),
+        _test('t.iso', 6, 2, 1),
+        _event('run', 0, 9),
+        _event('discovery', 0, 1),
+        _event('testing', 1, 7),
+        _event('reporting', 8, 1),
+        _event('parallel', 1, 5, args={'jobs': 2}),
+        _event('isolated', 6, 2, args={'jobs': 1}),
+    ],
+    'otherData': {},
+}
+
+
+class TestAnalyze(unittest.TestCase):
+
+    def test_breakdown(self):
+        a = analyzer.analyze(TRACE)
+        self.assertEqual(a['wall_time'], 9.0)
+        self.assertEqual(a['discovery'], 1.0)
+        self.assertEqual(a['reporting'], 1.0)
+        self.assertEqual(a['other'], 0.0)
+        self.assertEqual([p['name'] for p in a['phases']],
+                         ['parallel', 'isolated'])
+
+        parallel = a['phases'][0]
+        self.assertEqual(parallel['num_tests'], 3)
+        self.assertEqual(parallel['busy_time'], 6.0)
+        self.assertEqual(parallel['idle_time'], 4.0)
+        self.assertEqual(parallel['longest_test'], 4.0)
+        # Worker 2 is done at t=3, worker 1 at t=5 and the phase at t=6.
+        self.assertEqual(parallel['straggler_tail'], 3.0)
+        self.assertEqual(parallel['packed_time'], 4.0)
+
+        isolated = a['phases'][1]
+        self.assertEqual(isolated['busy_time'], 2.0)
+        self.assertEqual(isolated['packed_time'], 2.0)
+
+    def test_critical_path(self):
+        a = analyzer.analyze(TRACE)
+        self.assertEqual([(s['phase'], s['name']) for s in a['critical_path']],
+                         [('parallel', 't.a'), ('isolated', 't.iso')])
+        self.assertEqual(a['testing_time'], 7.0)
+        self.assertEqual(a['packed_testing_time'], 6.0)
+
+    def test_idle_worker_is_all_tail(self):
+        trace = {'traceEvents': [
+            _test('t.a', 0, 1, 1),
+            _event('parallel', 0, 2, args={'jobs': 2}),
+        ]}
+        a = analyzer.analyze(trace)
+        self.assertEqual(a['wall_time'], 2.0)
+        self.assertEqual(a['phases'][0]['straggler_tail'], 2.0)
+
+    def test_format(self):
+        out = analyzer.format_analysis(analyzer.analyze(TRACE))
+        self.assertIn('Wall time: 9.000s', out)
+        self.assertIn('parallel (2 jobs)', out)
+        self.assertIn('isolated (1 job)', out)
+        self.assertIn('parallel: worker 1 ran 1 test in 4.000s', out)
+        self.assertIn('(1.17x speedup)', out)
+
+
+class TestMain(unittest.TestCase):
+
+    def test_main(self):
+        host = FakeHost()
+        host.write_text_file('/tmp/trace.json', json.dumps(TRACE))
+        self.assertEqual(analyzer.main(['/tmp/trace.json'], host), 0)
+        self.assertIn('Critical path:', host.stdout.getvalue())
+
+    def test_json(self):
+        host = FakeHost()
+        host.write_text_file('/tmp/trace.json', json.dumps(TRACE))
+        self.assertEqual(analyzer.main(['--json', '/tmp/trace.json'], host), 0)
+        self.assertEqual(json.loads(host.stdout.getvalue())['wall_time'], 9.0)
+
+    def test_missing_trace(self):
+        host = FakeHost()
+        self.assertEqual(analyzer.main(['/tmp/missing.json'], host), 1)
+        self.assertIn('does not exist', host.stderr.getvalue())
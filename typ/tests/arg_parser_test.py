@@ -29,6 +29,8 @@ class ArgumentParserTest(unittest.TestCase):
                                         skip='[-d]')
         options, _ = parser.parse_args(['-j', '1'])
         self.assertEqual(options.jobs, 1)
+        options, _ = parser.parse_args(['-j', 'auto'])
+        self.assertEqual(options.jobs, 'auto')
 
     def test_argv_from_args(self):
 
@@ -42,6 +44,7 @@ class ArgumentParserTest(unittest.TestCase):
         check(['--version'])
         check(['--coverage', '--coverage-omit', 'foo'])
         check(['--jobs', '3'])
+        check(['--jobs', 'auto'])
         check(['-vv'], ['--verbose', '--verbose'])
 
     def test_argv_from_args_foreign_argument(self):
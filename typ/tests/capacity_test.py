@@ -0,0 +1,137 @@
+# Copyright 2014 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+import unittest
+
+from typ import capacity
+from typ.fakes.host_fake import FakeHost
+
+GB = 1024 * 1024 * 1024
+
+
+def _host(cpus=8, files=None):
+    host = FakeHost()
+    host.cpu_affinity_count = lambda: cpus
+    for path, contents in (files or {}).items():
+        host.write_text_file(path, contents)
+    return host
+
+
+def _meminfo(available_bytes):
+    return ('MemTotal:       65536000 kB\n'
+            'MemAvailable:   %d kB\n' % (available_bytes // 1024))
+
+
+class TestCapacity(unittest.TestCase):
+
+    def test_no_limits(self):
+        self.assertEqual(capacity.initial_jobs(_host(cpus=8)), 8)
+
+    def test_cgroup_v2_quota(self):
+        host = _host(files={'/sys/fs/cgroup/cpu.max': '250000 100000\n'})
+        self.assertEqual(capacity.cpu_limit(host), 3)
+        host = _host(files={'/sys/fs/cgroup/cpu.max': 'max 100000\n'})
+        self.assertEqual(capacity.cpu_limit(host), 8)
+
+    def test_cgroup_v1_quota(self):
+        host = _host(files={
+            '/sys/fs/cgroup/cpu/cpu.cfs_quota_us': '200000\n',
+            '/sys/fs/cgroup/cpu/cpu.cfs_period_us': '100000\n'})
+        self.assertEqual(capacity.cpu_limit(host), 2)
+        host = _host(files={
+            '/sys/fs/cgroup/cpu/cpu.cfs_quota_us': '-1\n',
+            '/sys/fs/cgroup/cpu/cpu.cfs_period_us': '100000\n'})
+        self.assertEqual(capacity.cpu_limit(host), 8)
+
+    def test_memory(self):
+        host = _host(files={'/proc/meminfo': _meminfo(2 * GB)})
+        self.assertEqual(capacity.available_memory(host), 2 * GB)
+        self.assertEqual(capacity.initial_jobs(host), 4)
+
+        host = _host(files={'/proc/meminfo': _meminfo(8 * GB),
+                            '/sys/fs/cgroup/memory.max': str(3 * GB),
+                            '/sys/fs/cgroup/memory.current': str(GB)})
+        self.assertEqual(capacity.available_memory(host), 2 * GB)
+
+        host = _host(files={'/proc/meminfo': _meminfo(GB // 10)})
+        self.assertEqual(capacity.initial_jobs(host), 1)
+
+
+class TestJobLimiter(unittest.TestCase):
+
+    def test_unloaded(self):
+        host = _host(cpus=4)
+        limiter = capacity.JobLimiter(host, 4)
+        self.assertEqual(limiter.jobs(0), 4)
+        self.assertIsNone(limiter.refresh_delay())
+
+    def test_load_from_other_processes(self):
+        host = _host(cpus=4)
+        host.loadavg = 3.0
+        limiter = capacity.JobLimiter(host, 4, interval=1.0)
+        # We have only just started, so all of the load is from others.
+        self.assertEqual(limiter.jobs(0), 1)
+        self.assertEqual(limiter.refresh_delay(), 1.0)
+
+        # The answer only changes once |interval| has passed.
+        host.loadavg = 1.0
+        self.assertEqual(limiter.jobs(1), 1)
+        host.time = lambda: 1.0
+        self.assertEqual(limiter.refresh_delay(), 0)
+        self.assertEqual(limiter.jobs(1), 3)
+
+    def test_recovers_after_a_spike(self):
+        host = _host(cpus=4)
+        now = [0.0]
+        host.time = lambda: now[0]
+        host.loadavg = 0.0
+        limiter = capacity.JobLimiter(host, 4, interval=1.0)
+        decay = math.exp(-1 / capacity.LOAD_AVERAGE_PERIOD)
+
+        def run(secs, other_load):
+            # Runs as many tests as the limiter allows for |secs| seconds,
+            # updating the load average the way the kernel does, and
+            # returns the limits it set.
+            limits = []
+            for _ in range(secs):
+                jobs = limiter.jobs(limits[-1] if limits else 4)
+                host.loadavg = (host.loadavg * decay +
+                                (jobs + other_load) * (1 - decay))
+                now[0] += 1
+                limits.append(jobs)
+            return limits
+
+        self.assertEqual(set(run(300, 0)), set([4]))
+
+        # A short burst of other work makes us back off a little...
+        self.assertLess(min(run(5, 8)), 4)
+
+        # ... but not all the way down to one test, and not for long.
+        # Counting the tests that just finished as load from elsewhere,
+        # since they are still in the load average, would.
+        limits = run(60, 0)
+        self.assertGreaterEqual(min(limits), 3)
+        self.assertEqual(limits[30:], [4] * 30)
+
+    def test_memory_pressure(self):
+        host = _host(cpus=8, files={'/proc/meminfo': _meminfo(GB)})
+        limiter = capacity.JobLimiter(host, 8)
+        self.assertEqual(limiter.jobs(3), 5)
+
+        host.write_text_file('/proc/meminfo', _meminfo(GB // 10))
+        host.time = lambda: 1.0
+        self.assertEqual(limiter.jobs(3), 2)
+        host.time = lambda: 2.0
+        self.assertEqual(limiter.jobs(0), 1)
@@ -0,0 +1,85 @@
+# Copyright 2014 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from typ.dashboard import Dashboard, format_lines, CURSOR_UP, ERASE_LINE
+from typ.stats import Stats
+
+
+class TestDashboard(unittest.TestCase):
+
+    def setUp(self):
+        # 'Invalid name' pylint: disable=C0103
+        self.out = []
+        self.now = 10.0
+
+    def print_(self, msg, end='\n'):
+        self.out.append(msg + end)
+
+    def stats(self, jobs):
+        s = Stats('', lambda: 0.0, jobs)
+        s.total = 10
+        s.started = 4
+        s.finished = 2
+        return s
+
+    def test_format_lines(self):
+        lines = format_lines(self.stats(3),
+                             {1: ('a_test.A.test_a', 7.0),
+                              3: ('b_test.B.test_b', 9.5)},
+                             10.0)
+        self.assertEqual(lines, [
+            '2/10 tests finished, 2 running, 0.2 tests/sec, 10.0s elapsed',
+            '  worker 1:     3.0s a_test.A.test_a',
+            '  worker 2:  (idle)',
+            '  worker 3:     0.5s b_test.B.test_b',
+            'Slowest in-flight tests:',
+            '      3.0s a_test.A.test_a',
+            '      0.5s b_test.B.test_b'])
+
+    def test_no_slowest_list_for_one_test(self):
+        lines = format_lines(self.stats(1), {1: ('a', 9.0)}, 10.0)
+        self.assertEqual(lines[1:], ['  worker 1:     1.0s a'])
+
+    def test_redraw_and_clear(self):
+        d = Dashboard(self.print_, 80, lambda: self.now, min_interval=0.05)
+        stats = self.stats(2)
+        d.update(stats, {})
+        self.assertEqual(d.num_lines, 3)
+        self.assertFalse(self.out[0].startswith('\r'))
+
+        # Too soon after the last redraw.
+        d.update(stats, {})
+        self.assertEqual(len(self.out), 1)
+
+        self.now = 11.0
+        self.assertEqual(d.refresh_delay(), 0)
+        d.update(stats, {1: ('a', 10.5)})
+        self.assertTrue(self.out[1].startswith(
+            '\r' + ERASE_LINE + (CURSOR_UP + ERASE_LINE) * 2 + '2/10'))
+        self.assertIn('  worker 1:     0.5s a', self.out[1])
+
+        d.clear()
+        self.assertEqual(self.out[2],
+                         '\r' + ERASE_LINE + (CURSOR_UP + ERASE_LINE) * 2)
+        self.assertEqual(d.num_lines, 0)
+        d.clear()
+        self.assertEqual(len(self.out), 3)
+
+    def test_elides_long_lines(self):
+        d = Dashboard(self.print_, 20, lambda: self.now)
+        d.update(self.stats(1), {1: ('x' * 40, 9.0)})
+        for line in self.out[0].split('\n'):
+            self.assertLessEqual(len(line), 19)
@@ -0,0 +1,222 @@
+# Copyright 2014 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import sys
+import unittest
+
+from typ import deps
+from typ.host import Host
+from typ.fakes.host_fake import FakeHost
+
+
+FILES = {
+    '/src/app/__init__.py': '',
+    '/src/app/db.py': 'import json\n',
+    '/src/app/models.py': 'from . import db\n',
+    '/src/app/views.py': 'from app.models import Model\n',
+    '/src/app/plugins.py': ('import importlib\n'
+                            'def load(name):\n'
+                            '    return importlib.import_module(name)\n'),
+    '/src/app/tests/__init__.py': '',
+    '/src/app/tests/db_test.py': 'from ..db import connect\n',
+    '/src/app/tests/views_test.py': 'import app.views\n',
+    '/src/app/tests/util_test.py': 'import os\n',
+    '/src/app/tests/plugin_test.py': 'from app import plugins\n',
+    '/src/.hidden/ignored.py': 'import app.db\n',
+    '/src/README': '',
+}
+
+
+def _host(files=None):
+    host = FakeHost()
+    for path, contents in (files or FILES).items():
+        host.write_text_file(path, contents)
+    return host
+
+
+class TestScan(unittest.TestCase):
+
+    def test_imports(self):
+        self.assertEqual(
+            deps._scan('import a.b.c\nfrom d import e\nfrom f import *\n',
+                       'm', 'm.py'),
+            (['a', 'a.b', 'a.b.c', 'd', 'd.e', 'f'], False))
+
+    def test_relative_imports(self):
+        self.assertEqual(
+            deps._scan('from . import x\nfrom ..y import z\n',
+                       'p.q.m', 'p/q/m.py'),
+            (['p', 'p.q', 'p.q.x', 'p.y', 'p.y.z'], False))
+        self.assertEqual(
+            deps._scan('from . import x\n', 'p.q', 'p/q/__init__.py'),
+            (['p', 'p.q', 'p.q.x'], False))
+
+    def test_dynamic_imports(self):
+        self.assertEqual(
+            deps._scan('import importlib\n'
+                       'importlib.import_module("a.b")\n'
+                       '__import__("c")\n', 'm', 'm.py'),
+            (['a', 'a.b', 'c', 'importlib'], False))
+        self.assertTrue(deps._scan('__import__(name)\n', 'm', 'm.py')[1])
+        self.assertTrue(deps._scan('imp.load_source("m", path)\n',
+                                   'm', 'm.py')[1])
+
+    def test_syntax_error(self):
+        self.assertEqual(deps._scan('import (\n', 'm', 'm.py'), ([], True))
+
+
+class TestImportGraph(unittest.TestCase):
+
+    def test_affected(self):
+        graph = deps.ImportGraph(_host(), ['/src'])
+        graph.update()
+        self.assertNotIn('.hidden.ignored', graph.modules)
+
+        self.assertEqual(graph.affected_modules(['/src/app/db.py']),
+                         set(['app.db', 'app.models', 'app.views',
+                              'app.plugins', 'app.tests.db_test',
+                              'app.tests.views_test',
+                              'app.tests.plugin_test']))
+        self.assertEqual(graph.affected_modules(['/src/app/views.py']),
+                         set(['app.views', 'app.tests.views_test',
+                              'app.plugins', 'app.tests.plugin_test']))
+        self.assertEqual(
+            graph.affected_modules(['/src/app/tests/util_test.py']),
+            set(['app.tests.util_test', 'app.plugins',
+                 'app.tests.plugin_test']))
+
+    def test_package_init(self):
+        graph = deps.ImportGraph(_host(), ['/src'])
+        graph.update()
+        self.assertEqual(
+            graph.affected_modules(['/src/app/tests/__init__.py']),
+            set(['app.tests', 'app.tests.db_test', 'app.tests.views_test',
+                 'app.tests.util_test', 'app.tests.plugin_test',
+                 'app.plugins']))
+
+    def test_changes_outside_python(self):
+        graph = deps.ImportGraph(_host(), ['/src'])
+        graph.update()
+        self.assertEqual(graph.affected_modules([]), set())
+        self.assertIsNone(graph.affected_modules(['/src/README']))
+        # We can't tell what uses files outside the top-level dirs.
+        self.assertIsNone(graph.affected_modules(['/elsewhere/notes.txt']))
+        self.assertIsNone(graph.affected_modules(['/elsewhere/lib.py']))
+
+    @unittest.skipIf(sys.platform == 'win32', 'needs symlinks')
+    def test_symlinked_top_level_dir(self):
+        host = Host()
+        tmpdir = host.realpath(host.mkdtemp())
+        try:
+            src = host.join(tmpdir, 'src')
+            link = host.join(tmpdir, 'link')
+            host.maybe_mkdir(src)
+            host.write_text_file(host.join(src, 'lib.py'), '')
+            host.write_text_file(host.join(src, 'lib_test.py'),
+                                 'import lib\n')
+            os.symlink(src, link)
+            graph = deps.ImportGraph(host, [link])
+            graph.update()
+            # git reports the paths with the symlink resolved.
+            self.assertEqual(
+                graph.affected_modules([host.join(src, 'lib.py')]),
+                set(['lib', 'lib_test']))
+            self.assertEqual(
+                graph.affected_modules([host.join(link, 'lib.py')]),
+                set(['lib', 'lib_test']))
+        finally:
+            host.rmtree(tmpdir)
+
+    def test_imported_paths(self):
+        graph = deps.ImportGraph(_host(), ['/src'])
+        graph.update()
+        self.assertEqual(graph.imported_paths('app.tests.views_test'),
+                         set(['/src/app/__init__.py',
+                              '/src/app/tests/__init__.py',
+                              '/src/app/tests/views_test.py',
+                              '/src/app/views.py', '/src/app/models.py',
+                              '/src/app/db.py']))
+        # What plugins imports dynamically isn't included.
+        self.assertEqual(graph.imported_paths('app.plugins'),
+                         set(['/src/app/__init__.py',
+                              '/src/app/plugins.py']))
+
+    def test_deleted_module(self):
+        host = _host()
+        host.remove('/src/app/db.py')
+        graph = deps.ImportGraph(host, ['/src'])
+        graph.update()
+        self.assertIn('app.tests.db_test',
+                      graph.affected_modules(['/src/app/db.py']))
+
+    def test_module_for_test(self):
+        graph = deps.ImportGraph(_host(), ['/src'])
+        graph.update()
+        self.assertEqual(
+            graph.module_for_test('app.tests.db_test.DbTest.test_connect'),
+            'app.tests.db_test')
+        self.assertIsNone(graph.module_for_test('other.Test.test_x'))
+
+    def test_cache(self):
+        host = _host()
+        graph = deps.ImportGraph(host, ['/src'], '/cache.json')
+        graph.update()
+        self.assertEqual(graph.reparsed, 10)
+        cache = json.loads(host.read_text_file('/cache.json'))
+        self.assertEqual(cache['files']['/src/app/models.py']['imports'],
+                         ['app', 'app.db'])
+
+        graph = deps.ImportGraph(host, ['/src'], '/cache.json')
+        graph.update()
+        self.assertEqual(graph.reparsed, 0)
+
+        # Only the file that changed is parsed again.
+        host.write_text_file('/src/app/db.py', 'import app.views\n')
+        host.mtimes['/src/app/db.py'] = 1
+        graph.update()
+        self.assertEqual(graph.reparsed, 1)
+        self.assertIn('app.tests.db_test',
+                      graph.affected_modules(['/src/app/views.py']))
+
+
+class TestGit(unittest.TestCase):
+
+    def test_changed_files(self):
+        host = FakeHost()
+        outputs = {
+            'rev-parse': '/src\n',
+            'diff': 'app/db.py\nREADME\n',
+            'ls-files': 'app/new.py\n',
+        }
+        calls = []
+
+        def call(argv, stdin=None, env=None):  # pylint: disable=W0613
+            calls.append(argv)
+            return 0, outputs[argv[3]], ''
+
+        host.call = call
+        self.assertEqual(deps.changed_files(host, 'HEAD~1', '/src/app'),
+                         ['/src/README', '/src/app/db.py',
+                          '/src/app/new.py'])
+        self.assertEqual(calls[1], ['git', '-C', '/src', 'diff',
+                                    '--name-only', 'HEAD~1', '--'])
+
+    def test_git_error(self):
+        host = FakeHost()
+        host.call = lambda argv, stdin=None, env=None: (
+            128, '', 'fatal: bad revision\n')
+        self.assertRaises(deps.GitError, deps.changed_files, host,
+                          'nope', '/src')
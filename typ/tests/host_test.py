@@ -12,9 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
 import logging
+import os
 import pickle
 import sys
+import threading
 import unittest
 
 from typ.host import Host
@@ -41,6 +44,54 @@ class TestHost(unittest.TestCase):
 
         # TODO: Add tests for divert=False or eliminate the flag?
 
+    def test_rss(self):
+        h = self.host()
+        self.assertGreater(h.rss(), 0)
+
+    def test_capture_thread_output(self):
+        h = self.host()
+        orig_stdout = sys.stdout
+        thread_output = []
+
+        def run_thread():
+            h.capture_thread_output()
+            sys.stdout.write('from thread\n')
+            thread_output.append(h.restore_thread_output())
+
+        h.capture_thread_output()
+        try:
+            sys.stdout.write('from main\n')
+            t = threading.Thread(target=run_thread)
+            t.start()
+            t.join()
+            sys.stderr.write('err from main\n')
+        finally:
+            out, err = h.restore_thread_output()
+        self.assertEqual(out, 'from main\n')
+        self.assertEqual(err, 'err from main\n')
+        self.assertEqual(thread_output, [('from thread\n', '')])
+        self.assertIs(sys.stdout, orig_stdout)
+
+    def test_capture_fd_output(self):
+        h = self.host()
+        h.capture_fd_output()
+        try:
+            os.write(1, b'on fd 1\n')
+            os.write(2, b'0123456789' * 3)
+        finally:
+            out, err, truncated = h.restore_fd_output(max_bytes=10)
+        self.assertEqual(out, 'on fd 1\n')
+        self.assertEqual(err, '01234\n... [20 bytes omitted] ...\n56789')
+        self.assertTrue(truncated)
+
+        tmpdir = h.mkdtemp()
+        try:
+            h.save_fd_output(h.join(tmpdir, 'out'), h.join(tmpdir, 'err'))
+            self.assertEqual(h.read_text_file(tmpdir, 'err'),
+                             '0123456789' * 3)
+        finally:
+            h.rmtree(tmpdir)
+
     def test_abspath_and_realpath(self):
         h = self.host()
         self.assertNotEqual(h.abspath(h.getcwd()), None)
@@ -113,10 +164,28 @@ class TestHost(unittest.TestCase):
         s = pickle.dumps(mp_host)
         pickle.loads(s)
 
+    def test_getrusage(self):
+        h = self.host()
+        usage = h.getrusage()
+        if usage is not None:
+            self.assertGreaterEqual(usage.ru_utime, 0)
+            self.assertGreater(usage.ru_maxrss, 0)
+
     def test_cpu_count(self):
         h = self.host()
         self.assertGreaterEqual(h.cpu_count(), 1)
 
+    def test_cpu_affinity_count(self):
+        h = self.host()
+        self.assertGreaterEqual(h.cpu_affinity_count(), 1)
+        self.assertLessEqual(h.cpu_affinity_count(), h.cpu_count())
+
+    def test_getloadavg(self):
+        h = self.host()
+        load = h.getloadavg()
+        if load is not None:
+            self.assertGreaterEqual(load, 0)
+
     def test_getenv(self):
         h = self.host()
         self.assertNotEqual(h.getenv('PATH', ''), None)
@@ -173,6 +242,73 @@ class TestHost(unittest.TestCase):
         h.print_('hello', '')
         self.assertEqual(s.contents, 'hello')
 
+    def test_buffered_print(self):
+        h = self.host()
+
+        class LogStream(object):
+
+            def __init__(self, name, log):
+                self.name = name
+                self.log = log
+
+            def write(self, m):
+                self.log.append((self.name, m))
+
+            def flush(self):
+                self.log.append((self.name, 'flush'))
+
+        log = []
+        h.stdout = LogStream('out', log)
+        h.stderr = LogStream('err', log)
+        h.buffer_output(max_bytes=10, max_delay=60)
+        h.print_('a')
+        h.print_('b')
+        self.assertEqual(log, [])
+        self.assertIsNotNone(h.output_flush_delay())
+
+        # stderr output doesn't overtake what is buffered for stdout.
+        h.print_('oops', stream=h.stderr)
+        self.assertEqual(log, [('out', 'a\nb\n'), ('out', 'flush'),
+                               ('err', 'oops\n'), ('err', 'flush')])
+        self.assertIsNone(h.output_flush_delay())
+
+        del log[:]
+        h.print_('0123456789')
+        self.assertEqual(log, [('out', '0123456789\n'), ('out', 'flush')])
+
+        del log[:]
+        h.print_('c')
+        h.unbuffer_output()
+        h.print_('d')
+        self.assertEqual(log, [('out', 'c\n'), ('out', 'flush'),
+                               ('out', 'd\n'), ('out', 'flush')])
+
+    def test_buffered_print_times_out(self):
+        h = self.host()
+        out = io.StringIO()
+        h.stdout = out
+        h.buffer_output(max_bytes=1000, max_delay=0)
+        h.print_(u'a')
+        self.assertEqual(out.getvalue(), 'a\n')
+
+    def test_buffered_print_delay(self):
+        h = self.host()
+        out = io.StringIO()
+        h.stdout = out
+        now = [100.0]
+        h.time = lambda: now[0]
+        h.buffer_output(max_bytes=1000, max_delay=2)
+        h.print_(u'b')
+        self.assertEqual(h.output_flush_delay(), 2)
+        now[0] = 101.5
+        self.assertEqual(h.output_flush_delay(), 0.5)
+        h.print_(u'c')
+        self.assertEqual(out.getvalue(), '')
+        now[0] = 102.0
+        self.assertEqual(h.output_flush_delay(), 0)
+        h.print_(u'd')
+        self.assertEqual(out.getvalue(), 'b\nc\nd\n')
+
     def test_call(self):
         h = self.host()
         ret, out, err = h.call(
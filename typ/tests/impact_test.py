@@ -0,0 +1,79 @@
+# Copyright 2014 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import sys
+import unittest
+
+from typ import impact
+from typ.fakes.host_fake import FakeHost
+
+
+def _helper():
+    return 1
+
+
+class TestFileTracer(unittest.TestCase):
+
+    def test_records_called_files(self):
+        tracer = impact.FileTracer()
+        previous = sys.gettrace()
+        try:
+            tracer.start()
+            _helper()
+            json.dumps({})
+            files = tracer.stop()
+        finally:
+            sys.settrace(previous)
+        self.assertIn(_helper.__code__.co_filename, files)
+        self.assertIn(json.dumps.__code__.co_filename, files)
+        self.assertNotIn(impact.FileTracer.stop.__code__.co_filename, files)
+
+        # Nothing is recorded after stop().
+        _helper()
+        self.assertEqual(tracer.files, files)
+
+
+class TestFilesUnder(unittest.TestCase):
+
+    def test_files_under(self):
+        top = os.path.dirname(os.path.realpath(__file__))
+        self.assertEqual(
+            impact.files_under([os.path.join(top, 'a.py'), '/elsewhere/b.py',
+                                '<string>', top + '_other/c.py'], [top]),
+            set([os.path.join(top, 'a.py')]))
+
+
+class TestIndex(unittest.TestCase):
+
+    def test_round_trip(self):
+        host = FakeHost()
+        tests = {'a_test.A.test_a': set(['/src/a.py', '/src/a_test.py']),
+                 'b_test.B.test_b': set(['/src/a.py'])}
+        impact.write_index(host, '/tmp/impact.json', tests)
+        index = json.loads(host.files['/tmp/impact.json'])
+        self.assertEqual(index['files'], ['/src/a.py', '/src/a_test.py'])
+        self.assertEqual(index['tests']['b_test.B.test_b'], [0])
+        self.assertEqual(impact.read_index(host, '/tmp/impact.json'), tests)
+
+    def test_missing_or_invalid(self):
+        host = FakeHost()
+        self.assertEqual(impact.read_index(host, '/tmp/impact.json'), {})
+        host.write_text_file('/tmp/impact.json', 'not json')
+        self.assertEqual(impact.read_index(host, '/tmp/impact.json'), {})
+        host.write_text_file('/tmp/impact.json',
+                             json.dumps({'version': 0, 'files': [],
+                                         'tests': {}}))
+        self.assertEqual(impact.read_index(host, '/tmp/impact.json'), {})
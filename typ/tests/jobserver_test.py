@@ -0,0 +1,100 @@
+# Copyright 2014 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import unittest
+
+from typ import jobserver
+from typ.fakes.host_fake import FakeHost
+from typ.host import Host
+
+
+def _host(makeflags):
+    host = FakeHost()
+    host.platform = sys.platform
+    host.env['MAKEFLAGS'] = makeflags
+    return host
+
+
+@unittest.skipIf(sys.platform == 'win32', 'make jobservers use pipes')
+class TestJobServer(unittest.TestCase):
+
+    def setUp(self):
+        self.read_fd, self.write_fd = os.pipe()
+        self.addCleanup(os.close, self.read_fd)
+        self.addCleanup(os.close, self.write_fd)
+
+    def test_no_jobserver(self):
+        self.assertIsNone(jobserver.from_env(_host('')))
+        self.assertIsNone(jobserver.from_env(_host('-j4 -k')))
+        self.assertIsNone(jobserver.from_env(
+            _host('--jobserver-auth=-2,-2')))
+        # make didn't pass the descriptors down, so they aren't open.
+        self.assertIsNone(jobserver.from_env(
+            _host('--jobserver-auth=1000,1001')))
+        self.assertIsNone(jobserver.from_env(
+            _host('--jobserver-auth=fifo:/nonexistent/fifo')))
+
+    def test_pipe(self):
+        os.write(self.write_fd, b'ab')
+        js = jobserver.from_env(
+            _host('-j3 --jobserver-auth=%d,%d' % (self.read_fd,
+                                                  self.write_fd)))
+        self.assertIsNotNone(js)
+        self.check_tokens(js, b'ab')
+
+    def test_old_pipe_flag(self):
+        os.write(self.write_fd, b'a')
+        js = jobserver.from_env(
+            _host('--jobserver-fds=%d,%d -j' % (self.read_fd,
+                                                self.write_fd)))
+        self.assertIsNotNone(js)
+        self.check_tokens(js, b'a')
+
+    def test_fifo(self):
+        h = Host()
+        tmpdir = h.mkdtemp()
+        self.addCleanup(h.rmtree, tmpdir)
+        path = h.join(tmpdir, 'jobserver')
+        os.mkfifo(path)
+        fd = os.open(path, os.O_RDWR)
+        self.addCleanup(os.close, fd)
+        os.write(fd, b'+-')
+
+        js = jobserver.from_env(_host('--jobserver-auth=fifo:' + path))
+        self.assertIsNotNone(js)
+        self.read_fd = fd
+        self.check_tokens(js, b'+-')
+
+    def check_tokens(self, js, tokens):
+        try:
+            for _ in tokens:
+                self.assertTrue(js.acquire())
+            self.assertEqual(js.held, len(tokens))
+            self.assertIsNone(js.poll_delay())
+
+            # There are none left, but acquire() doesn't block.
+            self.assertFalse(js.acquire())
+            self.assertEqual(js.poll_delay(), jobserver.POLL_INTERVAL)
+
+            js.release_to(len(tokens) - 1)
+            self.assertEqual(js.held, len(tokens) - 1)
+            self.assertTrue(js.acquire())
+        finally:
+            js.close()
+        self.assertEqual(js.held, 0)
+
+        # Every token went back, unchanged.
+        self.assertEqual(sorted(os.read(self.read_fd, 10)), sorted(tokens))
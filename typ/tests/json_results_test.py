@@ -111,3 +111,57 @@ class TestMakeFullResults(unittest.TestCase):
                         }}}},
             'version': 3}
         self.assertEqual(full_results, expected_full_results)
+
+    def test_resources(self):
+        resources = {'user_time': 0.1, 'system_time': 0.0}
+        result_set = json_results.ResultSet()
+        result_set.add(json_results.Result('foo_test.FooTest.test_pass',
+                                           json_results.ResultType.Pass,
+                                           0, 0.2, 0, resources=resources))
+        result_set.add(json_results.Result('foo_test.FooTest.test_other',
+                                           json_results.ResultType.Pass,
+                                           0, 0.2, 0))
+        full_results = json_results.make_full_results(
+            [], 0, ['foo_test.FooTest.test_other',
+                    'foo_test.FooTest.test_pass'], result_set)
+        tests = full_results['tests']['foo_test']['FooTest']
+        self.assertEqual(tests['test_pass']['resources'], [resources])
+        self.assertNotIn('resources', tests['test_other'])
+
+
+    def test_interrupted(self):
+        result_set = json_results.ResultSet()
+        result_set.add(json_results.Result('foo_test.FooTest.test_fail',
+                                           json_results.ResultType.Failure,
+                                           0, 0.1, 0, unexpected=True))
+        full_results = json_results.make_full_results(
+            [], 0, ['foo_test.FooTest.test_fail',
+                    'foo_test.FooTest.test_not_run'], result_set,
+            interrupted=True)
+        self.assertTrue(full_results['interrupted'])
+        self.assertEqual(full_results['num_failures_by_type'],
+                         {'FAIL': 1, 'PASS': 0, 'SKIP': 0, 'NOTRUN': 1})
+        self.assertEqual(json_results.num_not_run(full_results), 1)
+        tests = full_results['tests']['foo_test']['FooTest']
+        self.assertEqual(tests['test_not_run'],
+                         {'actual': 'NOTRUN', 'expected': 'PASS',
+                          'times': []})
+
+
+class TestTimesByTest(unittest.TestCase):
+
+    def test_basic(self):
+        full_results = {
+            'path_delimiter': '.',
+            'tests': {'foo_test': {'FooTest': {
+                'test_a': {'actual': 'FAIL PASS', 'times': [0.5, 0.1]},
+                'test_b': {'actual': 'PASS', 'times': [0.2]}}}}}
+        self.assertEqual(json_results.times_by_test(full_results),
+                         {'foo_test.FooTest.test_a': [0.5, 0.1],
+                          'foo_test.FooTest.test_b': [0.2]})
+
+    def test_missing_times(self):
+        full_results = {'tests': {'a': {'b': {'actual': 'PASS',
+                                              'expected': 'PASS'}}}}
+        self.assertEqual(json_results.times_by_test(full_results),
+                         {'a.b': []})
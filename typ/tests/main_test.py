@@ -17,6 +17,8 @@ import json
 import os
 import sys
 import textwrap
+import time
+import unittest
 
 from typ import main
 from typ import test_case
@@ -56,6 +58,25 @@ class FailingTest(unittest.TestCase):
 FAIL_TEST_FILES = {'fail_test.py': FAIL_TEST_PY}
 
 
+FD_OUTPUT_TEST_PY = """
+import os
+import unittest
+
+class FdOutputTest(unittest.TestCase):
+    def test_fds(self):
+        os.write(1, b'hello on fd 1\\n')
+        os.write(2, b'hello on fd 2\\n')
+        self.fail()
+
+    def test_lots_of_output(self):
+        os.write(1, b'a' * 100 + b'b' * 100)
+        self.fail()
+"""
+
+
+FD_OUTPUT_TEST_FILES = {'fd_output_test.py': FD_OUTPUT_TEST_PY}
+
+
 OUTPUT_TEST_PY = """
 import sys
 import unittest
@@ -166,6 +187,32 @@ def load_tests(_, _2, _3):
 LOAD_TEST_FILES = {'load_test.py': LOAD_TEST_PY}
 
 
+FLAKY_TEST_PY = """
+import os
+import unittest
+
+
+class FlakyTest(unittest.TestCase):
+    def _fail_once(self):
+        # Retries may run in a new worker, so remember the failure on disk.
+        marker = self.id() + '.failed'
+        if not os.path.exists(marker):
+            open(marker, 'w').close()
+            self.fail()
+
+    def test_a(self):
+        self._fail_once()
+
+    def test_b(self):
+        self._fail_once()
+
+    def test_iso(self):
+        self._fail_once()
+"""
+
+FLAKY_TEST_FILES = {'flaky_test.py': FLAKY_TEST_PY}
+
+
 
 path_to_main = os.path.join(
     os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
@@ -174,7 +221,76 @@ path_to_main = os.path.join(
 
 class TestCli(test_case.MainTestCase):
     prog = [sys.executable, path_to_main]
-    files_to_ignore = ['*.pyc']
+    files_to_ignore = ['*.pyc', '*.pstats']
+
+    @unittest.skipIf(sys.version_info < (3, 8),
+                     'needs IsolatedAsyncioTestCase')
+    def test_async_concurrency(self):
+        files = {'async_test.py': d("""\
+            import asyncio
+            import sys
+            import unittest
+
+            class AsyncTest(unittest.IsolatedAsyncioTestCase):
+                async def test_fail(self):
+                    sys.stdout.write('fail starting\\n')
+                    await asyncio.sleep(0.1)
+                    sys.stdout.write('fail done\\n')
+                    self.fail()
+
+                async def test_pass(self):
+                    sys.stdout.write('pass starting\\n')
+                    await asyncio.sleep(0.1)
+                    sys.stdout.write('pass done\\n')
+
+            class SyncTest(unittest.TestCase):
+                def test_sync(self):
+                    pass
+            """)}
+        _, out, _, _ = self.check(['--async-concurrency', '10', '-j', '1'],
+                                  files=files, ret=1, err='')
+        self.assertIn('async_test.AsyncTest.test_fail failed unexpectedly:\n'
+                      '  fail starting\n'
+                      '  fail done\n', out)
+        self.assertNotIn('pass starting', out)
+        self.assertIn('2 tests passed, 0 skipped, 1 failure.', out)
+
+    @unittest.skipIf(sys.version_info < (3, 8),
+                     'needs IsolatedAsyncioTestCase')
+    def test_async_concurrency_with_fixtures(self):
+        files = {'fixture_test.py': d("""\
+            import unittest
+
+            def setUpModule():
+                unittest.module_ready = True
+
+            class FixtureTest(unittest.IsolatedAsyncioTestCase):
+                @classmethod
+                def setUpClass(cls):
+                    cls.ready = True
+
+                async def test_a(self):
+                    self.assertTrue(self.ready)
+                    self.assertTrue(unittest.module_ready)
+
+                async def test_b(self):
+                    self.assertTrue(self.ready)
+                    self.assertTrue(unittest.module_ready)
+            """)}
+        self.check(['--async-concurrency', '4', '-j', '1'], files=files,
+                   ret=0, err='',
+                   rout=r'2 tests passed, 0 skipped, 0 failures\.')
+
+        self.check(['--async-concurrency', '4', '--capture', 'fd'],
+                   files=files, ret=1, out='',
+                   err=('--async-concurrency can not be used with '
+                        '--capture=fd, --track-resources, '
+                        '--track-allocations, --profile or '
+                        '--sample-profile\n'))
+
+    def test_auto_jobs(self):
+        self.check(['-j', 'auto'], files=PASS_TEST_FILES, ret=0, err='',
+                   rout=r'1 test passed, 0 skipped, 0 failures\.')
 
     def test_bad_arg(self):
         self.check(['--bad-arg'], ret=2, out='',
@@ -193,6 +309,151 @@ class TestCli(test_case.MainTestCase):
                    out=('[1/1] pass_test.PassingTest.test_pass passed\n'
                         '1 test passed, 0 skipped, 0 failures.\n'), err='')
 
+    def test_changed_since(self):
+        h = Host()
+        repo = h.mkdtemp()
+        try:
+            files = {
+                'lib.py': 'VALUE = 1\n',
+                'other.py': 'VALUE = 2\n',
+                'lib_test.py': d("""\
+                    import unittest
+                    import lib
+                    class LibTest(unittest.TestCase):
+                        def test_lib(self):
+                            self.assertTrue(lib.VALUE)
+                    """),
+                'other_test.py': d("""\
+                    import unittest
+                    from other import VALUE
+                    class OtherTest(unittest.TestCase):
+                        def test_other(self):
+                            self.assertTrue(VALUE)
+                    """),
+            }
+            for path, contents in files.items():
+                h.write_text_file(h.join(repo, path), contents)
+            for argv in (['init', '-q'], ['add', '.'],
+                         ['-c', 'user.name=typ', '-c',
+                          'user.email=typ@example.com', 'commit', '-q',
+                          '-m', 'initial']):
+                ret, _, err = h.call(['git', '-C', repo] + argv)
+                self.assertEqual(ret, 0, err)
+            h.write_text_file(h.join(repo, 'lib.py'), 'VALUE = 3\n')
+
+            _, out, _, _ = self.check(['--changed-since', 'HEAD'], cwd=repo,
+                                      ret=0, err='')
+            self.assertIn('1 of 2 tests are affected by changes since HEAD.',
+                          out)
+            self.assertIn('lib_test.LibTest.test_lib passed', out)
+            self.assertNotIn('other_test', out)
+            self.assertTrue(h.exists(repo, '.git', 'typ_deps.json'))
+
+            self.check(['--changed-since', 'no-such-rev'], cwd=repo, ret=1,
+                       rerr=("--changed-since: git diff .* failed: "
+                             ".*'no-such-rev'"))
+        finally:
+            h.rmtree(repo)
+
+    def test_impact_index(self):
+        h = Host()
+        repo = h.mkdtemp()
+        try:
+            files = {
+                'lib.py': 'def value():\n    return 1\n',
+                'other.py': 'def value():\n    return 2\n',
+                'conf.py': d("""\
+                    LIMIT = 1
+                    def limit():
+                        return LIMIT
+                    """),
+                'loader.py': d("""\
+                    import importlib
+                    def load(name):
+                        return importlib.import_module(name)
+                    """),
+                'loader_test.py': d("""\
+                    import unittest
+                    import loader
+                    class LoaderTest(unittest.TestCase):
+                        def test_lib(self):
+                            self.assertTrue(loader.load('lib').value())
+                        def test_other(self):
+                            self.assertTrue(loader.load('other').value())
+                    """),
+                'conf_test.py': d("""\
+                    import unittest
+                    import conf
+                    class ConfTest(unittest.TestCase):
+                        def test_limit(self):
+                            self.assertEqual(conf.LIMIT, 1)
+                        def test_call(self):
+                            self.assertTrue(conf.limit())
+                    """),
+            }
+            for path, contents in files.items():
+                h.write_text_file(h.join(repo, path), contents)
+            for argv in (['init', '-q'], ['add', '.'],
+                         ['-c', 'user.name=typ', '-c',
+                          'user.email=typ@example.com', 'commit', '-q',
+                          '-m', 'initial']):
+                ret, _, err = h.call(['git', '-C', repo] + argv)
+                self.assertEqual(ret, 0, err)
+
+            _, out, _, _ = self.check(['--impact-index', 'impact.json'],
+                                      cwd=repo, ret=0, err='')
+            self.assertIn('Recorded the files run by 4 tests in '
+                          'impact.json.', out)
+            index = json.loads(h.read_text_file(h.join(repo, 'impact.json')))
+            files_for = lambda name: sorted(
+                h.basename(index['files'][i]) for i in index['tests'][name])
+            self.assertEqual(files_for('loader_test.LoaderTest.test_lib'),
+                             ['lib.py', 'loader.py', 'loader_test.py'])
+            self.assertEqual(files_for('loader_test.LoaderTest.test_other'),
+                             ['loader.py', 'loader_test.py', 'other.py'])
+            # conf.LIMIT is read without calling anything in conf.py.
+            self.assertEqual(files_for('conf_test.ConfTest.test_limit'),
+                             ['conf_test.py'])
+
+            # loader imports modules dynamically, so the import graph
+            # alone would pick both of its tests.
+            h.write_text_file(h.join(repo, 'lib.py'),
+                              'def value():\n    return 3\n')
+            _, out, _, _ = self.check(['--changed-since', 'HEAD',
+                                       '--impact-index', 'impact.json'],
+                                      cwd=repo, ret=0, err='')
+            self.assertIn('1 of 4 tests are affected by changes since HEAD.',
+                          out)
+            self.assertIn('loader_test.LoaderTest.test_lib passed', out)
+
+            # test_limit depends on conf.py through what its module
+            # imports, without calling into it.
+            h.write_text_file(h.join(repo, 'conf.py'),
+                              'LIMIT = 2\ndef limit():\n    return LIMIT\n')
+            _, out, _, _ = self.check(['--changed-since', 'HEAD',
+                                       '--impact-index', 'impact.json'],
+                                      cwd=repo, ret=1, err='')
+            self.assertIn('3 of 4 tests are affected by changes since HEAD.',
+                          out)
+            self.assertIn('conf_test.ConfTest.test_limit failed', out)
+            self.assertNotIn('test_other', out)
+
+            # No test has called into new.py, so for all the index knows,
+            # loader's tests might import it.
+            h.write_text_file(h.join(repo, 'new.py'), '')
+            _, out, _, _ = self.check(['--changed-since', 'HEAD',
+                                       '--impact-index', 'impact.json'],
+                                      cwd=repo, ret=1, err='')
+            self.assertIn('4 of 4 tests are affected by changes since HEAD.',
+                          out)
+
+            self.check(['--impact-index', 'impact.json', '--debugger'],
+                       cwd=repo, ret=1,
+                       err=('--impact-index can not be used with --coverage '
+                            'or --debugger\n'))
+        finally:
+            h.rmtree(repo)
+
     def test_coverage(self):
         try:
             import coverage  # pylint: disable=W0612
@@ -226,6 +487,134 @@ class TestCli(test_case.MainTestCase):
                                       files=PASS_TEST_FILES, ret=0, err='')
             self.assertIn('(Pdb) ', out)
 
+    def test_capture_fds(self):
+        _, out, _, files = self.check(
+            ['--capture', 'fd', '--max-output-bytes', '20',
+             '--output-log-dir', 'logs', '-j', '1'],
+            files=FD_OUTPUT_TEST_FILES, ret=1, err='')
+        self.assertIn('  hello on fd 1\n  hello on fd 2\n', out)
+        self.assertIn('  aaaaaaaaaa\n'
+                      '  ... [180 bytes omitted] ...\n'
+                      '  bbbbbbbbbb\n', out)
+        self.assertIn('The full output was saved to '
+                      'logs/fd_output_test.FdOutputTest.'
+                      'test_lots_of_output.out', out)
+        self.assertEqual(
+            files['logs/fd_output_test.FdOutputTest.test_lots_of_output.out'],
+            'a' * 100 + 'b' * 100)
+        self.assertNotIn('logs/fd_output_test.FdOutputTest.test_fds.out',
+                         files)
+
+    def test_max_tests_per_worker(self):
+        self.check(['--max-tests-per-worker', '1', '--max-worker-rss', '1',
+                    '-j', '2'], files=OUTPUT_TEST_FILES, ret=1, err='',
+                   rout=r'2 tests passed, 0 skipped, 1 failure\.')
+
+    def test_max_tests_per_worker_spills_output(self):
+        # Each replacement worker has to spill into a file of its own,
+        # or it overwrites the output of the tests its predecessor ran.
+        files = {'spill_test.py': d("""\
+            import sys
+            import unittest
+            class SpillTest(unittest.TestCase):
+                def test_1(self):
+                    sys.stdout.write('1' * 50)
+                def test_2(self):
+                    sys.stdout.write('2' * 40)
+                def test_3(self):
+                    sys.stdout.write('3' * 30)
+                def test_4(self):
+                    sys.stdout.write('4' * 20)
+            """)}
+        _, _, _, files = self.check(
+            ['--max-tests-per-worker', '1', '--spill-output-bytes', '10',
+             '-j', '2', '--write-trace-to', 'trace.json'],
+            files=files, ret=0, err='')
+        trace = json.loads(files['trace.json'])
+        outputs = dict((e['name'], e['args']['out'])
+                       for e in trace['traceEvents']
+                       if e['name'].startswith('spill_test.'))
+        self.assertEqual(outputs, {
+            'spill_test.SpillTest.test_1': '1' * 50,
+            'spill_test.SpillTest.test_2': '2' * 40,
+            'spill_test.SpillTest.test_3': '3' * 30,
+            'spill_test.SpillTest.test_4': '4' * 20,
+        })
+
+    def test_pipe_pool(self):
+        self.check(['--pool', 'pipe', '-j', '2'], files=OUTPUT_TEST_FILES,
+                   ret=1, err='', rout=('hello on stdout'))
+
+    @unittest.skipIf(sys.platform == 'win32', 'make jobservers use pipes')
+    def test_jobserver(self):
+        h = Host()
+        tmpdir = h.mkdtemp()
+        try:
+            path = h.join(tmpdir, 'jobserver')
+            os.mkfifo(path)
+            fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+            try:
+                os.write(fd, b'+')
+                self.check(['-j', '2'], files=OUTPUT_TEST_FILES,
+                           aenv={'MAKEFLAGS': ('-j2 --jobserver-auth=fifo:' +
+                                               path)},
+                           ret=1, err='', rout='hello on stdout')
+                # The token we were given was handed back.
+                self.assertEqual(os.read(fd, 10), b'+')
+            finally:
+                os.close(fd)
+        finally:
+            h.rmtree(tmpdir)
+
+    def test_thread_pool(self):
+        _, out, _, _ = self.check(['--pool', 'thread', '-j', '2'],
+                                  files=OUTPUT_TEST_FILES, ret=1, err='')
+        self.assertIn('output_test.FailTest.test_out_err_fail '
+                      'failed unexpectedly:\n'
+                      '  hello on stdout\n'
+                      '  hello on stderr\n', out)
+        # The passing tests' output was captured, not printed.
+        self.assertEqual(out.count('hello on stdout'), 1)
+        self.assertIn('2 tests passed, 0 skipped, 1 failure.', out)
+
+    def test_thread_pool_rejects_fd_capture(self):
+        self.check(['--pool', 'thread', '--capture', 'fd'],
+                   files=PASS_TEST_FILES, ret=1, out='',
+                   err='--capture=fd can not be used with --pool=thread\n')
+
+    def test_thread_pool_rejects_resource_tracking(self):
+        for flag in ('--track-resources', '--track-allocations'):
+            self.check(['--pool', 'thread', flag],
+                       files=PASS_TEST_FILES, ret=1, out='',
+                       err=('--track-resources and --track-allocations can '
+                            'not be used with --pool=thread\n'))
+
+    def test_spill_output(self):
+        files = {'spill_test.py': d("""\
+            import sys
+            import unittest
+            class SpillTest(unittest.TestCase):
+                def test_short(self):
+                    sys.stdout.write('short\\n')
+                    self.fail()
+                def test_long(self):
+                    sys.stdout.write('a' * 100 + 'b' * 100 + '\\n')
+                    self.fail()
+            """)}
+        _, out, _, _ = self.check(
+            ['--spill-output-bytes', '20', '-j', '2'],
+            files=files, ret=1, err='')
+        self.assertIn('  short\n', out)
+        self.assertIn('  ' + 'a' * 100 + 'b' * 100 + '\n', out)
+
+    def test_dashboard(self):
+        # The output isn't a terminal, so it is printed as usual.
+        self.check(['--dashboard'], files=PASS_TEST_FILES, ret=0, err='',
+                   out=d("""\
+                         [1/1] pass_test.PassingTest.test_pass passed
+                         1 test passed, 0 skipped, 0 failures.
+                         """))
+
     def test_dryrun(self):
         self.check(['-n'], files=PASS_TEST_FILES, ret=0, err='',
                    out=d("""\
@@ -306,6 +695,57 @@ class TestCli(test_case.MainTestCase):
         self.assertIn('[1/1] fail_test.FailingTest.test_fail failed '
                       'unexpectedly:\n', out)
 
+    def test_fail_fast(self):
+        files = {'ff_test.py': d("""\
+            import unittest
+            class FFTest(unittest.TestCase):
+                def test_a(self):
+                    self.fail()
+                def test_b(self):
+                    pass
+                def test_c(self):
+                    pass
+            """)}
+        _, out, _, files = self.check(['-j', '1', '--fail-fast',
+                                       '--write-full-results-to',
+                                       'full_results.json'],
+                                      files=files, ret=1, err='')
+        self.assertNotIn('test_b', out)
+        self.assertIn('Stopped after 1 failure.\n', out)
+        self.assertIn('0 tests passed, 0 skipped, 1 failure, 2 not run.\n',
+                      out)
+        results = json.loads(files['full_results.json'])
+        self.assertTrue(results['interrupted'])
+        self.assertEqual(results['num_failures_by_type']['NOTRUN'], 2)
+        self.assertEqual(results['tests']['ff_test']['FFTest']['test_c'],
+                         {'actual': 'NOTRUN', 'expected': 'PASS',
+                          'times': []})
+
+    def test_fail_fast_with_retries(self):
+        # A failure only counts once it won't be retried any more.
+        for policy in ('serial', 'parallel', 'immediate'):
+            _, out, _, _ = self.check(['-j', '1', '--fail-fast',
+                                       '--retry-limit', '2',
+                                       '--retry-policy', policy],
+                                      files=FLAKY_TEST_FILES, ret=0, err='')
+            self.assertNotIn('Stopped after', out)
+            self.assertIn('3 tests passed, 0 skipped, 0 failures.\n', out)
+
+        files = {'ff_test.py': d("""\
+            import unittest
+            class FFTest(unittest.TestCase):
+                def test_a(self):
+                    self.fail()
+                def test_b(self):
+                    pass
+            """)}
+        _, out, _, _ = self.check(['-j', '1', '--fail-fast',
+                                   '--retry-limit', '1'],
+                                  files=files, ret=1, err='')
+        self.assertIn('Retrying failed tests (attempt #1 of 1)', out)
+        self.assertIn('Stopped after 1 failure.\n', out)
+        self.assertIn('1 test passed, 0 skipped, 1 failure.\n', out)
+
     def test_file_list(self):
         files = PASS_TEST_FILES
         self.check(['-f', '-'], files=files, stdin='pass_test\n', ret=0)
@@ -461,6 +901,32 @@ class TestCli(test_case.MainTestCase):
                    out=('[1/1] pass_test.PassingTest.test_pass passed\n'
                         '1 test passed, 0 skipped, 0 failures.\n'), err='')
 
+    def test_isolate_with_lock(self):
+        files = {'lock_test.py': d("""\
+            import os
+            import time
+            import unittest
+            class PortTest(unittest.TestCase):
+                def _use_port(self):
+                    # Fails if another test is holding the "port".
+                    fd = os.open('port', os.O_CREAT | os.O_EXCL)
+                    time.sleep(0.2)
+                    os.close(fd)
+                    os.remove('port')
+                def test_a(self):
+                    self._use_port()
+                def test_b(self):
+                    self._use_port()
+                def test_c(self):
+                    self._use_port()
+            class OtherTest(unittest.TestCase):
+                def test_other(self):
+                    self.assertFalse(os.path.exists('other'))
+            """)}
+        _, out, _, _ = self.check(['-j', '3', '--isolate', '*PortTest*=port'],
+                                  files=files, ret=0, err='')
+        self.assertIn('4 tests passed, 0 skipped, 0 failures.', out)
+
     def test_load_tests_failure(self):
         files = {'foo_test.py': d("""\
                                   import unittest
@@ -515,9 +981,120 @@ class TestCli(test_case.MainTestCase):
                       '  hello on stdout\n'
                       '  hello on stderr\n', out)
 
+    def test_profile(self):
+        files = {'fail_test.py': FAIL_TEST_PY,
+                 'pass_test.py': PASS_TEST_PY}
+        _, out, _, _ = self.check(['--profile-filter', '*test_pass',
+                                   '--profile-top', '100',
+                                   '--profile-output', 'out.pstats'],
+                                  files=files, ret=1, err='')
+        self.assertIn('Wrote the profile to out.pstats; top 100 functions:',
+                      out)
+        self.assertIn('(test_pass)', out)
+        self.assertNotIn('(test_fail)', out)
+
+    def test_profile_nothing_matched(self):
+        _, out, _, _ = self.check(['--profile-filter', '*nothing*'],
+                                  files=PASS_TEST_FILES, ret=0, err='')
+        self.assertIn('No tests were profiled.', out)
+
+    def test_sample_profile(self):
+        _, out, _, files = self.check(['--sample-profile', 'samples.txt'],
+                                      files=PASS_TEST_FILES, ret=0, err='')
+        self.assertIn('stack sample', out)
+        self.assertIn('samples.txt', files)
+        self.assertIn('"name": "all"', files['samples.txt.json'])
+
+    def test_sample_profile_thread_pool(self):
+        _, out, _, files = self.check(['--sample-profile', 'samples.txt',
+                                       '--pool', 'thread', '-j', '2'],
+                                      files=OUTPUT_TEST_FILES, ret=1,
+                                      err='')
+        self.assertIn('stack sample', out)
+        self.assertIn('samples.txt', files)
+
     def test_quiet(self):
         self.check(['-q'], files=PASS_TEST_FILES, ret=0, err='', out='')
 
+    def test_report_slowest(self):
+        files = {'fail_test.py': FAIL_TEST_PY,
+                 'pass_test.py': PASS_TEST_PY}
+        _, out, _, _ = self.check(['--report-slowest', '5'], files=files,
+                                  ret=1, err='')
+        self.assertRegexpMatches(
+            out, r'Slowest 2 tests:\n'
+                 r'  +\d+.\d+s (fail_test|pass_test)\..*\n'
+                 r'  +\d+.\d+s (fail_test|pass_test)\..*\n')
+
+    def test_compare_timings(self):
+        baseline = json.dumps({'tests': {'pass_test': {'PassingTest': {
+            'test_pass': {'actual': 'PASS', 'times': [0.0]}}}}})
+        files = {'baseline.json': baseline,
+                 'pass_test.py': PASS_TEST_PY}
+        _, out, _, _ = self.check(['--compare-timings', 'baseline.json'],
+                                  files=files, ret=0, err='')
+        self.assertIn('No tests got slower than the baseline.', out)
+
+        _, out, _, _ = self.check(['--compare-timings', 'baseline.json',
+                                   '--timing-regression-min-delta', '0',
+                                   '--fail-on-timing-regressions', '-q'],
+                                  files=files, ret=1, err='')
+        self.assertIn('1 test got slower than the baseline:\n', out)
+        self.assertIn('(was 0.0000s, +inf%) pass_test.PassingTest.test_pass',
+                      out)
+
+    def test_compare_timings_missing_baseline(self):
+        self.check(['--compare-timings', 'missing.json'],
+                   files=PASS_TEST_FILES, ret=1, out='',
+                   err='Baseline "missing.json" does not exist\n')
+
+    def test_timing_history(self):
+        history = json.dumps({'traceEvents': [
+            {'name': 'pass_test.PassingTest.test_pass', 'ts': 0,
+             'dur': 4000000, 'ph': 'X', 'pid': 1, 'tid': 1,
+             'args': {'actual': 'Pass'}}]})
+        files = {'history.json': history,
+                 'fail_test.py': FAIL_TEST_PY,
+                 'pass_test.py': PASS_TEST_PY}
+        self.check(['-j', '1', '-s', '[%E] ', '--timing-history',
+                    'history.json', '--skip', '*test_fail*'],
+                   files=files, ret=0, err='',
+                   out=('[  4.0] fail_test.FailingTest.test_fail '
+                        'was skipped\n'
+                        '[  0.0] pass_test.PassingTest.test_pass passed\n'
+                        '1 test passed, 1 skipped, 0 failures.\n'))
+
+    def test_timing_history_missing(self):
+        self.check(['--timing-history', 'missing.json'],
+                   files=PASS_TEST_FILES, ret=1, out='',
+                   err='Timing history "missing.json" does not exist\n')
+
+    def test_max_failures(self):
+        files = {'mf_test.py': d("""\
+            import time
+            import unittest
+            class MFTest(unittest.TestCase):
+                def test_a(self):
+                    self.fail()
+                def test_b(self):
+                    self.fail()
+                def test_slow(self):
+                    time.sleep(60)
+            """)}
+        start = time.time()
+        _, out, _, files = self.check(['-j', '3', '--max-failures', '2',
+                                       '--write-trace-to', 'trace.json'],
+                                      files=files, ret=1, err='')
+        # test_slow was terminated, or never started.
+        self.assertLess(time.time() - start, 30)
+        self.assertIn('Stopped after 2 failures.\n', out)
+        self.assertIn('0 tests passed, 0 skipped, 2 failures, 1 not run.\n',
+                      out)
+        trace = json.loads(files['trace.json'])
+        self.assertTrue(trace['otherData']['interrupted'])
+        self.assertNotIn('mf_test.MFTest.test_slow',
+                         [e['name'] for e in trace['traceEvents']])
+
     def test_retry_limit(self):
         _, out, _, _ = self.check(['--retry-limit', '2'],
                                   files=FAIL_TEST_FILES, ret=1, err='')
@@ -527,6 +1104,51 @@ class TestCli(test_case.MainTestCase):
                               if 'test_fail failed unexpectedly:' in l]),
                          3)
 
+    def test_retry_policy_parallel(self):
+        _, out, _, files = self.check(
+            ['-j', '2', '--retry-limit', '1', '--retry-policy', 'parallel',
+             '--isolate', '*test_iso', '--write-full-results-to',
+             'full_results.json', '--write-trace-to', 'trace.json'],
+            files=FLAKY_TEST_FILES, ret=0, err='')
+        self.assertIn('Retrying failed tests (attempt #1 of 1)', out)
+        self.assertIn('3 tests passed, 0 skipped, 0 failures.', out)
+        results = json.loads(files['full_results.json'])
+        for name in ('test_a', 'test_b', 'test_iso'):
+            self.assertEqual(
+                results['tests']['flaky_test']['FlakyTest'][name]['actual'],
+                'FAIL PASS')
+
+        phases = dict((e['name'], e['args']['jobs'])
+                      for e in json.loads(files['trace.json'])['traceEvents']
+                      if 'jobs' in e.get('args', {}))
+        self.assertEqual(phases['retry #1 parallel'], phases['parallel'])
+        self.assertEqual(phases['retry #1 isolated'], 1)
+
+    def test_retry_policy_immediate(self):
+        _, out, _, files = self.check(
+            ['-j', '2', '--retry-limit', '2', '--retry-policy', 'immediate',
+             '--write-full-results-to', 'full_results.json',
+             '--write-trace-to', 'trace.json'],
+            files=FLAKY_TEST_FILES, ret=0, err='')
+        self.assertNotIn('Retrying failed tests', out)
+        self.assertIn('[6/6] ', out)
+        self.assertIn('3 tests passed, 0 skipped, 0 failures.', out)
+        results = json.loads(files['full_results.json'])
+        for name in ('test_a', 'test_b', 'test_iso'):
+            self.assertEqual(
+                results['tests']['flaky_test']['FlakyTest'][name]['actual'],
+                'FAIL PASS')
+
+        events = json.loads(files['trace.json'])['traceEvents']
+        self.assertEqual([e['name'] for e in events
+                          if 'jobs' in e.get('args', {})],
+                         ['parallel'])
+        attempts = [e['args'] for e in events
+                    if e['name'] == 'flaky_test.FlakyTest.test_a']
+        self.assertEqual([(a['actual'], a['flaky'], a.get('attempt'))
+                          for a in attempts],
+                         [('Failure', False, None), ('Pass', True, 2)])
+
     def test_skip(self):
         _, out, _, _ = self.check(['--skip', '*test_fail*'],
                                   files=FAIL_TEST_FILES, ret=0)
@@ -540,8 +1162,10 @@ class TestCli(test_case.MainTestCase):
                         '1 test passed, 1 skipped, 0 failures.\n'), err='')
 
         # This tests that we print test_started updates for skipped tests
-        # properly. It also tests how overwriting works.
-        _, out, _, _ = self.check(['-j', '1', '--overwrite', '--skip',
+        # properly. It also tests how overwriting works (with redraws
+        # unthrottled, so that every update shows up).
+        _, out, _, _ = self.check(['-j', '1', '--overwrite',
+                                   '--redraw-interval', '0', '--skip',
                                    '*test_fail*'], files=files, ret=0,
                                   err='', universal_newlines=False)
 
@@ -752,6 +1376,27 @@ class TestCli(test_case.MainTestCase):
                          2 tests passed, 0 skipped, 0 failures.
                          """), err='')
 
+    def test_track_resources(self):
+        _, out, _, files = self.check(['--track-allocations', '-t',
+                                       '--write-full-results-to',
+                                       'full_results.json',
+                                       '--write-trace-to', 'trace.json'],
+                                      files=PASS_TEST_FILES, ret=0, err='')
+        self.assertRegexpMatches(out, r'test_pass passed \d+.\d+s '
+                                      r'\(\d+.\d+s cpu\)\n')
+        results = json.loads(files['full_results.json'])
+        resources = results['tests']['pass_test']['PassingTest'][
+            'test_pass']['resources']
+        self.assertEqual(len(resources), 1)
+        self.assertEqual(sorted(resources[0].keys()),
+                         ['alloc_peak', 'involuntary_switches',
+                          'max_rss_growth_kb', 'max_rss_kb', 'system_time',
+                          'user_time', 'voluntary_switches'])
+        self.assertGreater(resources[0]['max_rss_kb'], 0)
+        trace = json.loads(files['trace.json'])
+        self.assertEqual(trace['traceEvents'][0]['args']['resources'],
+                         resources[0])
+
     def test_version(self):
         self.check('--version', ret=0, out=(VERSION + '\n'))
 
@@ -786,13 +1431,35 @@ class TestCli(test_case.MainTestCase):
         self.assertIn('trace.json', files)
         trace_obj = json.loads(files['trace.json'])
         self.assertEqual(trace_obj['otherData'], {})
-        self.assertEqual(len(trace_obj['traceEvents']), 5)
+        self.assertEqual(len(trace_obj['traceEvents']), 6)
         event = trace_obj['traceEvents'][0]
         self.assertEqual(event['name'], 'pass_test.PassingTest.test_pass')
         self.assertEqual(event['ph'], 'X')
         self.assertEqual(event['tid'], 1)
         self.assertEqual(event['args']['expected'], ['Pass'])
         self.assertEqual(event['args']['actual'], 'Pass')
+        event = trace_obj['traceEvents'][5]
+        self.assertEqual(event['name'], 'parallel')
+        self.assertEqual(event['args']['jobs'], 1)
+
+    def test_analyze(self):
+        files = {'trace.json': json.dumps({'traceEvents': [
+            {'name': 'run', 'ts': 0, 'dur': 2000000, 'ph': 'X', 'pid': 1,
+             'tid': 0},
+            {'name': 'parallel', 'ts': 0, 'dur': 1000000, 'ph': 'X',
+             'pid': 1, 'tid': 0, 'args': {'jobs': 1}},
+            {'name': 'pass_test.PassingTest.test_pass', 'ts': 0,
+             'dur': 1000000, 'ph': 'X', 'pid': 1, 'tid': 1,
+             'args': {'actual': 'Pass'}}]})}
+        _, out, _, _ = self.check(['analyze', 'trace.json'], files=files,
+                                  ret=0, err='')
+        self.assertIn('Wall time: 2.000s', out)
+        self.assertIn('parallel (1 job)', out)
+
+    def test_analyze_rejects_runner_flags(self):
+        self.check(['analyze', 'trace.json', '--retry-limit', '3'],
+                   ret=2, out='',
+                   rerr='.*unrecognized arguments: --retry-limit 3.*')
 
 
 class TestMain(TestCli):
@@ -810,8 +1477,11 @@ class TestMain(TestCli):
         orig_sys_path = sys.path[:]
         orig_sys_modules = list(sys.modules.keys())
 
+        if argv[:1] != ['analyze']:
+            # 'typ analyze' doesn't run any tests, so it takes no -j.
+            argv = argv + ['-j', '1']
         try:
-            ret = main(argv + ['-j', '1'], host)
+            ret = main(argv, host)
         finally:
             out, err = host.restore_output()
             modules_to_unload = []
@@ -12,7 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
 import sys
+import time
 import unittest
 
 from typ import test_case
@@ -34,6 +36,11 @@ def _echo(context, msg):
     return '%s/%s/%s' % (context['pre'], context['post'], msg)
 
 
+def _sleep(context, msg):  # pylint: disable=W0613
+    time.sleep(msg)
+    return msg
+
+
 def _error(context, msg):  # pylint: disable=W0613
     raise Exception('_error() raised Exception')
 
@@ -42,16 +49,21 @@ def _interrupt(context, msg):  # pylint: disable=W0613
     raise KeyboardInterrupt()
 
 
+def _exit(context, msg):  # pylint: disable=W0613
+    os._exit(1)
+
+
 def _stub(*args):  # pylint: disable=W0613
     return None
 
 
 class TestPool(test_case.TestCase):
 
-    def run_basic_test(self, jobs):
+    def run_basic_test(self, jobs, pool_type='queue'):
         host = Host()
         context = {'pre': False, 'post': False}
-        pool = make_pool(host, jobs, _echo, context, _pre, _post)
+        pool = make_pool(host, jobs, _echo, context, _pre, _post,
+                         pool_type=pool_type)
         pool.send('hello')
         pool.send('world')
         msg1 = pool.get()
@@ -84,12 +96,191 @@ class TestPool(test_case.TestCase):
         pool = make_pool(host, 1, _echo, None, _stub, _stub)
         pool.join()
 
+    def test_async_tracks_running(self):
+        host = Host()
+        pool = make_pool(host, 1, _sleep, None, _stub, _stub)
+        self.assertEqual(pool.running, {})
+        pool.send(0.001)
+        pool.send(0.002)
+        self.assertEqual(list(pool.running), [1])
+        self.assertEqual(pool.running[1][0], 0.001)
+        self.assertEqual(pool.get(), 0.001)
+        self.assertEqual(pool.running[1][0], 0.002)
+        self.assertEqual(pool.get(), 0.002)
+        self.assertEqual(pool.running, {})
+        pool.close()
+        pool.join()
+
     def test_basic_one_job(self):
         self.run_basic_test(1)
 
     def test_basic_two_jobs(self):
         self.run_basic_test(2)
 
+    def test_basic_two_jobs_pipe(self):
+        self.run_basic_test(2, 'pipe')
+
+    def test_basic_two_jobs_thread(self):
+        self.run_basic_test(2, 'thread')
+
+    def test_thread_get_times_out(self):
+        host = Host()
+        pool = make_pool(host, 2, _sleep, None, _stub, _stub,
+                         report_starts=True, pool_type='thread')
+        try:
+            pool.send(0.5)
+            self.assertIsNone(pool.get(timeout=0.01))
+            self.assertEqual([msg for msg, _ in pool.running.values()],
+                             [0.5])
+            self.assertEqual(pool.get(timeout=60), 0.5)
+        finally:
+            pool.close()
+            pool.join()
+
+    def test_thread_no_close(self):
+        host = Host()
+        pool = make_pool(host, 2, _echo, None, _stub, _stub,
+                         pool_type='thread')
+        self.assertEqual(pool.join(), [])
+
+    def test_pipe_get_times_out(self):
+        host = Host()
+        context = {'pre': False, 'post': False}
+        pool = make_pool(host, 2, _echo, context, _pre, _post,
+                         pool_type='pipe')
+        try:
+            self.assertIsNone(pool.get(timeout=0.01))
+            pool.send('hello')
+            self.assertEqual(pool.get(timeout=60), 'True/False/hello')
+        finally:
+            pool.close()
+            pool.join()
+
+    def test_pipe_tracks_running(self):
+        host = Host()
+        pool = make_pool(host, 2, _sleep, None, _stub, _stub,
+                         pool_type='pipe')
+        try:
+            for msg in (0.5, 0.01, 0.01):
+                pool.send(msg)
+            self.assertEqual(sorted(pool.running), [1, 2])
+            self.assertEqual(pool.pending, [0.01])
+            self.assertEqual(pool.get(timeout=60), 0.01)
+            self.assertEqual(pool.pending, [])
+            self.assertEqual(sorted(m for m, _ in pool.running.values()),
+                             [0.01, 0.5])
+            self.assertEqual(pool.get(timeout=60), 0.01)
+            self.assertEqual(pool.get(timeout=60), 0.5)
+            self.assertEqual(pool.running, {})
+        finally:
+            pool.close()
+            pool.join()
+
+    def test_pipe_join_discards_messages(self):
+        host = Host()
+        context = {'pre': False, 'post': False}
+        pool = make_pool(host, 2, _echo, context, _pre, _post,
+                         pool_type='pipe')
+        pool.send('hello')
+        pool.close()
+        pool.join()
+        self.assertEqual(pool.discarded_responses, ['True/False/hello'])
+
+    def test_pipe_get_raises_error(self):
+        host = Host()
+        pool = make_pool(host, 2, _error, None, _stub, _stub,
+                         pool_type='pipe')
+        pool.send('hello')
+        try:
+            pool.get()
+            self.fail('pool.get() did not raise')  # pragma: untested
+        except Exception as e:
+            self.assertIn('_error() raised Exception', str(e))
+            self.assertTrue(pool.erred)
+        finally:
+            pool.join()
+
+    def test_pipe_worker_exits(self):
+        host = Host()
+        pool = make_pool(host, 2, _exit, None, _stub, _stub,
+                         pool_type='pipe')
+        pool.send('hello')
+        try:
+            pool.get()
+            self.fail('pool.get() did not raise')  # pragma: untested
+        except Exception as e:
+            self.assertIn('Worker 1 exited unexpectedly', str(e))
+        finally:
+            pool.join()
+
+    def test_pipe_no_close(self):
+        host = Host()
+        pool = make_pool(host, 2, _echo, None, _stub, _stub,
+                         pool_type='pipe')
+        self.assertEqual(pool.join(), [])
+
+    def run_recycling_test(self, pool_type, max_messages=0, max_rss=0):
+        host = Host()
+        context = {'pre': False, 'post': False}
+        pool = make_pool(host, 2, _echo, context, _pre, _post,
+                         pool_type=pool_type, max_messages=max_messages,
+                         max_rss=max_rss)
+        for i in range(5):
+            pool.send(i)
+        responses = [pool.get(timeout=60) for _ in range(5)]
+        pool.close()
+        final_contexts = pool.join()
+        self.assertEqual(sorted(responses),
+                         ['True/False/%d' % i for i in range(5)])
+        # Each worker's slot ends with one worker that is either done or
+        # retiring, and every other worker retired along the way.
+        self.assertGreaterEqual(len(pool.retired_responses), 3)
+        self.assertIn(len(final_contexts), range(5, 8))
+        self.assertEqual(final_contexts,
+                         [{'pre': True, 'post': True}] * len(final_contexts))
+
+    def test_max_messages(self):
+        self.run_recycling_test('queue', max_messages=1)
+
+    def test_max_messages_pipe(self):
+        self.run_recycling_test('pipe', max_messages=1)
+
+    def test_max_rss(self):
+        self.run_recycling_test('queue', max_rss=1)
+
+    def test_max_rss_pipe(self):
+        self.run_recycling_test('pipe', max_rss=1)
+
+    def test_get_times_out(self):
+        host = Host()
+        context = {'pre': False, 'post': False}
+        pool = make_pool(host, 2, _echo, context, _pre, _post)
+        try:
+            self.assertIsNone(pool.get(timeout=0.01))
+            pool.send('hello')
+            self.assertEqual(pool.get(timeout=60), 'True/False/hello')
+        finally:
+            pool.close()
+            pool.join()
+
+    def test_report_starts(self):
+        host = Host()
+        pool = make_pool(host, 2, _sleep, None, _stub, _stub,
+                         report_starts=True)
+        try:
+            pool.send(1.0)
+            self.assertIsNone(pool.get(timeout=0.5))
+            self.assertEqual(len(pool.running), 1)
+            worker_num, (msg, started) = list(pool.running.items())[0]
+            self.assertIn(worker_num, (1, 2))
+            self.assertEqual(msg, 1.0)
+            self.assertLessEqual(started, time.time())
+            self.assertEqual(pool.get(timeout=60), 1.0)
+            self.assertEqual(pool.running, {})
+        finally:
+            pool.close()
+            pool.join()
+
     def test_join_discards_messages(self):
         host = Host()
         context = {'pre': False, 'post': False}
@@ -59,3 +59,43 @@ class TestPrinter(unittest.TestCase):
                           '\n',
                           'baz',
                           '\n'])
+
+    def test_throttled_updates_show_latest(self):
+        now = [0.0]
+        pr = Printer(self.print_, True, 80, min_interval=0.05,
+                     time_fn=lambda: now[0])
+        pr.update('foo')
+        pr.update('bar')
+        pr.update('baz')
+        self.assertEqual(self.out, ['foo'])
+        self.assertAlmostEqual(pr.pending_delay(), 0.05)
+
+        now[0] = 0.06
+        self.assertEqual(pr.pending_delay(), 0)
+        pr.refresh()
+        self.assertEqual(self.out, ['foo', '\r   \r', 'baz'])
+        self.assertIsNone(pr.pending_delay())
+
+        pr.update('quux')
+        pr.flush()
+        self.assertEqual(self.out, ['foo', '\r   \r', 'baz',
+                                    '\r   \r', 'quux', '\n'])
+
+    def test_unelided_updates_are_not_throttled(self):
+        pr = Printer(self.print_, True, 80, min_interval=0.05,
+                     time_fn=lambda: 0)
+        pr.update('foo')
+        pr.update('bar')
+        pr.update('failed', elide=False)
+        pr.update('verbose', elide=False)
+        pr.flush()
+        self.assertEqual(self.out, ['foo', '\r   \r', 'failed',
+                                    '\r      \r', 'verbose', '\n'])
+
+    def test_not_throttled_when_not_overwriting(self):
+        pr = Printer(self.print_, False, 80, min_interval=0.05,
+                     time_fn=lambda: 0)
+        pr.update('foo')
+        pr.update('bar')
+        pr.flush()
+        self.assertEqual(self.out, ['foo', '\n', 'bar', '\n'])
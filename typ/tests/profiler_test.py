@@ -0,0 +1,132 @@
+# Copyright 2014 Dirk Pranke. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import cProfile
+import json
+import marshal
+import pickle
+import time
+import unittest
+
+from typ import profiler
+from typ.fakes.host_fake import FakeHost
+
+
+def _busy(n):
+    return sum(range(n))
+
+
+def _raw_stats(n):
+    prof = cProfile.Profile()
+    prof.enable()
+    for _ in range(n):
+        _busy(10)
+    prof.disable()
+    prof.create_stats()
+    # Workers send their stats back through a pickle.
+    return pickle.loads(pickle.dumps(prof.stats))
+
+
+def _busy_calls(stats):
+    for key, value in stats.stats.items():
+        if key[2] == '_busy':
+            return value[1]
+    return 0
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_merge(self):
+        stats = profiler.merge_stats([_raw_stats(2), {}, _raw_stats(3)])
+        self.assertEqual(_busy_calls(stats), 5)
+
+    def test_merge_nothing(self):
+        self.assertEqual(profiler.merge_stats([{}, None]), None)
+
+    def test_dump_and_format(self):
+        host = FakeHost()
+        stats = profiler.merge_stats([_raw_stats(1)])
+        profiler.dump_stats(host, '/tmp/out.pstats', stats)
+        self.assertEqual(marshal.loads(host.files['/tmp/out.pstats']),
+                         stats.stats)
+        self.assertIn('_busy', profiler.format_stats(stats, 5))
+
+
+def _spin(sampler, seconds):
+    start = time.process_time()
+    while not sampler.samples and time.process_time() - start < seconds:
+        _busy(1000)
+
+
+@unittest.skipIf(not profiler.can_sample(), 'no SIGPROF on this platform')
+class TestSampler(unittest.TestCase):
+
+    def test_samples_running_tests(self):
+        sampler = profiler.Sampler(0.001)
+        sampler.start()
+        try:
+            sampler.test_started('fake.test')
+            _spin(sampler, 5)
+            sampler.test_finished()
+        finally:
+            sampler.stop()
+        self.assertTrue(sampler.samples)
+        stack = list(sampler.samples)[0]
+        self.assertTrue(stack.startswith('fake.test;'))
+        self.assertIn('_spin (', stack)
+        self.assertNotIn('_sample (', stack)
+
+    def test_stop_at(self):
+        sampler = profiler.Sampler(0.001, stop_at=_spin.__code__)
+        sampler.start()
+        try:
+            sampler.test_started('fake.test')
+            _spin(sampler, 5)
+            sampler.test_finished()
+        finally:
+            sampler.stop()
+        for stack in sampler.samples:
+            self.assertNotIn('_spin (', stack)
+            self.assertTrue(stack.startswith('fake.test'))
+
+
+class TestSamples(unittest.TestCase):
+
+    samples = {'t.a;main (a.py:1);helper (h.py:1)': 3,
+               't.b;main (b.py:1);helper (h.py:1)': 1,
+               't.b;main (b.py:1)': 2}
+
+    def test_merge(self):
+        self.assertEqual(profiler.merge_samples([{'a': 1}, None, {'a': 2,
+                                                                  'b': 1}]),
+                         {'a': 3, 'b': 1})
+
+    def test_format_collapsed(self):
+        self.assertEqual(profiler.format_collapsed(self.samples),
+                         't.a;main (a.py:1);helper (h.py:1) 3\n'
+                         't.b;main (b.py:1) 2\n'
+                         't.b;main (b.py:1);helper (h.py:1) 1\n')
+
+    def test_flamegraph_json(self):
+        root = json.loads(profiler.flamegraph_json(self.samples))
+        self.assertEqual(root['value'], 6)
+        self.assertEqual([(c['name'], c['value']) for c in root['children']],
+                         [('t.a', 3), ('t.b', 3)])
+        t_b = root['children'][1]
+        self.assertEqual(t_b['children'][0]['children'][0]['name'],
+                         'helper (h.py:1)')
+
+    def test_hottest_frames(self):
+        self.assertEqual(profiler.hottest_frames(self.samples, 2),
+                         [('helper (h.py:1)', 4), ('main (a.py:1)', 3)])
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
 import sys
 import tempfile
 import unittest
@@ -21,6 +22,7 @@ from textwrap import dedent as d
 
 from typ import Host, Runner, TestCase, TestSet, TestInput
 from typ import WinMultiprocessing
+from typ.dashboard import ERASE_LINE
 
 
 def _setup_process(child, context):  # pylint: disable=W0613
@@ -34,6 +36,11 @@ def _teardown_throws(child, context):  # pylint: disable=W0613
     raise Exception("exception in teardown")
 
 
+class _Terminal(io.StringIO):
+    def isatty(self):
+        return True
+
+
 class RunnerTests(TestCase):
     def test_context(self):
         r = Runner()
@@ -44,6 +51,8 @@ class RunnerTests(TestCase):
         r.win_multiprocessing = WinMultiprocessing.importable
         ret, _, _ = r.run()
         self.assertEqual(ret, 0)
+        self.assertEqual([len(resp) for resp in r.final_responses], [3])
+        self.assertEqual(len(r.worker_artifacts), 1)
 
     @unittest.skipIf(sys.version_info.major == 3, 'fails under python3')
     def test_exception_in_teardown(self):
@@ -58,6 +67,40 @@ class RunnerTests(TestCase):
         self.assertEqual(r.final_responses[0][2].message,
                          'exception in teardown')
 
+    @unittest.skipIf(sys.version_info.major == 2, 'needs tracemalloc')
+    def test_track_allocations_keeps_existing_tracing(self):
+        import tracemalloc  # pylint: disable=import-error
+        was_tracing = tracemalloc.is_tracing()
+        tracemalloc.start()
+        try:
+            r = Runner()
+            r.args.tests = ['typ.tests.runner_test.ContextTests']
+            r.args.jobs = 1
+            r.args.track_allocations = True
+            r.args.track_resources = True
+            ret, _, _ = r.run()
+            self.assertEqual(ret, 0)
+            self.assertTrue(tracemalloc.is_tracing())
+        finally:
+            if not was_tracing:
+                tracemalloc.stop()
+
+    def test_dashboard_needs_a_terminal(self):
+        test = 'typ.tests.pool_test.TestPool.test_async_close'
+        h = Host()
+        h.stdout = _Terminal()
+        ret = Runner(h).main(['--dashboard', '-j', '1', test])
+        self.assertEqual(ret, 0)
+        out = h.stdout.getvalue()
+        self.assertIn('0/1 tests finished, 1 running', out)
+        self.assertIn('  worker 1:     0.0s ' + test, out)
+        self.assertIn(ERASE_LINE + '1 test passed', out)
+
+        h.stdout = io.StringIO()
+        ret = Runner(h).main(['--dashboard', '-j', '1', test])
+        self.assertEqual(ret, 0)
+        self.assertNotIn('tests finished', h.stdout.getvalue())
+
     def test_bad_default(self):
         r = Runner()
         ret = r.main([], foo='bar')
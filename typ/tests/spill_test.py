@@ -0,0 +1,64 @@
+# Copyright 2014 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pickle
+import unittest
+
+from typ import spill
+from typ.host import Host
+from typ.json_results import Result, ResultType
+
+
+class TestSpill(unittest.TestCase):
+
+    def setUp(self):
+        self.host = Host()
+        self.dirname = spill.make_spill_dir(self.host)
+        self.spiller = spill.Spiller(self.dirname, 1, 10)
+
+    def tearDown(self):
+        self.spiller.close()
+        self.host.rmtree(self.dirname)
+
+    def test_short_text_is_kept(self):
+        self.assertEqual(self.spiller.spill(u'short'), u'short')
+        self.assertFalse(self.host.exists(self.spiller.path))
+
+    def test_long_text_is_spilled(self):
+        first = self.spiller.spill(u'a' * 20)
+        second = self.spiller.spill(u'bé' * 10)
+        self.assertIsInstance(first, spill.SpilledText)
+        self.assertEqual(second.offset, 20)
+        self.assertEqual(second.read(), u'bé' * 10)
+        self.assertEqual(first.read(), u'a' * 20)
+
+    def test_new_spiller_keeps_earlier_text(self):
+        first = self.spiller.spill(u'a' * 20)
+        self.spiller.close()
+        # E.g., a worker that replaces one that retired.
+        self.spiller = spill.Spiller(self.dirname, 1, 10)
+        second = self.spiller.spill(u'b' * 15)
+        self.assertEqual(second.offset, 20)
+        self.assertEqual(first.read(), u'a' * 20)
+        self.assertEqual(second.read(), u'b' * 15)
+
+    def test_result_reads_lazily(self):
+        result = Result('t', ResultType.Failure, 0, 0, 1,
+                        out=self.spiller.spill(u'o' * 20),
+                        err=self.spiller.spill(u'e' * 20))
+        result = pickle.loads(pickle.dumps(result))
+        self.assertIsInstance(result._out, spill.SpilledText)
+        self.assertEqual(result.out, u'o' * 20)
+        self.assertEqual(result.err, u'e' * 20)
+        self.assertEqual(result._out, u'o' * 20)
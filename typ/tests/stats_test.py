@@ -72,3 +72,77 @@ class TestStats(unittest.TestCase):
         s = Stats('%u', lambda: 0, 32)
         s.total = 2
         self.assertEqual(s.format(), '2')
+
+    def test_eta(self):
+        times = [0, 0, 4]
+        s = Stats('[%E]', lambda: times.pop(0), 32)
+        s.total = 5
+        self.assertEqual(s.format(), '[-]')
+        s.finished = 1
+        self.assertEqual(s.format(), '[ 16.0]')
+
+    def test_p95(self):
+        s = Stats('[%P]', lambda: 0, 32)
+        self.assertEqual(s.format(), '[-]')
+        for took in range(100, 0, -1):
+            s.add_time(took / 100.0)
+        self.assertEqual(s.format(), '[0.950]')
+        s.add_time()
+        self.assertEqual(s.format(), '[0.950]')
+
+    def test_utilization(self):
+        s = Stats('[%w]', lambda: 0, 4)
+        self.assertEqual(s.format(), '[  0.0]')
+        s.started = 4
+        s.finished = 1
+        self.assertEqual(s.format(), '[ 75.0]')
+
+        # e.g., the isolated tests run one at a time.
+        s.jobs = 1
+        s.finished = 3
+        self.assertEqual(s.format(), '[100.0]')
+
+        # e.g., a worker running a batch of three tests.
+        s.started = 6
+        s.busy = 1
+        self.assertEqual(s.format(), '[100.0]')
+
+    def test_set_fmt(self):
+        s = Stats('%f', lambda: 0, 32)
+        s.finished = 2
+        s.fmt = '[%f%%]'
+        self.assertEqual(s.fmt, '[%f%%]')
+        self.assertEqual(s.format(), '[2%]')
+
+    def test_trailing_percent(self):
+        s = Stats('%t%', lambda: 0, 32)
+        self.assertEqual(s.format(), '0%')
+
+    def test_eta_from_estimates(self):
+        s = Stats('[%E]', lambda: 0, 2)
+        s.total = 4
+        s.set_estimates({'a': 2.0, 'b': 4.0, 'c': 3.0},
+                        ['a', 'b', 'd'], ['c'])
+        # 'd' is unknown, so it is assumed to take the average, 3.0s;
+        # (2 + 4 + 3) / 2 jobs + 3 isolated.
+        self.assertEqual(s.format(), '[  7.5]')
+
+        # 'a' took twice as long as predicted, so everything is expected
+        # to.
+        s.add_time(4.0, 'a')
+        self.assertEqual(s.format(), '[ 13.0]')
+
+        s.jobs = 1
+        s.add_time(2.0, 'b')
+        s.add_time(3.0, 'd')
+        self.assertEqual(s.format(), '[  3.0]')
+        s.add_time(3.0, 'c')
+        self.assertEqual(s.format(), '[  0.0]')
+
+    def test_eta_without_known_estimates(self):
+        times = [0, 4]
+        s = Stats('[%E]', lambda: times.pop(0), 32)
+        s.set_estimates({'x': 1.0}, ['a'], [])
+        s.total = 5
+        s.finished = 1
+        self.assertEqual(s.format(), '[ 16.0]')
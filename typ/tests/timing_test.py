@@ -0,0 +1,68 @@
+# Copyright 2014 Dirk Pranke. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from typ import timing
+
+
+class TestTiming(unittest.TestCase):
+
+    def test_merge_times(self):
+        self.assertEqual(timing.merge_times([{'a': [1.0]},
+                                             {'a': [2.0], 'b': [3.0]}]),
+                         {'a': [1.0, 2.0], 'b': [3.0]})
+
+    def test_times_from_json(self):
+        full_results = {'tests': {'a': {'actual': 'PASS', 'times': [1.5]}}}
+        self.assertEqual(timing.times_from_json(full_results), {'a': [1.5]})
+
+        trace = {'traceEvents': [
+            {'name': 'parallel', 'ts': 0, 'dur': 3000000,
+             'args': {'jobs': 2}},
+            {'name': 'a', 'ts': 0, 'dur': 1500000, 'args': {'actual': 'Pass'}},
+            {'name': 'a', 'ts': 0, 'dur': 500000, 'args': {'actual': 'Pass'}}]}
+        self.assertEqual(timing.times_from_json(trace), {'a': [1.5, 0.5]})
+
+    def test_expected_times(self):
+        self.assertEqual(timing.expected_times({'a': [1.0, 3.0, 2.0],
+                                                'b': []}),
+                         {'a': 2.0})
+
+    def test_slowest(self):
+        times = {'a': [1.0], 'b': [5.0, 0.5], 'c': [2.0], 'd': []}
+        self.assertEqual(timing.slowest(times, 2), [('c', 2.0), ('a', 1.0)])
+
+    def test_threshold(self):
+        baseline = {'a': [1.0], 'b': [1.0], 'new': []}
+        times = {'a': [1.4], 'b': [1.6], 'new': [9.0], 'gone': [9.0]}
+        regressions = timing.find_regressions(baseline, times, 50, 0.1)
+        self.assertEqual([r.name for r in regressions], ['b'])
+        self.assertEqual(regressions[0].baseline, 1.0)
+        self.assertAlmostEqual(regressions[0].percent, 60.0)
+
+    def test_min_delta(self):
+        baseline = {'a': [0.001]}
+        self.assertEqual(timing.find_regressions(baseline, {'a': [0.01]},
+                                                 50, 0.1), [])
+        self.assertEqual(len(timing.find_regressions(baseline, {'a': [0.2]},
+                                                     50, 0.1)), 1)
+
+    def test_noise_band(self):
+        # The baseline is noisy enough that doubling is within the band.
+        baseline = {'a': [1.0, 1.5, 2.0, 0.5, 1.0]}
+        self.assertEqual(timing.find_regressions(baseline, {'a': [2.5]},
+                                                 50, 0.1), [])
+        self.assertEqual(len(timing.find_regressions(baseline, {'a': [3.5]},
+                                                     50, 0.1)), 1)
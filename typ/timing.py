@@ -0,0 +1,103 @@
+# Copyright 2014 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+
+from typ import json_results
+
+
+class TimingRegression(object):
+
+    def __init__(self, name, took, baseline, samples):
+        self.name = name
+        self.took = took
+        self.baseline = baseline
+        self.samples = samples
+
+    @property
+    def percent(self):
+        if not self.baseline:
+            return float('inf')
+        return (self.took - self.baseline) * 100.0 / self.baseline
+
+
+def merge_times(all_times):
+    """Pools the {test name: [times]} dicts from several runs."""
+    merged = OrderedDict()
+    for times in all_times:
+        for name, durations in times.items():
+            merged.setdefault(name, []).extend(durations)
+    return merged
+
+
+def times_from_json(obj):
+    """Returns {test name: [times]} from full results or a trace."""
+    if 'traceEvents' not in obj:
+        return json_results.times_by_test(obj)
+    times = OrderedDict()
+    for event in obj['traceEvents']:
+        if 'actual' in event.get('args', {}):
+            times.setdefault(event['name'], []).append(
+                event['dur'] / 1000000.0)
+    return times
+
+
+def expected_times(times):
+    """Returns {test name: the median of its times}."""
+    return dict((name, _median(ts)) for name, ts in times.items() if ts)
+
+
+def slowest(times, n):
+    """Returns the |n| slowest (name, seconds) pairs, slowest first.
+
+    A test that ran more than once is ranked by its fastest attempt, so
+    that retries of a test that hung once don't dominate the list."""
+    durations = [(name, min(ts)) for name, ts in times.items() if ts]
+    return sorted(durations, key=lambda item: (-item[1], item[0]))[:n]
+
+
+def find_regressions(baseline_times, times, threshold, min_delta,
+                     noise_sigmas=3.0):
+    """Returns the tests that got slower than |baseline_times| predicts.
+
+    A test regressed if its (fastest) time in |times| is more than
+    |threshold| percent above the median of its baseline samples, more
+    than |min_delta| seconds above it, and, when there are enough
+    samples to tell, outside the baseline's noise band (the median plus
+    |noise_sigmas| robust standard deviations)."""
+    regressions = []
+    for name, ts in times.items():
+        samples = baseline_times.get(name)
+        if not ts or not samples:
+            continue
+        took = min(ts)
+        baseline = _median(samples)
+        limit = max(baseline * (1 + threshold / 100.0), baseline + min_delta)
+        if len(samples) > 2:
+            # 1.4826 scales the median absolute deviation to a standard
+            # deviation for normally distributed samples.
+            sigma = 1.4826 * _median([abs(s - baseline) for s in samples])
+            limit = max(limit, baseline + noise_sigmas * sigma)
+        if took > limit:
+            regressions.append(TimingRegression(name, took, baseline,
+                                                len(samples)))
+    return sorted(regressions, key=lambda r: (-r.percent, r.name))
+
+
+def _median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2:
+        return values[mid]
+    return (values[mid - 1] + values[mid]) / 2.0